@@ -1,13 +1,31 @@
 from typing import Any
 import asyncio
-from datetime import datetime, timedelta
+import contextlib
+import time
+from datetime import date, datetime, timedelta, timezone, tzinfo
 import email
+import email.utils
+import base64
+import collections
+import binascii
+import codecs
+import hashlib
+import mmap
+import quopri
+import urllib.parse
 import imaplib
+import re
 import smtplib
 import logging
+import sqlite3
+import threading
+import zlib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+import secrets
+import string
+import ssl
 import sys
 from dotenv import load_dotenv
 from mcp.server.models import InitializationOptions
@@ -16,6 +34,7 @@ from mcp.server import NotificationOptions, Server
 import mcp.server.stdio
 import json
 import io
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 # Set up UTF-8 for stdout and stderr before any other imports or code
 try:
@@ -117,9 +136,67 @@ EMAIL_CONFIG = {
     "smtp_port": int(os.getenv("SMTP_PORT", "587"))
 }
 
+# Optional JSON file defining several accounts; when set, EMAIL_CONFIG is not used
+EMAIL_ACCOUNTS_FILE = os.path.expanduser(os.getenv("EMAIL_ACCOUNTS_FILE", ""))
+
 # Constants
 SEARCH_TIMEOUT = 60  # seconds
 MAX_EMAILS = 100
+MIN_BODY_CHUNK_BYTES = 256  # smallest max_bytes accepted by get-email-content
+SEARCH_PAGE_SIZE = 20  # default number of results per search-emails page
+SEARCH_SORT_ORDER = "(REVERSE DATE)"  # SORT criteria for newest-first pages on servers with SORT
+SEARCH_CURSOR_TTL = int(os.getenv("SEARCH_CURSOR_TTL", "600"))  # seconds a search result set is kept for paging
+EMAIL_TIMEZONE = os.getenv("EMAIL_TIMEZONE", "")  # IANA name for daily counts; empty means the system timezone
+CLOSED_DAY_COUNT_TTL = int(os.getenv("CLOSED_DAY_COUNT_TTL", "3600"))  # seconds a count for a day that has ended is reused
+FOLDER_CACHE_TTL = int(os.getenv("FOLDER_CACHE_TTL", "3600"))  # seconds folder lists and Sent/Drafts/Trash lookups are cached
+
+# IMAP connection pool settings
+IMAP_POOL_SIZE = int(os.getenv("IMAP_POOL_SIZE", "4"))
+IMAP_KEEPALIVE_INTERVAL = int(os.getenv("IMAP_KEEPALIVE_INTERVAL", "240"))  # seconds of idleness before a NOOP
+IMAP_CONNECT_TIMEOUT = int(os.getenv("IMAP_CONNECT_TIMEOUT", "30"))  # seconds
+IMAP_SSL_PORT = 993
+# Compress IMAP traffic with COMPRESS=DEFLATE when the server offers it (RFC 4978)
+IMAP_COMPRESS = os.getenv("IMAP_COMPRESS", "true").lower() in ("1", "true", "yes")
+
+# SMTP connection pool settings
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_IDLE_TIMEOUT = int(os.getenv("SMTP_IDLE_TIMEOUT", "60"))  # seconds an unused connection is kept open
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+SMTP_CONNECT_TIMEOUT = int(os.getenv("SMTP_CONNECT_TIMEOUT", "30"))  # seconds
+SMTP_BATCH_MAX_MESSAGES = 500  # messages accepted by one send-emails-batch call
+SMTP_BATCH_MAX_RETRIES = 2  # retries of a message after a temporary SMTP failure
+SMTP_BATCH_RATE_LIMIT = float(os.getenv("SMTP_BATCH_RATE_LIMIT", "0"))  # default messages per second for batches; 0 means unlimited
+SMTP_DEBUG = os.getenv("SMTP_DEBUG", "false").lower() in ("1", "true", "yes")  # print the SMTP transcript to stderr
+
+# Local caches and the metadata index
+CACHE_DIR = os.path.expanduser(os.getenv("EMAIL_CACHE_DIR", os.path.join("~", ".cache", "email_client")))
+METADATA_INDEX_ENABLED = os.getenv("METADATA_INDEX", "false").lower() in ("1", "true", "yes")
+METADATA_SYNC_FOLDERS = [f.strip() for f in os.getenv("METADATA_SYNC_FOLDERS", "INBOX").split(",") if f.strip()]
+METADATA_SYNC_INTERVAL = int(os.getenv("METADATA_SYNC_INTERVAL", "300"))  # seconds between syncs
+METADATA_MAX_AGE = int(os.getenv("METADATA_MAX_AGE", str(2 * METADATA_SYNC_INTERVAL)))  # seconds before local data is considered stale
+METADATA_SYNC_BATCH_SIZE = 500
+METADATA_FETCH_ITEMS = "(UID FLAGS INTERNALDATE RFC822.SIZE BODY.PEEK[HEADER.FIELDS (FROM TO SUBJECT DATE MESSAGE-ID IN-REPLY-TO REFERENCES)])"
+
+# Copies of sent emails are spooled in each account's outbox and appended to the Sent folder in the background
+SENT_APPEND_MAX_ATTEMPTS = int(os.getenv("SENT_APPEND_MAX_ATTEMPTS", "10"))
+SENT_APPEND_RETRY_INTERVAL = 30  # seconds before the first retry, doubled after each failure
+SENT_APPEND_MAX_BACKOFF = 3600  # seconds
+SENT_APPEND_VERIFY = os.getenv("SENT_APPEND_VERIFY", "false").lower() in ("1", "true", "yes")  # search the Sent folder for each saved copy
+
+# Attachments are streamed to disk in chunks of this many encoded bytes
+ATTACHMENT_CHUNK_SIZE = 1024 * 1024
+
+# On-disk cache of fetched message structures and body parts (opt-in)
+MESSAGE_CACHE_ENABLED = os.getenv("MESSAGE_CACHE", "false").lower() in ("1", "true", "yes")
+MESSAGE_CACHE_MAX_BYTES = int(os.getenv("MESSAGE_CACHE_MAX_MB", "200")) * 1024 * 1024
+
+# Local full-text index over bodies read with get-email-content (opt-in)
+FULLTEXT_INDEX_ENABLED = os.getenv("FULLTEXT_INDEX", "false").lower() in ("1", "true", "yes")
+
+# IMAP IDLE push notifications (disabled unless folders are configured)
+IMAP_IDLE_FOLDERS = [f.strip() for f in os.getenv("IMAP_IDLE_FOLDERS", "").split(",") if f.strip()]
+IMAP_IDLE_REISSUE_INTERVAL = 29 * 60  # RFC 2177: re-issue IDLE at least every 29 minutes
+IMAP_IDLE_MAX_BACKOFF = int(os.getenv("IMAP_IDLE_MAX_BACKOFF", "300"))  # seconds
 
 server = Server("email")
 
@@ -184,103 +261,2148 @@ def decode_header_safely(header_value: str) -> str:
             return safe_text_serialization(header_value)
         return ""
 
-def format_email_summary(msg_data: tuple) -> dict:
-    """Format an email message into a summary dict with basic information."""
-    email_body = email.message_from_bytes(msg_data[0][1])
+# Header fields fetched for search result summaries
+SUMMARY_HEADER_FIELDS = "(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)])"
+CONTENT_HEADER_FIELDS = "BODY.PEEK[HEADER.FIELDS (FROM TO SUBJECT DATE)]"
+# Header fields that link a message to its thread
+THREAD_HEADER_FIELDS = "(UID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID IN-REPLY-TO REFERENCES)])"
+
+def compress_message_set(ids: list) -> str:
+    """Collapse message numbers into an IMAP message-set such as '1:5,8,10:12'."""
+    numbers = sorted({int(i) for i in ids})
+    ranges = []
+    for number in numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ",".join(f"{start}:{end}" if start != end else str(start) for start, end in ranges)
+
+def expand_message_set(message_set) -> list[int]:
+    """Expand an IMAP message-set such as '1:3,7' into a list of numbers ('*' is not allowed).
+
+    Numbers keep the order they are written in, so '5:3' gives 5, 4, 3 as in
+    the sorted results of ESORT.
+    """
+    if isinstance(message_set, bytes):
+        message_set = message_set.decode()
+    numbers = []
+    for part in str(message_set).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition(":")
+        start, end = int(start), int(end or start)
+        numbers.extend(range(start, end + 1) if start <= end else range(start, end - 1, -1))
+    return numbers
+
+def parse_thread_response(data: list) -> list[list[tuple[int, int]]]:
+    """Parse a THREAD response into threads of (UID, depth) in display order (RFC 5256).
+
+    A nested list without a leading message stands for a parent the server
+    could not find; its children share the depth it would have had.
+    """
+    text = b" ".join(line for line in data if isinstance(line, bytes)).decode('ascii', 'replace')
+    threads = []
+    # Each entry is (entries of the thread being built, depth of the next message)
+    stack = []
+    for token in re.findall(r'[()]|\d+', text):
+        if token == '(':
+            if stack:
+                entries, depth = stack[-1]
+                stack.append((entries, depth))
+            else:
+                stack.append(([], 0))
+        elif token == ')':
+            if not stack:
+                continue
+            entries, _ = stack.pop()
+            if not stack:
+                threads.append(entries)
+        elif stack:
+            entries, depth = stack.pop()
+            entries.append((int(token), depth))
+            stack.append((entries, depth + 1))
+    return threads
+
+def parse_esearch_response(data: list) -> dict[str, str]:
+    """Parse the results of an ESEARCH response, e.g. {"COUNT": "3", "ALL": "1:3"}.
+
+    A PARTIAL result is reduced to its message-set, or "" for NIL (RFC 9394).
+    """
+    results = {}
+    for line in data:
+        if not line:
+            continue
+        if isinstance(line, bytes):
+            line = line.decode('ascii', 'replace')
+        line = re.sub(r'^\s*\(TAG "[^"]*"\)', '', line)
+        tokens = re.findall(r'\([^)]*\)|\S+', line)
+        if tokens and tokens[0].upper() == 'UID':
+            tokens = tokens[1:]
+        for name, value in zip(tokens[::2], tokens[1::2]):
+            if name.upper() == 'PARTIAL':
+                # (range message-set), or (range NIL) when the range is past the end
+                parts = value.strip('()').split()
+                value = parts[1] if len(parts) > 1 and parts[1].upper() != 'NIL' else ""
+            results[name.upper()] = value
+    return results
+
+def _tokenize_imap(segments: list) -> list:
+    """Split a response (text segments interleaved with literals) into IMAP tokens.
+
+    Atoms are returned as str, quoted strings and literals as bytes, NIL as None,
+    and parentheses as the single-character strings '(' and ')'.
+    """
+    tokens = []
+    for segment in segments:
+        if isinstance(segment, tuple):
+            # (text ending in '{n}', literal)
+            text, literal = segment
+            text = text[:text.rindex(b'{')]
+        else:
+            text, literal = segment, None
+        i = 0
+        length = len(text)
+        while i < length:
+            char = text[i:i + 1]
+            if char in (b' ', b'\r', b'\n'):
+                i += 1
+            elif char in (b'(', b')'):
+                tokens.append(char.decode())
+                i += 1
+            elif char == b'"':
+                i += 1
+                value = bytearray()
+                while i < length and text[i:i + 1] != b'"':
+                    if text[i:i + 1] == b'\\':
+                        i += 1
+                    value += text[i:i + 1]
+                    i += 1
+                tokens.append(bytes(value))
+                i += 1
+            else:
+                start = i
+                depth = 0
+                # Atoms may contain bracketed sections with spaces, e.g. BODY[HEADER.FIELDS (FROM)]
+                while i < length:
+                    char = text[i:i + 1]
+                    if char == b'[':
+                        depth += 1
+                    elif char == b']':
+                        depth -= 1
+                    elif depth == 0 and char in (b' ', b'(', b')', b'\r', b'\n'):
+                        break
+                    i += 1
+                atom = text[start:i].decode('utf-8', errors='replace')
+                tokens.append(None if atom.upper() == 'NIL' else atom)
+        if literal is not None:
+            tokens.append(literal)
+    return tokens
+
+def _build_imap_list(tokens: list, pos: int = 0) -> tuple[list, int]:
+    """Turn a flat token list into nested Python lists."""
+    result = []
+    while pos < len(tokens):
+        token = tokens[pos]
+        pos += 1
+        if token == '(':
+            nested, pos = _build_imap_list(tokens, pos)
+            result.append(nested)
+        elif token == ')':
+            return result, pos
+        else:
+            result.append(token)
+    return result, pos
+
+def parse_imap_response(segments: list) -> list:
+    """Parse one IMAP response (as returned by imaplib) into nested lists."""
+    parsed, _ = _build_imap_list(_tokenize_imap(segments))
+    return parsed
+
+def parse_fetch_response(fetch_data: list) -> list[dict]:
+    """Parse a multi-message FETCH response in a single pass.
+
+    imaplib returns each message as zero or more (text, literal) tuples followed
+    by a bytes trailer. Each message becomes a dict of its FETCH items keyed by
+    upper-cased item name, plus 'SEQ' for the message sequence number.
+    """
+    messages = []
+    segments = []
+    for element in fetch_data or []:
+        if element is None:
+            continue
+        segments.append(element)
+        if isinstance(element, tuple):
+            continue
+        # A bytes element always terminates the current message
+        parsed = parse_imap_response(segments)
+        segments = []
+        if len(parsed) < 2 or not isinstance(parsed[1], list):
+            continue
+        item = {"SEQ": parsed[0]}
+        attributes = parsed[1]
+        for i in range(0, len(attributes) - 1, 2):
+            key = attributes[i]
+            if isinstance(key, str):
+                item[key.upper()] = attributes[i + 1]
+        messages.append(item)
+    return messages
+
+def get_body_section(item: dict, prefix: str = "BODY[") -> bytes | None:
+    """Return the first BODY[...] section of a parsed FETCH item matching the prefix."""
+    for key, value in item.items():
+        if key.startswith(prefix):
+            return value if value is not None else b""
+    return None
+
+def normalize_mailbox(mailbox: str) -> str:
+    """INBOX is case-insensitive in IMAP; use one spelling so lookups match."""
+    return "INBOX" if mailbox.upper() == "INBOX" else mailbox
+
+def imap_mailbox_arg(mailbox: str) -> str:
+    """Quote a mailbox name for a command unless it is a plain atom or already quoted."""
+    if len(mailbox) >= 2 and mailbox[0] == mailbox[-1] == '"':
+        return mailbox
+    if mailbox and not any(c in '(){ %*"\\]' or ord(c) < 0x20 for c in mailbox):
+        return mailbox
+    return '"' + mailbox.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def encode_email_id(folder: str, uidvalidity: int | None, uid) -> str:
+    """Build a stable email ID from the folder, its UIDVALIDITY and the message UID."""
+    uid = uid.decode() if isinstance(uid, bytes) else str(uid)
+    return f"{folder}:{uidvalidity}:{uid}"
+
+def decode_email_id(email_id: str, default_folder: str = "inbox") -> tuple[str, int | None, str]:
+    """Split an email ID into (folder, UIDVALIDITY, UID).
+
+    A bare number is accepted as a UID in the default folder, with no
+    UIDVALIDITY to check against.
+    """
+    email_id = str(email_id).strip()
+    if email_id.isdigit():
+        return normalize_mailbox(default_folder), None, email_id
+    try:
+        folder, uidvalidity, uid = email_id.rsplit(":", 2)
+        if not uid.isdigit() or not folder:
+            raise ValueError
+        return normalize_mailbox(folder), int(uidvalidity) if uidvalidity.isdigit() else None, uid
+    except ValueError:
+        raise ValueError(f"Invalid email ID: {email_id}. Use an ID returned by search-emails.")
+
+def format_email_summary(email_id: str, raw_headers: bytes) -> dict:
+    """Format an email's header block into a summary dict with basic information."""
+    email_body = email.message_from_bytes(raw_headers or b"")
     
     return {
-        "id": msg_data[0][0].split()[0].decode(),  # Get the email ID
+        "id": email_id,
         "from": decode_header_safely(email_body.get("From", "Unknown")),
         "date": email_body.get("Date", "Unknown"),
         "subject": decode_header_safely(email_body.get("Subject", "No Subject")),
     }
 
-def format_email_content(msg_data: tuple) -> dict:
-    """Format an email message into a dict with full content."""
-    email_body = email.message_from_bytes(msg_data[0][1])
+def _imap_str(value) -> str | None:
+    """Decode a quoted string or literal from a parsed IMAP response."""
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+def _imap_params(values) -> dict[str, str]:
+    """Turn a body parameter list such as ("CHARSET" "utf-8") into a dict with lower-case keys."""
+    if not isinstance(values, list):
+        return {}
+    return {
+        _imap_str(values[i]).lower(): _imap_str(values[i + 1]) or ""
+        for i in range(0, len(values) - 1, 2)
+        if values[i] is not None
+    }
+
+def _part_filename(params: dict, disposition_params: dict) -> str | None:
+    """Filename of a body part from its disposition or Content-Type parameters (RFC 2231/2047)."""
+    for source in (disposition_params, params):
+        for key in ("filename", "name"):
+            if key in source:
+                return decode_header_safely(source[key])
+            if f"{key}*" in source:
+                # RFC 2231 extended value: charset'language'percent-encoded
+                charset, _, value = email.utils.decode_rfc2231(source[f"{key}*"])
+                try:
+                    return urllib.parse.unquote(value, encoding=charset or "utf-8", errors="replace")
+                except LookupError:
+                    return urllib.parse.unquote(value, errors="replace")
+    return None
+
+def parse_bodystructure(structure: list, part: str = "") -> list[dict]:
+    """Flatten a parsed BODYSTRUCTURE into its leaf parts.
+
+    Each part is a dict with its IMAP part number (as used in BODY[<part>]),
+    MIME type, parameters, transfer encoding, encoded size, disposition and
+    filename. Attached messages (message/rfc822) are kept as single parts.
+    """
+    if structure and isinstance(structure[0], list):
+        # Multipart: child bodies first, then the subtype and extension data
+        parts = []
+        for index, child in enumerate(structure):
+            if not isinstance(child, list):
+                break
+            parts += parse_bodystructure(child, f"{part}.{index + 1}" if part else str(index + 1))
+        return parts
     
-    # Extract body content
-    body = ""
-    if email_body.is_multipart():
-        # Handle multipart messages
-        for part in email_body.walk():
-            if part.get_content_type() == "text/plain":
+    main_type = (_imap_str(structure[0]) or "application").lower()
+    sub_type = (_imap_str(structure[1]) or "octet-stream").lower()
+    params = _imap_params(structure[2])
+    encoding = (_imap_str(structure[5]) or "7bit").lower()
+    try:
+        size = int(structure[6])
+    except (TypeError, ValueError, IndexError):
+        size = 0
+    # Extension data follows the line count for text/*, and envelope/body/lines for message/rfc822
+    if main_type == "text":
+        extension = 8
+    elif (main_type, sub_type) == ("message", "rfc822"):
+        extension = 10
+    else:
+        extension = 7
+    disposition = structure[extension + 1] if len(structure) > extension + 1 else None
+    disposition_type = None
+    disposition_params = {}
+    if isinstance(disposition, list) and disposition:
+        disposition_type = (_imap_str(disposition[0]) or "").lower() or None
+        disposition_params = _imap_params(disposition[1] if len(disposition) > 1 else None)
+    return [{
+        "part": part or "1",
+        "type": f"{main_type}/{sub_type}",
+        "params": params,
+        "charset": params.get("charset"),
+        "encoding": encoding,
+        "size": size,
+        "disposition": disposition_type,
+        "filename": _part_filename(params, disposition_params),
+    }]
+
+def select_text_part(parts: list[dict]) -> dict | None:
+    """Pick the part to show as the email body: text/plain, else text/html, skipping attachments."""
+    inline = [p for p in parts if p["disposition"] != "attachment"]
+    for content_type in ("text/plain", "text/html"):
+        for part in inline:
+            if part["type"] == content_type:
+                return part
+    return None
+
+def list_attachment_parts(parts: list[dict]) -> list[dict]:
+    """Parts that are shown as attachments: everything but the displayed body and its text alternatives."""
+    text_part = select_text_part(parts)
+    return [
+        part for part in parts
+        if part is not text_part
+        and (part["disposition"] == "attachment" or part["filename"] or not part["type"].startswith("text/"))
+    ]
+
+def estimated_decoded_size(part: dict) -> int:
+    """Approximate decoded size of a part from its encoded BODYSTRUCTURE size."""
+    if part["encoding"] == "base64":
+        # 57 bytes per 76-character line plus CRLF
+        return part["size"] * 57 // 78
+    return part["size"]
+
+def format_size(size: int) -> str:
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def decode_transfer_encoding(data: bytes, encoding: str) -> bytes:
+    """Undo a Content-Transfer-Encoding (base64 or quoted-printable); other encodings are returned as is."""
+    if encoding == "base64":
+        try:
+            return base64.b64decode(data)
+        except binascii.Error:
+            # Tolerate missing padding or stray characters like email.message does
+            return binascii.a2b_base64(data + b"==")
+    if encoding == "quoted-printable":
+        return quopri.decodestring(data)
+    return data
+
+def decode_part_payload(data: bytes, encoding: str, charset: str | None) -> str:
+    """Decode a body part according to its Content-Transfer-Encoding and charset."""
+    # safe_decode falls back to UTF-8 for unknown charsets
+    return safe_decode(decode_transfer_encoding(data, encoding), charset or "utf-8")
+
+def decode_transfer_chunk(data: bytes, encoding: str, final: bool) -> tuple[bytes, bytes]:
+    """Decode as much of a streamed transfer-encoded chunk as possible.
+
+    Returns the decoded bytes and the undecoded tail (an incomplete base64
+    quantum or quoted-printable line) to prepend to the next chunk.
+    """
+    if encoding == "base64":
+        compact = b"".join(data.split())
+        usable = len(compact) if final else len(compact) // 4 * 4
+        return decode_transfer_encoding(compact[:usable], encoding), compact[usable:]
+    if encoding == "quoted-printable" and not final:
+        newline = data.rfind(b"\n")
+        if newline < 0:
+            return b"", data
+        return decode_transfer_encoding(data[:newline + 1], encoding), data[newline + 1:]
+    return decode_transfer_encoding(data, encoding), b""
+
+def _incremental_decoder(charset: str | None):
+    try:
+        return codecs.getincrementaldecoder(charset or "utf-8")(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors='replace')
+
+def _incomplete_char_bytes(data: bytes, charset: str | None) -> int:
+    """Number of trailing bytes that only form part of a multi-byte character."""
+    decoder = _incremental_decoder(charset)
+    decoder.decode(data, final=False)
+    return len(decoder.getstate()[0])
+
+def decode_part_range(data: bytes, encoding: str, charset: str | None, lead: int, at_end: bool) -> tuple[str, int]:
+    """Decode a byte range of a still transfer-encoded body part.
+
+    `lead` is the number of bytes fetched before the requested offset: for
+    base64 and quoted-printable one byte is fetched early so the range can be
+    realigned to the next line start unless it already begins on one. Unless
+    the range reaches the end of the part, base64 and quoted-printable ranges
+    are cut at the last line break that does not split a character, and
+    7bit/8bit ranges before an incomplete multi-byte character, so the next
+    range picks up exactly where this one stopped. A base64 cut also leaves
+    a whole number of 4-character quanta before it, so ranges read on from
+    such a cut stay aligned whatever length the encoder wrapped lines at;
+    only a range starting elsewhere assumes a line start begins a quantum,
+    as it does with the usual 76-character lines. Returns the text and the
+    end of the decoded bytes within `data`; an end of `lead` means the range
+    held no complete line or character and a longer one is needed.
+    """
+    start, end = lead, len(data)
+    if encoding in ("base64", "quoted-printable"):
+        if lead and data[:lead] != b"\n":
+            newline = data.find(b"\n", lead)
+            if newline < 0:
+                return "", end if at_end else lead
+            start = newline + 1
+        if at_end:
+            return decode_part_payload(data[start:end], encoding, charset), end
+        # Only a line start is a safe cut: QP escapes never span lines, but base64
+        # quanta may when lines are not a multiple of 4 characters long
+        newline = data.rfind(b"\n", start)
+        while newline >= 0:
+            chunk = data[start:newline + 1]
+            if encoding != "base64" or len(b"".join(chunk.split())) % 4 == 0:
+                decoded = decode_transfer_encoding(chunk, encoding)
+                if not _incomplete_char_bytes(decoded, charset):
+                    return safe_decode(decoded, charset or "utf-8"), newline + 1
+            newline = data.rfind(b"\n", start, newline)
+        return "", lead
+    decoder = _incremental_decoder(charset)
+    text = decoder.decode(data[start:end], final=at_end)
+    if not at_end:
+        # Leave an incomplete character for the next range
+        end -= len(decoder.getstate()[0])
+    return text, end
+
+class IMAPLiteral(bytes):
+    """A command argument sent as an IMAP literal instead of inline."""
+
+
+class _IMAPCommand:
+    """A command in flight: resolved by its tagged response, collecting untagged ones meanwhile."""
+
+    def __init__(self, name: str, listener: asyncio.Queue | None = None):
+        self.name = name
+        self.future = asyncio.get_running_loop().create_future()
+        # An abandoned command must not log "exception was never retrieved"
+        self.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.untagged: dict[str, list] = {}
+        self.listener = listener
+
+
+class IMAPTraffic:
+    """Byte counters for IMAP connections, before and after COMPRESS=DEFLATE.
+
+    `sent` and `received` count IMAP protocol bytes; the `_wire` counters
+    count what went through TLS, which is less once compression is active.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.sent_wire = 0
+        self.received_wire = 0
+
+    def stats(self) -> dict:
+        total = self.sent + self.received
+        return {
+            "sent": self.sent,
+            "received": self.received,
+            "sent_wire": self.sent_wire,
+            "received_wire": self.received_wire,
+            "wire_ratio": (self.sent_wire + self.received_wire) / total if total else 1.0,
+        }
+
+
+class AsyncIMAPClient:
+    """A small IMAP4rev1 client on asyncio streams, replacing imaplib in executor threads.
+
+    A single reader task dispatches the server's responses and completes each
+    command when its tagged response arrives. Commands on one connection run
+    one at a time: untagged responses are credited to the command in flight,
+    and RFC 3501 lets a server interleave the untagged data of pipelined
+    commands, so they could not be attributed reliably otherwise. A command
+    whose caller gave up still finishes before the next one is sent.
+    Results have imaplib's (typ, data) shape and errors are raised as
+    imaplib.IMAP4.error/abort, so callers written for imaplib keep working.
+    """
+
+    error = imaplib.IMAP4.error
+    abort = imaplib.IMAP4.abort
+    readonly = imaplib.IMAP4.readonly
+
+    _tagged_response = re.compile(br'(?P<type>[A-Z]+)(?: (?P<data>.*))?', re.ASCII | re.DOTALL)
+
+    def __init__(self, host: str, port: int = IMAP_SSL_PORT, ssl_context: ssl.SSLContext | None = None,
+                 traffic: IMAPTraffic | None = None):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.traffic = traffic or IMAPTraffic()
+        self.capabilities: tuple[str, ...] = ()
+        self.untagged_responses: dict[str, list] = {}
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._pending: dict[bytes, _IMAPCommand] = {}
+        self._send_lock = asyncio.Lock()
+        self._command_lock = asyncio.Lock()
+        self._continuation: asyncio.Future | None = None
+        self._tag_prefix = ''.join(secrets.choice(string.ascii_uppercase) for _ in range(4)).encode()
+        self._tag_counter = 0
+        self._closed: Exception | None = None
+        # Set once COMPRESS DEFLATE is active
+        self._deflate = None
+        self._inflate_task: asyncio.Task | None = None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed is not None
+
+    @property
+    def compressed(self) -> bool:
+        return self._deflate is not None
+
+    async def connect(self, timeout: float) -> None:
+        """Open the TLS connection and read the server greeting."""
+        async with asyncio.timeout(timeout):
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context)
+            greeting = await self._read_line()
+        if not greeting.startswith((b'* OK', b'* PREAUTH')):
+            self.shutdown()
+            raise self.error(f"Unexpected greeting: {greeting!r}")
+        code = imaplib.Response_code.match(greeting[5:].lstrip())
+        if code and code.group('type') == b'CAPABILITY' and code.group('data'):
+            self.capabilities = tuple(code.group('data').decode('ascii', 'replace').upper().split())
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def _read_line(self) -> bytes:
+        """Read one response line without its CRLF, however long it is."""
+        chunks = []
+        while True:
+            try:
+                chunks.append(await self._reader.readuntil(b'\r\n'))
+                line = b''.join(chunks)
+                self._count_received(len(line))
+                return line[:-2]
+            except asyncio.LimitOverrunError as e:
+                # e.g. a SEARCH response listing many thousands of UIDs
+                chunks.append(await self._reader.readexactly(e.consumed))
+            except asyncio.IncompleteReadError:
+                raise self.abort("socket error: EOF")
+
+    async def _read_literal(self, size: int) -> bytes:
+        data = await self._reader.readexactly(size)
+        self._count_received(size)
+        return data
+
+    def _count_received(self, size: int) -> None:
+        self.traffic.received += size
+        # Compressed bytes are counted as they come off the wire, in _inflate_loop
+        if self._deflate is None:
+            self.traffic.received_wire += size
+
+    def _write(self, data: bytes) -> None:
+        self.traffic.sent += len(data)
+        if self._deflate is not None:
+            # Flush every write so the server can act on the command right away
+            data = self._deflate.compress(data) + self._deflate.flush(zlib.Z_SYNC_FLUSH)
+        self.traffic.sent_wire += len(data)
+        self._writer.write(data)
+
+    def _start_compression(self) -> None:
+        """Switch both directions to raw DEFLATE, right after the server's OK to COMPRESS is read."""
+        raw_reader = self._reader
+        self._reader = asyncio.StreamReader()
+        self._deflate = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self._inflate_task = asyncio.create_task(self._inflate_loop(raw_reader, self._reader))
+
+    async def _inflate_loop(self, raw_reader: asyncio.StreamReader, reader: asyncio.StreamReader) -> None:
+        inflate = zlib.decompressobj(-15)
+        try:
+            while chunk := await raw_reader.read(65536):
+                self.traffic.received_wire += len(chunk)
+                reader.feed_data(inflate.decompress(chunk))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            reader.set_exception(self.abort(f"socket error: {str(e)}"))
+            return
+        reader.feed_eof()
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                await self._dispatch(await self._read_line())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(e if isinstance(e, self.abort) else self.abort(f"socket error: {str(e)}"))
+
+    async def _dispatch(self, line: bytes) -> None:
+        tag, _, rest = line.partition(b' ')
+        command = self._pending.pop(tag, None)
+        if command is not None:
+            match = self._tagged_response.match(rest)
+            if match is None:
+                raise self.abort(f"unexpected response: {line!r}")
+            typ = match.group('type').decode('ascii')
+            dat = match.group('data') or b''
+            self._response_code(command.untagged, typ, dat)
+            if command.name == 'COMPRESS' and typ == 'OK':
+                # Everything after this response is compressed, in both directions
+                self._start_compression()
+            if not command.future.done():
+                command.future.set_result((typ, [dat]))
+            return
+
+        if line.startswith(b'+'):
+            if self._continuation is not None and not self._continuation.done():
+                self._continuation.set_result(line[2:])
+            return
+
+        # Same parsing as imaplib.IMAP4._get_response for untagged responses
+        dat2 = None
+        match = imaplib.Untagged_response.match(line)
+        if match is None:
+            match = imaplib.Untagged_status.match(line)
+            if match is None:
+                raise self.abort(f"unexpected response: {line!r}")
+            dat2 = match.group('data2')
+        typ = match.group('type').decode('ascii')
+        dat = match.group('data') or b''
+        if dat2:
+            dat = dat + b' ' + dat2
+
+        owner = next(iter(self._pending.values()), None)
+        target = owner.untagged if owner is not None else self.untagged_responses
+        while (literal := imaplib.Literal.match(dat)) is not None:
+            data = await self._read_literal(int(literal.group('size')))
+            target.setdefault(typ, []).append((dat, data))
+            dat = await self._read_line()
+        target.setdefault(typ, []).append(dat)
+        self._response_code(target, typ, dat)
+        if owner is not None and owner.listener is not None:
+            owner.listener.put_nowait(typ)
+
+    @staticmethod
+    def _response_code(target: dict, typ: str, dat: bytes) -> None:
+        # Bracketed response codes, e.g. [UIDVALIDITY 42], are kept like untagged responses
+        if typ in ('OK', 'NO', 'BAD'):
+            match = imaplib.Response_code.match(dat)
+            if match is not None:
+                target.setdefault(match.group('type').decode('ascii'), []).append(match.group('data') or b'')
+
+    def _fail(self, error: Exception) -> None:
+        """Mark the connection dead and fail everything waiting on it."""
+        if self._closed is None:
+            self._closed = error
+        for command in self._pending.values():
+            if not command.future.done():
+                command.future.set_exception(error)
+            if command.listener is not None:
+                command.listener.put_nowait(error)
+        self._pending.clear()
+        if self._continuation is not None and not self._continuation.done():
+            self._continuation.set_exception(error)
+        if self._writer is not None:
+            self._writer.close()
+
+    def _new_tag(self) -> bytes:
+        self._tag_counter += 1
+        return self._tag_prefix + str(self._tag_counter).encode()
+
+    async def _wait_continuation(self, command: _IMAPCommand) -> bool:
+        """Wait for the server's go-ahead; False if the command was completed (rejected) instead."""
+        self._continuation = asyncio.get_running_loop().create_future()
+        try:
+            await self._writer.drain()
+            await asyncio.wait({self._continuation, command.future}, return_when=asyncio.FIRST_COMPLETED)
+            if self._closed is not None:
+                raise self._closed
+            return self._continuation.done()
+        finally:
+            self._continuation = None
+
+    async def _command(self, name: str, *args, listener: asyncio.Queue | None = None,
+                       continuation: bool = False) -> _IMAPCommand:
+        """Send a command and return it without waiting for its completion."""
+        if self._closed is not None:
+            raise self.abort(f"connection closed: {self._closed}")
+        command = _IMAPCommand(name, listener)
+        tag = self._new_tag()
+        line = tag + b' ' + name.encode('ascii')
+        async with self._send_lock:
+            self._pending[tag] = command
+            try:
+                for arg in args:
+                    if arg is None:
+                        continue
+                    if isinstance(arg, IMAPLiteral):
+                        # LITERAL+ lets us send literals without waiting for the server
+                        if 'LITERAL+' in self.capabilities:
+                            self._write(line + b' {%d+}\r\n' % len(arg))
+                        else:
+                            self._write(line + b' {%d}\r\n' % len(arg))
+                            if not await self._wait_continuation(command):
+                                return command
+                        line = bytes(arg)
+                    else:
+                        line += b' ' + (arg.encode('ascii') if isinstance(arg, str) else arg)
+                self._write(line + b'\r\n')
+                if continuation:
+                    await self._wait_continuation(command)
+                else:
+                    await self._writer.drain()
+            except BaseException as e:
+                # A command cut off halfway leaves the connection in an unknown state
+                self._fail(self.abort(f"{name} interrupted: {str(e) or type(e).__name__}"))
+                raise
+        return command
+
+    async def simple_command(self, name: str, *args, response: str | None = None):
+        """Run a command and return (typ, data) like imaplib.
+
+        With `response`, data is that command's untagged responses of this type;
+        all others are kept for response(). BAD raises like imaplib does.
+        """
+        async with self._command_lock:
+            # Wait for a command left behind by a cancelled caller
+            if self._pending:
+                await asyncio.wait([pending.future for pending in self._pending.values()])
+            for typ in ('OK', 'NO', 'BAD'):
+                self.untagged_responses.pop(typ, None)
+            command = await self._command(name, *args)
+        # Shielded so a cancelled caller leaves the command pending until the server answers
+        typ, data = await asyncio.shield(command.future)
+        if response is not None and typ != 'NO':
+            data = command.untagged.pop(response, [None])
+        for key, values in command.untagged.items():
+            self.untagged_responses.setdefault(key, []).extend(values)
+        if typ == 'BAD':
+            raise self.error(f"{name} command error: {typ} {data}")
+        return typ, data
+
+    @staticmethod
+    def _quote(value: str) -> str | IMAPLiteral:
+        try:
+            value.encode('ascii')
+        except UnicodeEncodeError:
+            return IMAPLiteral(value.encode('utf-8'))
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    def response(self, code: str):
+        """Pop untagged responses of one type left by earlier commands, like imaplib."""
+        return code, self.untagged_responses.pop(code.upper(), [None])
+
+    async def login(self, user: str, password: str):
+        typ, data = await self.simple_command('LOGIN', self._quote(user), self._quote(password))
+        if typ != 'OK':
+            raise self.error(data[-1])
+        return typ, data
+
+    async def capability(self):
+        typ, data = await self.simple_command('CAPABILITY', response='CAPABILITY')
+        if typ == 'OK' and data and data[-1]:
+            self.capabilities = tuple(data[-1].decode('ascii', 'replace').upper().split())
+        return typ, data
+
+    async def enable(self, capability: str):
+        return await self.simple_command('ENABLE', capability)
+
+    async def compress(self) -> bool:
+        """Turn on COMPRESS=DEFLATE (RFC 4978) if the server offers it; True if it is now active.
+
+        No other command may be in flight, since the server compresses
+        everything after its reply.
+        """
+        if self._deflate is not None or 'COMPRESS=DEFLATE' not in self.capabilities:
+            return self._deflate is not None
+        try:
+            typ, data = await self.simple_command('COMPRESS', 'DEFLATE')
+            if typ != 'OK':
+                # e.g. [COMPRESSIONACTIVE] when TLS already compresses
+                logging.debug(f"Server declined COMPRESS DEFLATE: {data}")
+        except self.abort:
+            raise
+        except self.error as e:
+            logging.debug(f"Server rejected COMPRESS DEFLATE: {str(e)}")
+        return self._deflate is not None
+
+    async def noop(self):
+        return await self.simple_command('NOOP')
+
+    async def select(self, mailbox: str = 'INBOX', readonly: bool = False):
+        self.untagged_responses = {}  # Flush old responses, as imaplib does
+        typ, data = await self.simple_command('EXAMINE' if readonly else 'SELECT', mailbox)
+        if typ != 'OK':
+            return typ, data
+        if 'READ-ONLY' in self.untagged_responses and not readonly:
+            raise self.readonly(f"{mailbox} is not writable")
+        return typ, self.untagged_responses.get('EXISTS', [None])
+
+    async def search(self, charset, *criteria):
+        if charset:
+            return await self.simple_command('SEARCH', 'CHARSET', charset, *criteria, response='SEARCH')
+        return await self.simple_command('SEARCH', *criteria, response='SEARCH')
+
+    async def fetch(self, message_set, message_parts):
+        return await self.simple_command('FETCH', message_set, message_parts, response='FETCH')
+
+    async def uid(self, command: str, *args):
+        if args and isinstance(args[0], str) and args[0].upper() == 'RETURN':
+            # Searches with result options answer with ESEARCH (RFC 4731, RFC 5267)
+            response = 'ESEARCH'
+        else:
+            response = command.upper() if command.upper() in ('SEARCH', 'SORT', 'THREAD') else 'FETCH'
+        return await self.simple_command('UID', command, *args, response=response)
+
+    async def status(self, mailbox: str, names: str):
+        return await self.simple_command('STATUS', mailbox, names, response='STATUS')
+
+    async def list(self, directory: str = '""', pattern: str = '*'):
+        return await self.simple_command('LIST', directory, pattern, response='LIST')
+
+    async def append(self, mailbox: str, flags: str | None, date_time, message: bytes):
+        if flags and (flags[0], flags[-1]) != ('(', ')'):
+            flags = f"({flags})"
+        date_time = imaplib.Time2Internaldate(date_time) if date_time else None
+        literal = IMAPLiteral(imaplib.MapCRLF.sub(b'\r\n', message))
+        return await self.simple_command('APPEND', mailbox or 'INBOX', flags or None, date_time, literal)
+
+    async def idle_start(self, listener: asyncio.Queue) -> _IMAPCommand:
+        """Enter IDLE; the types of untagged responses (or a connection error) go to the listener."""
+        command = await self._command('IDLE', listener=listener, continuation=True)
+        if command.future.done():
+            typ, data = command.future.result()
+            raise self.error(f"IDLE rejected: {typ} {data}")
+        return command
+
+    async def idle_done(self, command: _IMAPCommand):
+        async with self._send_lock:
+            self._write(b'DONE\r\n')
+            await self._writer.drain()
+        return await command.future
+
+    def shutdown(self) -> None:
+        """Close the connection without waiting for the server."""
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._inflate_task is not None:
+            self._inflate_task.cancel()
+        self._fail(self.abort("connection closed"))
+
+    async def logout(self):
+        try:
+            typ, data = await self.simple_command('LOGOUT')
+        except self.abort:
+            # Servers may close the connection right after BYE
+            typ, data = 'BYE', [b'']
+        self.shutdown()
+        return typ, data
+
+
+class IMAPSession:
+    """An authenticated IMAP connection that can be leased from an IMAPConnectionPool."""
+
+    def __init__(self, config: dict, traffic: IMAPTraffic | None = None):
+        self.config = config
+        self.traffic = traffic
+        self.mail: AsyncIMAPClient | None = None
+        self.selected_mailbox: str | None = None
+        self.uidvalidity: int | None = None
+        self.highestmodseq: int | None = None
+        self.capabilities: set[str] = set()
+        self.readonly = False
+        self.broken = False
+        self.last_used = 0.0
+
+    async def connect(self) -> None:
+        """Open the TLS connection and log in."""
+        logging.debug(f"Opening IMAP connection to {self.config['imap_server']}")
+        mail = AsyncIMAPClient(self.config["imap_server"], traffic=self.traffic)
+        await mail.connect(IMAP_CONNECT_TIMEOUT)
+        try:
+            async with asyncio.timeout(IMAP_CONNECT_TIMEOUT):
+                await mail.login(self.config["email"], self.config["password"])
+                # Servers often advertise more capabilities once authenticated
+                await mail.capability()
+                if IMAP_COMPRESS:
+                    await mail.compress()
+                # QRESYNC implies CONDSTORE; enabling it makes the server report VANISHED UIDs
+                if 'ENABLE' in mail.capabilities:
+                    for extension in ('QRESYNC', 'CONDSTORE'):
+                        if extension in mail.capabilities:
+                            await mail.enable(extension)
+                            break
+        except BaseException:
+            mail.shutdown()
+            raise
+
+        self.mail = mail
+        self.capabilities = set(self.mail.capabilities)
+        self.selected_mailbox = None
+        self.readonly = False
+        self.broken = False
+        self.last_used = time.monotonic()
+
+    async def _call(self, func, *args, **kwargs):
+        """Run a client command, marking the session broken if the connection is lost."""
+        try:
+            return await func(*args, **kwargs)
+        except (imaplib.IMAP4.abort, OSError):
+            self.broken = True
+            raise
+        except asyncio.CancelledError:
+            # The server still runs the command, so a SELECT may yet switch mailboxes
+            self.selected_mailbox = None
+            raise
+        finally:
+            # A command cancelled while it was being sent closes the connection;
+            # one cancelled while waiting for its reply leaves it usable.
+            if self.mail is None or self.mail.closed:
+                self.broken = True
+            self.last_used = time.monotonic()
+
+    def has_capability(self, capability: str) -> bool:
+        return capability.upper() in self.capabilities
+
+    async def noop(self):
+        return await self._call(self.mail.noop)
+
+    async def select(self, mailbox: str = "INBOX", readonly: bool = False):
+        """Select a mailbox, skipping the round trip if it is already selected."""
+        mailbox = normalize_mailbox(mailbox)
+        if self.selected_mailbox == mailbox and (readonly or not self.readonly):
+            logging.debug(f"Mailbox {mailbox} already selected on this session, skipping SELECT")
+            return 'OK', [None]
+
+        status, data = await self._call(self.mail.select, imap_mailbox_arg(mailbox), readonly)
+        # UIDVALIDITY and HIGHESTMODSEQ arrive as response codes on the SELECT
+        _, uidvalidity = self.mail.response('UIDVALIDITY')
+        _, highestmodseq = self.mail.response('HIGHESTMODSEQ')
+        if status == 'OK':
+            self.selected_mailbox = mailbox
+            self.readonly = readonly
+            self.uidvalidity = int(uidvalidity[-1]) if uidvalidity and uidvalidity[-1] else None
+            self.highestmodseq = int(highestmodseq[-1]) if highestmodseq and highestmodseq[-1] else None
+        else:
+            self.selected_mailbox = None
+            self.uidvalidity = None
+            self.highestmodseq = None
+        return status, data
+
+    async def search(self, charset, *criteria):
+        return await self._call(self.mail.search, charset, *criteria)
+
+    async def fetch(self, message_set, message_parts):
+        return await self._call(self.mail.fetch, message_set, message_parts)
+
+    async def uid(self, command, *args):
+        return await self._call(self.mail.uid, command, *args)
+
+    async def uid_search(self, criteria: list, returning: str | None = None):
+        """Run UID SEARCH where criteria may mix atoms (str) and UTF-8 literals (bytes).
+
+        With `returning`, e.g. "(COUNT ALL)", ESEARCH result options are
+        requested and the data is the ESEARCH response (RFC 4731).
+        """
+        options = ['RETURN', returning] if returning else []
+        if not any(isinstance(part, bytes) for part in criteria):
+            return await self.uid('SEARCH', *options, *criteria)
+        criteria = [IMAPLiteral(part) if isinstance(part, bytes) else part for part in criteria]
+        return await self.uid('SEARCH', *options, 'CHARSET', 'UTF-8', *criteria)
+
+    async def uid_sort(self, sort_criteria: str, criteria: list, returning: str | None = None):
+        """Run UID SORT (RFC 5256) with the same criteria as uid_search; SORT always names a charset.
+
+        With `returning`, the ESORT result options are requested (RFC 5267).
+        """
+        options = ['RETURN', returning] if returning else []
+        criteria = [IMAPLiteral(part) if isinstance(part, bytes) else part for part in criteria]
+        return await self.uid('SORT', *options, sort_criteria, 'UTF-8', *criteria)
+
+    async def uid_thread(self, algorithm: str, criteria: list):
+        """Run UID THREAD (RFC 5256) with the same criteria as uid_search."""
+        criteria = [IMAPLiteral(part) if isinstance(part, bytes) else part for part in criteria]
+        return await self.uid('THREAD', algorithm, 'UTF-8', *criteria)
+
+    async def response(self, code):
+        """Collect untagged responses of one type, e.g. VANISHED, left by earlier commands."""
+        return self.mail.response(code)
+
+    async def status(self, mailbox, names):
+        return await self._call(self.mail.status, imap_mailbox_arg(mailbox), names)
+
+    async def list(self, directory: str = '""', pattern: str = '*'):
+        return await self._call(self.mail.list, directory, pattern)
+
+    async def list_special_use(self):
+        """List special-use mailboxes in one command: LIST (SPECIAL-USE) or Gmail's XLIST.
+
+        Servers with SPECIAL-USE but without LIST-EXTENDED report the attributes
+        in a plain LIST instead, so callers use list() for those.
+        """
+        if self.has_capability('SPECIAL-USE'):
+            # RFC 6154 selection option: only mailboxes with a special use are returned
+            return await self._call(self.mail.simple_command, 'LIST', '(SPECIAL-USE)', '""', '"*"', response='LIST')
+        return await self._call(self.mail.simple_command, 'XLIST', '""', '"*"', response='XLIST')
+
+    async def append(self, mailbox, flags, date_time, message):
+        return await self._call(self.mail.append, imap_mailbox_arg(mailbox), flags, date_time, message)
+
+    def shutdown(self) -> None:
+        """Close the underlying socket without waiting for the server."""
+        try:
+            if self.mail is not None:
+                self.mail.shutdown()
+        except Exception:
+            pass
+        self.mail = None
+        self.selected_mailbox = None
+        self.uidvalidity = None
+
+    async def logout(self) -> None:
+        try:
+            if self.mail is not None:
+                await self._call(self.mail.logout)
+        except BaseException:
+            pass
+        self.shutdown()
+
+
+class IMAPConnectionPool:
+    """A bounded pool of long-lived, authenticated IMAP sessions.
+
+    Sessions are health-checked with NOOP when they have been idle for longer
+    than IMAP_KEEPALIVE_INTERVAL and transparently reconnected when the check
+    fails. A background task keeps idle sessions from hitting the server's
+    autologout timer.
+    """
+
+    def __init__(self, config: dict, size: int = IMAP_POOL_SIZE):
+        self.config = config
+        self.size = max(1, size)
+        # Shared by every connection of the account, including its IDLE listeners
+        self.traffic = IMAPTraffic()
+        self._idle: list[IMAPSession] = []
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._keepalive_task: asyncio.Task | None = None
+
+    async def _checkout(self, mailbox: str | None) -> IMAPSession:
+        session = None
+        # Prefer a session that already has the requested mailbox selected
+        for candidate in reversed(self._idle):
+            if mailbox is not None and candidate.selected_mailbox == normalize_mailbox(mailbox):
+                session = candidate
+                break
+        if session is None and self._idle:
+            session = self._idle[-1]
+        if session is not None:
+            self._idle.remove(session)
+            if time.monotonic() - session.last_used > IMAP_KEEPALIVE_INTERVAL:
                 try:
-                    body = safe_decode(part.get_payload(decode=True))
-                    break
+                    status, _ = await session.noop()
+                    if status != 'OK':
+                        session.broken = True
                 except Exception as e:
-                    logging.error(f"Error decoding email body: {str(e)}")
-                    body = safe_decode(part.get_payload(decode=True))
-            elif part.get_content_type() == "text/html":
-                # If no plain text found, use HTML content
-                if not body:
-                    try:
-                        body = safe_decode(part.get_payload(decode=True))
-                    except Exception as e:
-                        logging.error(f"Error decoding HTML body: {str(e)}")
-                        body = safe_decode(part.get_payload(decode=True))
-    else:
-        # Handle non-multipart messages
+                    logging.warning(f"Pooled IMAP session failed health check: {str(e)}")
+                    session.broken = True
+            if not session.broken:
+                return session
+            logging.warning("IMAP session appears broken, reconnecting...")
+            session.shutdown()
+
+        session = IMAPSession(self.config, self.traffic)
+        await session.connect()
+        return session
+
+    def _checkin(self, session: IMAPSession) -> None:
+        if session.broken or session.mail is None:
+            session.shutdown()
+            return
+        self._idle.append(session)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, mailbox: str | None = None):
+        """Lease a session from the pool for the duration of the context."""
+        async with self._semaphore:
+            session = await self._checkout(mailbox)
+            try:
+                yield session
+            finally:
+                self._checkin(session)
+
+    async def _keepalive_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(1, IMAP_KEEPALIVE_INTERVAL // 2))
+            now = time.monotonic()
+            for session in list(self._idle):
+                if now - session.last_used < IMAP_KEEPALIVE_INTERVAL or session not in self._idle:
+                    continue
+                # Take the session out of the pool while it is being pinged
+                self._idle.remove(session)
+                try:
+                    status, _ = await session.noop()
+                    if status != 'OK':
+                        session.broken = True
+                except Exception as e:
+                    logging.debug(f"Keepalive NOOP failed, dropping session: {str(e)}")
+                    session.broken = True
+                self._checkin(session)
+
+    def start(self) -> None:
+        """Start the background keepalive task."""
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+    async def close(self) -> None:
+        """Stop the keepalive task and log out all idle sessions."""
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._keepalive_task
+            self._keepalive_task = None
+        idle, self._idle = self._idle, []
+        for session in idle:
+            await session.logout()
+
+class SMTPSession:
+    """An authenticated SMTP connection that can be leased from an SMTPConnectionPool."""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.smtp: smtplib.SMTP | None = None
+        self.messages_sent = 0
+        self.broken = False
+        self.last_used = 0.0
+
+    async def connect(self) -> None:
+        """Open the connection, start TLS and log in."""
+        def connect_sync():
+            logging.debug(f"Connecting to {self.config['smtp_server']}:{self.config['smtp_port']}")
+            smtp = smtplib.SMTP(self.config["smtp_server"], self.config["smtp_port"], timeout=SMTP_CONNECT_TIMEOUT)
+            try:
+                if SMTP_DEBUG:
+                    smtp.set_debuglevel(1)
+                logging.debug("Starting TLS")
+                smtp.starttls()
+                logging.debug(f"Logging in as {self.config['email']}")
+                smtp.login(self.config["email"], self.config["password"])
+            except BaseException:
+                smtp.close()
+                raise
+            return smtp
+
+        loop = asyncio.get_event_loop()
+        self.smtp = await loop.run_in_executor(None, connect_sync)
+        self.messages_sent = 0
+        self.broken = False
+        self.last_used = time.monotonic()
+
+    async def _call(self, func, *args):
+        """Run a blocking smtplib call in the executor, marking the session broken on failure."""
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(None, lambda: func(*args))
+        except (smtplib.SMTPServerDisconnected, OSError, asyncio.CancelledError):
+            # Same as IMAPSession._call: never hand out a connection in an unknown state
+            self.broken = True
+            raise
+        finally:
+            self.last_used = time.monotonic()
+
+    async def reset(self) -> bool:
+        """Health check before reuse: RSET clears any half-finished transaction."""
         try:
-            body = safe_decode(email_body.get_payload(decode=True))
+            code, _ = await self._call(self.smtp.rset)
         except Exception as e:
-            logging.error(f"Error decoding non-multipart body: {str(e)}")
-            body = safe_decode(email_body.get_payload(decode=True))
+            logging.debug(f"SMTP RSET failed: {str(e)}")
+            self.broken = True
+            return False
+        if code != 250:
+            self.broken = True
+        return not self.broken
+
+    async def send_message(self, msg, from_addr: str, to_addrs: list[str]) -> dict:
+        """Send a message; returns the refused recipients like smtplib does."""
+        self.messages_sent += 1
+        return await self._call(self.smtp.send_message, msg, from_addr, to_addrs)
+
+    def close(self) -> None:
+        """Close the underlying socket without waiting for the server."""
+        try:
+            if self.smtp is not None:
+                self.smtp.close()
+        except Exception:
+            pass
+        self.smtp = None
+
+    async def quit(self) -> None:
+        try:
+            if self.smtp is not None:
+                await self._call(self.smtp.quit)
+        except BaseException:
+            pass
+        self.close()
+
+
+class SMTPConnectionPool:
+    """A bounded pool of authenticated SMTP connections reused across sends.
+
+    A connection is checked with RSET before it is reused, retired after
+    SMTP_MAX_MESSAGES_PER_CONNECTION messages, and closed once it has been
+    idle for SMTP_IDLE_TIMEOUT seconds, well before servers time it out.
+    """
+
+    def __init__(self, config: dict, size: int = SMTP_POOL_SIZE):
+        self.config = config
+        self.size = max(1, size)
+        self._idle: list[SMTPSession] = []
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._reaper_task: asyncio.Task | None = None
+
+    async def _checkout(self) -> SMTPSession:
+        while self._idle:
+            session = self._idle.pop()
+            if time.monotonic() - session.last_used > SMTP_IDLE_TIMEOUT:
+                await session.quit()
+                continue
+            if await session.reset():
+                return session
+            logging.warning("Pooled SMTP connection failed health check, reconnecting...")
+            session.close()
+
+        session = SMTPSession(self.config)
+        await session.connect()
+        return session
+
+    async def _checkin(self, session: SMTPSession) -> None:
+        if session.broken or session.smtp is None:
+            session.close()
+            return
+        if session.messages_sent >= SMTP_MAX_MESSAGES_PER_CONNECTION:
+            logging.debug(f"Retiring SMTP connection after {session.messages_sent} messages")
+            await session.quit()
+            return
+        self._idle.append(session)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        """Lease a connection from the pool for the duration of the context."""
+        async with self._semaphore:
+            session = await self._checkout()
+            try:
+                yield session
+            finally:
+                await self._checkin(session)
+
+    async def _reaper_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(1, SMTP_IDLE_TIMEOUT // 2))
+            now = time.monotonic()
+            for session in list(self._idle):
+                if now - session.last_used > SMTP_IDLE_TIMEOUT and session in self._idle:
+                    self._idle.remove(session)
+                    await session.quit()
+
+    def start(self) -> None:
+        """Start the background task closing idle connections."""
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reaper_loop())
+
+    async def close(self) -> None:
+        """Stop the background task and close all idle connections."""
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reaper_task
+            self._reaper_task = None
+        idle, self._idle = self._idle, []
+        for session in idle:
+            await session.quit()
+
+class Account:
+    """One configured mailbox with its own connections, caches and sync state.
+
+    Accounts share nothing but the process: each has its own IMAP and SMTP
+    pools, Sent folder spool, folder and search caches, local stores under its
+    own cache directory, and background tasks, so a slow or broken account
+    never holds up another.
+    """
+
+    def __init__(self, name: str, config: dict, cache_dir: str,
+                 sync_folders: list[str], idle_folders: list[str]):
+        self.name = name
+        self.config = config
+        self.cache_dir = cache_dir
+        self.sync_folders = sync_folders
+        self.idle_folders = idle_folders
+        self.imap_pool = IMAPConnectionPool(config)
+        self.smtp_pool = SMTPConnectionPool(config)
+        self.sent_queue = SentFolderQueue(self, os.path.join(cache_dir, "outbox"), SENT_APPEND_MAX_ATTEMPTS)
+        self.metadata_store = MetadataStore(os.path.join(cache_dir, "metadata.sqlite3")) if METADATA_INDEX_ENABLED else None
+        self.fulltext_index = FullTextIndex(os.path.join(cache_dir, "fulltext.sqlite3")) if FULLTEXT_INDEX_ENABLED else None
+        self.message_cache = MessageCache(os.path.join(cache_dir, "messages"), MESSAGE_CACHE_MAX_BYTES) if MESSAGE_CACHE_ENABLED else None
+        self.attachment_dir = os.path.join(cache_dir, "attachments")
+        # The folder list and the Sent/Drafts/Trash mailboxes, cached in memory and,
+        # when the server flags them itself, on disk
+        self.folder_cache = FolderCache(FOLDER_CACHE_TTL)
+        self.special_folder_store = SpecialFolderStore(os.path.join(cache_dir, "special_folders.json"))
+        # Result sets of recent searches, for paging with a cursor
+        self.search_cursors = SearchCursors(SEARCH_CURSOR_TTL)
+        # Counts for days that have fully ended rarely change, as (expiry, count)
+        # keyed by (folder, UIDVALIDITY, timezone, day)
+        self.closed_day_counts: dict[tuple, tuple[float, int]] = {}
+        # Folders waiting for a sync after a change notification
+        self.dirty_folders: set[str] = set()
+        self.folder_sync_tasks: dict[str, asyncio.Task] = {}
+        # Reply graphs by folder, extended as new UIDs arrive
+        self.thread_graphs: dict[str, ThreadGraph] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Start the pools and the account's background tasks."""
+        # Keep pooled IMAP sessions alive between tool calls
+        self.imap_pool.start()
+        self.smtp_pool.start()
+        # Keep the local metadata index up to date in the background
+        if self.metadata_store is not None:
+            self._tasks.append(asyncio.create_task(metadata_sync_loop(self)))
+        # Save copies of sent emails to the Sent folder, including any left over from a previous run
+        self._tasks.append(asyncio.create_task(self.sent_queue.run()))
+        # Optionally hold IDLE connections so caches hear about new mail right away
+        self._tasks.extend(asyncio.create_task(IMAPIdleListener(self, folder).run()) for folder in self.idle_folders)
+
+    async def close(self) -> None:
+        """Cancel the background tasks and close the pooled connections."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await self.imap_pool.close()
+        await self.smtp_pool.close()
+
+# search_in values and the IMAP search keys they map to
+SEARCH_FIELDS = {
+    "subject": "SUBJECT",
+    "from": "FROM",
+    "to": "TO",
+    "body": "BODY",
+    "text": "TEXT",
+}
+
+def imap_search_string(value: str) -> str | bytes:
+    """Quote an ASCII search term, or return UTF-8 bytes to be sent as a literal."""
+    try:
+        value.encode('ascii')
+    except UnicodeEncodeError:
+        return value.encode('utf-8')
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def build_keyword_criteria(keyword: str, fields: list[str]) -> list:
+    """Match the keyword in any of the given fields, e.g. OR SUBJECT "x" FROM "x"."""
+    terms = [[SEARCH_FIELDS[field], imap_search_string(keyword)] for field in fields]
+    # OR takes exactly two search keys, so nest it for more fields
+    criteria = terms[-1]
+    for term in reversed(terms[:-1]):
+        criteria = ["OR"] + term + criteria
+    return criteria
+
+def build_search_criteria(
+    since: datetime,
+    before: datetime,
+    keyword: str = "",
+    search_in: list[str] | None = None,
+    exclude_keyword: str = "",
+    gmail_raw: str = "",
+) -> list:
+    """Build UID SEARCH criteria as a list of atoms (str) and UTF-8 literals (bytes)."""
+    fields = search_in or ["subject"]
+    criteria = ["SINCE", f'"{since.strftime("%d-%b-%Y")}"', "BEFORE", f'"{before.strftime("%d-%b-%Y")}"']
+    if keyword:
+        criteria += build_keyword_criteria(keyword, fields)
+    if exclude_keyword:
+        criteria += ["NOT"] + build_keyword_criteria(exclude_keyword, fields)
+    if gmail_raw:
+        # Let Gmail's own search index do the filtering
+        criteria += ["X-GM-RAW", imap_search_string(gmail_raw)]
+    return criteria
+
+async def fetch_email_summaries(mail: IMAPSession, uids: list) -> list[dict]:
+    """Fetch summary headers for many messages with a single UID FETCH command."""
+    if not uids:
+        return []
+    uids = [u.decode() if isinstance(u, bytes) else str(u) for u in uids]
+    message_set = compress_message_set(uids)
+    logging.debug(f"Fetching headers for {len(uids)} emails in one round trip: {message_set}")
+    _, fetch_data = await mail.uid('FETCH', message_set, SUMMARY_HEADER_FIELDS)
     
-    # Sanitize the body text
-    body = safe_text_serialization(body)
+    headers_by_uid = {}
+    for item in parse_fetch_response(fetch_data):
+        raw_headers = get_body_section(item, "BODY[HEADER")
+        if raw_headers is not None and item.get("UID"):
+            headers_by_uid[item["UID"]] = raw_headers
     
-    return {
-        "from": decode_header_safely(email_body.get("From", "Unknown")),
-        "to": decode_header_safely(email_body.get("To", "Unknown")),
-        "date": email_body.get("Date", "Unknown"),
-        "subject": decode_header_safely(email_body.get("Subject", "No Subject")),
-        "content": body
-    }
+    # Keep the order the caller asked for; the server may answer in any order
+    email_list = []
+    for uid in uids:
+        if uid in headers_by_uid:
+            try:
+                email_id = encode_email_id(mail.selected_mailbox, mail.uidvalidity, uid)
+                email_list.append(format_email_summary(email_id, headers_by_uid[uid]))
+            except Exception as e:
+                # Skip problematic emails
+                logging.debug(f"Could not parse headers for email UID {uid}: {str(e)}")
+    return email_list
 
-async def search_emails_async(mail: imaplib.IMAP4_SSL, search_criteria: str) -> list[dict]:
-    """Asynchronously search emails with timeout."""
-    loop = asyncio.get_event_loop()
+async def search_emails_async(mail: IMAPSession, search_criteria: list) -> list[int]:
+    """Return the UIDs of all emails matching the criteria, in ascending order."""
     try:
         logging.debug(f"Searching emails with criteria: {search_criteria}")
-        _, messages = await loop.run_in_executor(None, lambda: mail.search(None, search_criteria))
-        if not messages[0]:
+        _, messages = await mail.uid_search(search_criteria)
+        if not messages or not messages[0]:
             logging.debug("No emails found matching the search criteria")
             return []
-            
-        logging.debug(f"Found {len(messages[0].split())} emails matching the criteria")
-        email_list = []
-        for num in messages[0].split()[:MAX_EMAILS]:  # Limit to MAX_EMAILS
-            _, msg_data = await loop.run_in_executor(None, lambda: mail.fetch(num, '(RFC822)'))
-            email_list.append(format_email_summary(msg_data))
-            
-        return email_list
+        
+        uids = sorted(int(uid) for uid in messages[0].split())
+        logging.debug(f"Found {len(uids)} emails matching the criteria")
+        return uids
     except Exception as e:
         logging.error(f"Error searching emails: {str(e)}")
         raise Exception(f"Error searching emails: {str(e)}")
 
-async def get_email_content_async(mail: imaplib.IMAP4_SSL, email_id: str) -> dict:
-    """Asynchronously get full content of a specific email."""
-    loop = asyncio.get_event_loop()
-    try:
-        logging.debug(f"Fetching email content for ID: {email_id}")
-        _, msg_data = await loop.run_in_executor(None, lambda: mail.fetch(email_id, '(RFC822)'))
-        logging.debug(f"Successfully fetched email content for ID: {email_id}")
-        return format_email_content(msg_data)
-    except Exception as e:
-        logging.error(f"Error fetching email content: {str(e)}")
-        raise Exception(f"Error fetching email content: {str(e)}")
+async def search_window_async(mail: IMAPSession, search_criteria: list, offset: int, limit: int) -> tuple[int, list[int], list[int] | None]:
+    """Find one page of matches, newest first, transferring as few UIDs as the server allows.
 
-async def count_emails_async(mail: imaplib.IMAP4_SSL, search_criteria: str) -> int:
-    """Asynchronously count emails matching the search criteria."""
-    loop = asyncio.get_event_loop()
+    Returns the number of matches, the UIDs of the `limit` matches that follow
+    the newest `offset` ones (newest first), and all matching UIDs oldest
+    first when the server sent them, or None when only the page crossed the
+    wire. With SORT, newest means by Date header; otherwise by arrival.
+
+    ESORT or ESEARCH with PARTIAL return just the page and the count; plain
+    SORT, or ESEARCH with a compact ALL message-set, return the whole list.
+    Servers that reject an extension fall back to a plain UID SEARCH.
+    """
+    first, last = offset + 1, offset + limit
     try:
-        _, messages = await loop.run_in_executor(None, lambda: mail.search(None, search_criteria))
-        return len(messages[0].split()) if messages[0] else 0
+        if mail.has_capability('SORT'):
+            if mail.has_capability('ESORT') and (mail.has_capability('CONTEXT=SORT') or mail.has_capability('PARTIAL')):
+                typ, data = await mail.uid_sort(SEARCH_SORT_ORDER, search_criteria, f"(COUNT PARTIAL {first}:{last})")
+                if typ == 'OK':
+                    results = parse_esearch_response(data)
+                    return int(results.get("COUNT", 0)), expand_message_set(results.get("PARTIAL", "")), None
+            else:
+                typ, data = await mail.uid_sort(SEARCH_SORT_ORDER, search_criteria)
+                if typ == 'OK':
+                    uids = [int(uid) for uid in (data[0] or b'').split()][::-1]
+                    return len(uids), SearchCursors.page(uids, offset, limit)[::-1], uids
+            logging.debug(f"SORT was refused ({typ}), falling back to UID SEARCH")
+        elif mail.has_capability('ESEARCH'):
+            if mail.has_capability('PARTIAL'):
+                # Negative ranges count from the newest match (RFC 9394)
+                typ, data = await mail.uid_search(search_criteria, f"(COUNT PARTIAL -{last}:-{first})")
+                if typ == 'OK':
+                    results = parse_esearch_response(data)
+                    return int(results.get("COUNT", 0)), sorted(expand_message_set(results.get("PARTIAL", "")), reverse=True), None
+            else:
+                typ, data = await mail.uid_search(search_criteria, "(COUNT ALL)")
+                if typ == 'OK':
+                    uids = sorted(expand_message_set(parse_esearch_response(data).get("ALL", "")))
+                    return len(uids), SearchCursors.page(uids, offset, limit)[::-1], uids
+            logging.debug(f"ESEARCH was refused ({typ}), falling back to UID SEARCH")
+    except imaplib.IMAP4.abort:
+        raise
+    except imaplib.IMAP4.error as e:
+        logging.debug(f"Extended search failed, falling back to UID SEARCH: {str(e)}")
+    
+    uids = await search_emails_async(mail, search_criteria)
+    return len(uids), SearchCursors.page(uids, offset, limit)[::-1], uids
+
+def summary_sort_key(summary: dict) -> float:
+    """Sort key for merging summaries by their Date header; undated emails sort last."""
+    try:
+        return email.utils.parsedate_to_datetime(summary["date"]).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return float("-inf")
+
+async def search_folder_async(account: Account, folder: str, since: datetime, before: datetime, keyword: str,
+                              search_in: list[str], exclude_keyword: str, gmail_raw: str,
+                              limit: int) -> tuple[int, list[dict]]:
+    """Search one folder on its own pooled connection: (number of matches, summaries of the newest `limit`)."""
+    # The local index only knows subjects, as in the single-folder search
+    store = account.metadata_store
+    if (store is not None and store.is_fresh(folder) and search_in == ["subject"]
+            and not exclude_keyword and not gmail_raw):
+        uids = store.search_uids(folder, since, before, keyword)
+        return len(uids), store.summaries(folder, uids[-limit:])
+    
+    async with account.imap_pool.acquire(folder) as mail:
+        if gmail_raw and not mail.has_capability('X-GM-EXT-1'):
+            raise ValueError("gmail_raw is only supported on Gmail servers (X-GM-EXT-1)")
+        status, _ = await mail.select(folder, readonly=True)
+        if status != 'OK':
+            raise Exception("Could not select the folder")
+        criteria = build_search_criteria(since, before, keyword, search_in, exclude_keyword, gmail_raw)
+        count, page_uids, _ = await search_window_async(mail, criteria, 0, limit)
+        return count, await fetch_email_summaries(mail, page_uids)
+
+async def search_folders_async(targets: list[tuple[Account, str]], deadline: float, limit: int,
+                               **criteria) -> tuple[int, list[dict], dict[tuple[Account, str], str]]:
+    """Search several (account, folder) pairs concurrently, one pooled connection each.
+
+    Returns the total number of matches, the newest `limit` summaries across
+    all folders sorted by date and labelled with their account's name, and
+    the folders that failed or did not answer before the deadline (in
+    seconds) with the reason. Whatever finished in time is returned; the rest
+    is cancelled.
+    """
+    if not targets:
+        return 0, [], {}
+    tasks = {
+        asyncio.create_task(search_folder_async(account, folder, limit=limit, **criteria)): (account, folder)
+        for account, folder in targets
+    }
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    # Let the cancelled searches hand their connections back to the pool before returning
+    await asyncio.gather(*pending, return_exceptions=True)
+    
+    total = 0
+    summaries = []
+    problems = {tasks[task]: "did not answer in time" for task in pending}
+    for task in done:
+        account, folder = tasks[task]
+        if task.exception() is not None:
+            logging.warning(f"Searching {folder} in account {account.name} failed: {str(task.exception())}")
+            problems[account, folder] = str(task.exception()) or type(task.exception()).__name__
+            continue
+        count, folder_summaries = task.result()
+        total += count
+        summaries.extend({**summary, "account": account.name} for summary in folder_summaries)
+    summaries.sort(key=summary_sort_key, reverse=True)
+    return total, summaries[:limit], problems
+
+class SearchCursors:
+    """Result sets of recent searches, kept so later pages only fetch their own slice.
+
+    A cursor names a stored UID list plus an offset from its newest end, so the
+    next page costs one FETCH of headers instead of a repeated SEARCH. When the
+    server only sent the first page (ESORT/ESEARCH PARTIAL), the search
+    criteria are kept instead and each page asks for its own window.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._results: dict[str, dict] = {}
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for token in [t for t, r in self._results.items() if r["expires"] <= now]:
+            del self._results[token]
+
+    def store(self, folder: str, uidvalidity: int | None, uids: list[int] | None,
+              local: bool = False, criteria: list | None = None) -> str:
+        """Keep a result set, or the criteria that produce it, and return the token that identifies it."""
+        self._expire()
+        token = secrets.token_urlsafe(12)
+        self._results[token] = {
+            "folder": folder,
+            "uidvalidity": uidvalidity,
+            "uids": uids,
+            "criteria": criteria,
+            "local": local,
+            "expires": time.monotonic() + self.ttl,
+        }
+        return token
+
+    def load(self, cursor: str) -> tuple[dict, int]:
+        """Return the stored result set and offset for a cursor; raise ValueError if unknown or expired."""
+        self._expire()
+        token, _, offset = cursor.rpartition(".")
+        if token not in self._results or not offset.isdigit():
+            raise ValueError("This cursor is invalid or has expired. Please run the search again.")
+        results = self._results[token]
+        # Paging through a result set keeps it alive
+        results["expires"] = time.monotonic() + self.ttl
+        return results, int(offset)
+
+    @staticmethod
+    def page(uids: list[int], offset: int, page_size: int) -> list[int]:
+        """The page_size UIDs before the newest `offset` ones, oldest first."""
+        end = len(uids) - offset
+        return uids[max(end - page_size, 0):max(end, 0)]
+
+    @staticmethod
+    def next_cursor(token: str, total: int, offset: int, page_size: int) -> str | None:
+        return f"{token}.{offset + page_size}" if offset + page_size < total else None
+
+async def fetch_body_structure(account: Account, mail: IMAPSession, uid: str) -> tuple[bytes, list[dict]]:
+    """Fetch the display headers and flattened BODYSTRUCTURE of one email in a single round trip."""
+    message_cache = account.message_cache
+    if message_cache is not None:
+        cached = message_cache.get_structure(mail.selected_mailbox, mail.uidvalidity, uid)
+        if cached is not None:
+            return cached
+    _, msg_data = await mail.uid('FETCH', uid, f'(UID BODYSTRUCTURE {CONTENT_HEADER_FIELDS})')
+    for item in parse_fetch_response(msg_data):
+        if item.get("UID") == str(uid) and isinstance(item.get("BODYSTRUCTURE"), list):
+            raw_headers = get_body_section(item, "BODY[HEADER") or b""
+            parts = parse_bodystructure(item["BODYSTRUCTURE"])
+            if message_cache is not None:
+                message_cache.put_structure(mail.selected_mailbox, mail.uidvalidity, uid, raw_headers, parts)
+            return raw_headers, parts
+    raise Exception(f"No email with UID {uid} in the selected folder")
+
+async def fetch_body_part(mail: IMAPSession, uid: str, part: str, start: int | None = None, length: int | None = None) -> bytes:
+    """Fetch the raw (still transfer-encoded) bytes of one body part without setting \\Seen.
+
+    With `start` and `length` only that byte range is transferred (IMAP partial fetch).
+    """
+    section = f'BODY.PEEK[{part}]'
+    if start is not None and length is not None:
+        section += f'<{start}.{length}>'
+    _, msg_data = await mail.uid('FETCH', uid, f'(UID {section})')
+    for item in parse_fetch_response(msg_data):
+        if item.get("UID") == str(uid):
+            data = get_body_section(item, f"BODY[{part}]")
+            if data is not None:
+                return data
+    raise Exception(f"Part {part} of email UID {uid} could not be fetched")
+
+async def read_text_part(read, text_part: dict, offset: int = 0, max_bytes: int | None = None) -> tuple[str, int | None]:
+    """Decode a text part, or only the range starting at `offset` when `max_bytes` is given.
+
+    `read(start, length)` returns the raw part bytes, or the whole part when
+    both are None. Returns the text and the offset of the next range, or
+    None once the end of the part is reached.
+    """
+    total_bytes = text_part["size"]
+    if max_bytes is None and not offset:
+        data = await read(None, None)
+        return decode_part_payload(data, text_part["encoding"], text_part["charset"]), None
+    if offset >= total_bytes:
+        return "", None
+    # Fetch one byte early so line-based encodings can be realigned
+    lead = 1 if offset and text_part["encoding"] in ("base64", "quoted-printable") else 0
+    length = (max_bytes or total_bytes - offset) + lead
+    while True:
+        data = await read(offset - lead, length)
+        at_end = len(data) < length or offset - lead + len(data) >= total_bytes
+        body, end = decode_part_range(data, text_part["encoding"], text_part["charset"], lead, at_end)
+        if at_end:
+            return body, None
+        if end > lead:
+            return body, offset - lead + end
+        # No complete line or character fits in max_bytes: read a longer range rather than cut one
+        length *= 2
+
+def build_email_content(raw_headers: bytes, body: str, offset: int, next_offset: int | None, total_bytes: int) -> dict:
+    headers = email.message_from_bytes(raw_headers)
+    return {
+        "from": decode_header_safely(headers.get("From", "Unknown")),
+        "to": decode_header_safely(headers.get("To", "Unknown")),
+        "date": headers.get("Date", "Unknown"),
+        "subject": decode_header_safely(headers.get("Subject", "No Subject")),
+        "content": safe_text_serialization(body),
+        "offset": offset,
+        "next_offset": next_offset,
+        "total_bytes": total_bytes,
+    }
+
+async def get_email_content_async(account: Account, mail: IMAPSession, uid: str, offset: int = 0, max_bytes: int | None = None,
+                                  structure: tuple[bytes, list[dict]] | None = None) -> dict:
+    """Asynchronously get the headers and text body of a specific email by UID.
+
+    Only the BODYSTRUCTURE and the chosen text part are transferred, so
+    attachments are never downloaded just to display the message. With
+    `max_bytes`, only about that many bytes of the encoded text part are
+    fetched, starting at `offset`; "next_offset" in the result is where the
+    following range starts, or None once the end of the body is reached.
+    Whole text parts are kept in the message cache when it is enabled.
+    `structure` is the (headers, parts) pair when already read from it.
+    """
+    try:
+        logging.debug(f"Fetching email content for UID: {uid}")
+        raw_headers, parts = structure or await fetch_body_structure(account, mail, uid)
+        message_cache = account.message_cache
+        body = ""
+        next_offset = None
+        text_part = select_text_part(parts)
+        if text_part:
+            logging.debug(f"Fetching part {text_part['part']} ({text_part['type']}, {text_part['size']} bytes) of UID {uid}")
+            section = f"BODY[{text_part['part']}]"
+            
+            async def read(start, length):
+                if message_cache is not None:
+                    cached = message_cache.read(mail.selected_mailbox, mail.uidvalidity, uid, section, start, length)
+                    if cached is not None:
+                        return cached
+                data = await fetch_body_part(mail, uid, text_part["part"], start, length)
+                if message_cache is not None and start is None:
+                    message_cache.put(mail.selected_mailbox, mail.uidvalidity, uid, section, data)
+                return data
+            
+            body, next_offset = await read_text_part(read, text_part, offset, max_bytes)
+        logging.debug(f"Successfully fetched email content for UID: {uid}")
+        return build_email_content(raw_headers, body, offset, next_offset, text_part["size"] if text_part else 0)
     except Exception as e:
-        raise Exception(f"Error counting emails: {str(e)}")
+        logging.error(f"Error fetching email content: {str(e)}")
+        raise Exception(f"Error fetching email content: {str(e)}")
+
+async def get_cached_email_content(account: Account, folder: str, uidvalidity: int, uid: str, offset: int = 0,
+                                   max_bytes: int | None = None) -> tuple[dict | None, tuple[bytes, list[dict]] | None]:
+    """Answer get-email-content from the message cache alone.
+
+    Returns the content, or None if anything is missing, and the cached
+    (headers, parts) pair for get_email_content_async to reuse. Missing
+    entries are probed without counting, so the fetch path counts each
+    lookup once in the cache statistics.
+    """
+    message_cache = account.message_cache
+    if message_cache is None or not message_cache.contains(folder, uidvalidity, uid, "STRUCTURE"):
+        return None, None
+    cached = message_cache.get_structure(folder, uidvalidity, uid)
+    if cached is None:
+        return None, None
+    raw_headers, parts = cached
+    text_part = select_text_part(parts)
+    if text_part is None:
+        return build_email_content(raw_headers, "", offset, None, 0), cached
+    section = f"BODY[{text_part['part']}]"
+    if not message_cache.contains(folder, uidvalidity, uid, section):
+        return None, cached
+    
+    async def read(start, length):
+        data = message_cache.read(folder, uidvalidity, uid, section, start, length)
+        if data is None:
+            # Evicted in the meantime
+            raise LookupError(section)
+        return data
+    
+    try:
+        body, next_offset = await read_text_part(read, text_part, offset, max_bytes)
+    except LookupError:
+        return None, cached
+    return build_email_content(raw_headers, body, offset, next_offset, text_part["size"]), cached
+
+def attachment_cache_path(account: Account, folder: str, uidvalidity: int | None, uid: str, part: dict) -> str:
+    """Local file an attachment is saved to; UIDs are immutable, so a saved file never goes stale."""
+    filename = os.path.basename((part["filename"] or "").replace("\\", "/")).strip(". ")
+    return os.path.join(
+        account.attachment_dir,
+        urllib.parse.quote(folder, safe=""),
+        str(uidvalidity),
+        str(uid),
+        part["part"],
+        filename or f"part-{part['part']}",
+    )
+
+async def save_attachment_async(mail: IMAPSession, uid: str, part: dict, path: str) -> int:
+    """Stream one body part to `path`, decoding it chunk by chunk; returns the decoded size.
+
+    The part is fetched in ranges of ATTACHMENT_CHUNK_SIZE encoded bytes and
+    each range is decoded and written before the next one is requested, so the
+    attachment never has to fit in memory. The file only appears at `path`
+    once it is complete.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial_path = path + ".part"
+    carry = b""
+    written = 0
+    offset = 0
+    try:
+        with open(partial_path, "wb") as f:
+            while True:
+                async with asyncio.timeout(SEARCH_TIMEOUT):
+                    data = await fetch_body_part(mail, uid, part["part"], offset, ATTACHMENT_CHUNK_SIZE)
+                offset += len(data)
+                final = len(data) < ATTACHMENT_CHUNK_SIZE
+                decoded, carry = decode_transfer_chunk(carry + data, part["encoding"], final)
+                f.write(decoded)
+                written += len(decoded)
+                if final:
+                    break
+        os.replace(partial_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(partial_path)
+        raise
+    logging.debug(f"Saved part {part['part']} of UID {uid} ({written} bytes) to {path}")
+    return written
+
+def message_id_list(value: str | None) -> list[str]:
+    """The <message-id>s in a References or In-Reply-To header, in order."""
+    return re.findall(r'<[^<>\s]+>', value or "")
+
+def thread_references(row: dict) -> list[str]:
+    """A message's ancestors, oldest first, from its References and In-Reply-To headers."""
+    references = message_id_list(row.get("refs"))
+    # Some clients only set In-Reply-To, or a References list without the direct parent
+    for message_id in message_id_list(row.get("in_reply_to"))[:1]:
+        if message_id not in references:
+            references.append(message_id)
+    return references
+
+class ThreadGraph:
+    """Reply graph of one folder, built from Message-ID, In-Reply-To and References.
+
+    Follows the JWZ threading algorithm that THREAD=REFERENCES is based on,
+    with containers indexed by Message-ID so adding a message costs one step
+    per reference rather than a pass over the folder. Messages are added in
+    UID order, so only UIDs above max_uid need to be added to keep it current.
+    """
+
+    def __init__(self, uidvalidity: int | None):
+        self.uidvalidity = uidvalidity
+        self.max_uid = 0
+        # Message-ID -> {"uid": UID or None for a referenced but absent message, "parent", "children"}
+        self.containers: dict[str, dict] = {}
+        self.by_uid: dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.by_uid)
+
+    def _container(self, message_id: str) -> dict:
+        container = self.containers.get(message_id)
+        if container is None:
+            container = self.containers[message_id] = {"uid": None, "parent": None, "children": []}
+        return container
+
+    def _is_ancestor(self, message_id: str, of: str) -> bool:
+        while of is not None:
+            if of == message_id:
+                return True
+            of = self.containers[of]["parent"]
+        return False
+
+    def _link(self, parent: str, child: str) -> None:
+        old_parent = self.containers[child]["parent"]
+        if old_parent is not None:
+            self.containers[old_parent]["children"].remove(child)
+        self.containers[child]["parent"] = parent
+        self.containers[parent]["children"].append(child)
+
+    def add(self, uid: int, message_id: str, in_reply_to: str, refs: str) -> None:
+        """Add one message given its raw threading headers."""
+        uid = int(uid)
+        if uid in self.by_uid:
+            return
+        ids = message_id_list(message_id)
+        key = ids[0] if ids else f"<{uid}@uid>"
+        if key in self.containers and self.containers[key]["uid"] is not None:
+            # A second copy of the same message threads as its own message
+            key = f"{key}#{uid}"
+        container = self._container(key)
+        container["uid"] = uid
+        self.by_uid[uid] = key
+        self.max_uid = max(self.max_uid, uid)
+
+        references = [ref for ref in thread_references({"refs": refs, "in_reply_to": in_reply_to}) if ref != key]
+        # Chain the references, keeping links already known from earlier messages
+        for parent, child in zip(references, references[1:]):
+            self._container(parent)
+            self._container(child)
+            if self.containers[child]["parent"] is None and not self._is_ancestor(child, parent):
+                self._link(parent, child)
+        # The message's own References are the best word on its parent
+        if references:
+            parent = references[-1]
+            self._container(parent)
+            if self.containers[key]["parent"] != parent and not self._is_ancestor(key, parent):
+                self._link(parent, key)
+
+    def thread_of(self, uid: int) -> list[tuple[int, int]]:
+        """Return the thread containing a UID as (UID, depth) pairs in display order.
+
+        Containers for messages that are not in the folder are left out and
+        their children take their place; siblings are ordered by the earliest
+        UID in their subtree.
+        """
+        key = self.by_uid.get(int(uid))
+        if key is None:
+            return []
+        while self.containers[key]["parent"] is not None:
+            key = self.containers[key]["parent"]
+
+        # Earliest UID of every subtree, children before parents
+        subtree = [key]
+        for message_id in subtree:
+            subtree.extend(self.containers[message_id]["children"])
+        first_uid: dict[str, int] = {}
+        for message_id in reversed(subtree):
+            container = self.containers[message_id]
+            uids = [first_uid[child] for child in container["children"]]
+            if container["uid"] is not None:
+                uids.append(container["uid"])
+            first_uid[message_id] = min(uids, default=0)
+
+        thread = []
+        pending = [(key, 0)]
+        while pending:
+            message_id, depth = pending.pop()
+            container = self.containers[message_id]
+            child_depth = depth
+            if container["uid"] is not None:
+                thread.append((container["uid"], depth))
+                child_depth = depth + 1
+            children = sorted(container["children"], key=first_uid.__getitem__)
+            pending.extend((child, child_depth) for child in reversed(children))
+        return thread
+
+def forget_thread_graph(account: Account, folder: str, events: set[str]) -> None:
+    """Drop a folder's thread graph when messages were removed from it."""
+    if events & {"EXPUNGE", "VANISHED"}:
+        account.thread_graphs.pop(folder, None)
+
+async def update_thread_graph(account: Account, folder: str, mail: IMAPSession | None) -> ThreadGraph:
+    """Bring a folder's cached thread graph up to date and return it.
+
+    New messages come from the metadata store when it is fresh and otherwise
+    from one FETCH of the threading headers of UIDs above the graph's highest,
+    which needs `mail` to have the folder selected. The graph is rebuilt when
+    UIDVALIDITY changes or messages were removed from the store.
+    """
+    folder = normalize_mailbox(folder)
+    graph = account.thread_graphs.get(folder)
+    store = account.metadata_store
+    if mail is None:
+        uidvalidity = (store.get_folder_state(folder) or {}).get("uidvalidity")
+        if graph is None or graph.uidvalidity != uidvalidity:
+            graph = ThreadGraph(uidvalidity)
+        rows = store.thread_headers(folder, graph.max_uid)
+        if len(graph) and len(graph) + len(rows) != store.message_count(folder):
+            # Messages were removed from the store since the graph was built
+            graph = ThreadGraph(uidvalidity)
+            rows = store.thread_headers(folder)
+    else:
+        if graph is None or graph.uidvalidity != mail.uidvalidity:
+            graph = ThreadGraph(mail.uidvalidity)
+        _, data = await mail.uid('FETCH', f"{graph.max_uid + 1}:*", THREAD_HEADER_FIELDS)
+        # n:* always matches the highest UID, even when it is below n
+        rows = [row for row in map(metadata_row_from_fetch, parse_fetch_response(data))
+                if row and row["uid"] > graph.max_uid]
+    for row in sorted(rows, key=lambda row: row["uid"]):
+        graph.add(row["uid"], row["message_id"], row["in_reply_to"], row["refs"])
+    account.thread_graphs[folder] = graph
+    logging.debug(f"Thread graph of {folder} in account {account.name} has {len(graph)} messages after adding {len(rows)}")
+    return graph
+
+async def thread_on_server(mail: IMAPSession, uid: int) -> list[tuple[int, int]] | None:
+    """Thread a message with THREAD=REFERENCES, or None if the server could not place it.
+
+    Only messages that mention the thread's root are threaded, so the server
+    does the work for the conversation rather than for the whole folder.
+    """
+    _, data = await mail.uid('FETCH', str(uid), THREAD_HEADER_FIELDS)
+    row = next((row for row in map(metadata_row_from_fetch, parse_fetch_response(data))
+                if row and row["uid"] == uid), None)
+    if row is None:
+        raise Exception(f"No email with UID {uid} in folder {mail.selected_mailbox}")
+    references = thread_references(row)
+    own_ids = message_id_list(row["message_id"])
+    root = references[0] if references else (own_ids[0] if own_ids else None)
+    if root is None:
+        return [(uid, 0)]
+    quoted_root = imap_search_string(root)
+    criteria = ["OR", "OR", "HEADER", "Message-ID", quoted_root,
+                "HEADER", "References", quoted_root, "HEADER", "In-Reply-To", quoted_root]
+    typ, data = await mail.uid_thread("REFERENCES", criteria)
+    if typ != 'OK':
+        return None
+    return next((thread for thread in parse_thread_response(data) if any(u == uid for u, _ in thread)), None)
+
+async def get_thread_async(account: Account, folder: str, uid: int, mail: IMAPSession | None) -> list[tuple[int, int]]:
+    """Return the thread containing a message as (UID, depth) pairs in display order.
+
+    Without `mail` the thread comes from the cached graph, kept current from
+    the metadata store. Otherwise a server offering THREAD=REFERENCES threads
+    the conversation in one command, and other servers update the graph
+    with the headers of new UIDs only.
+    """
+    if mail is not None and mail.has_capability('THREAD=REFERENCES'):
+        try:
+            thread = await thread_on_server(mail, uid)
+            if thread:
+                return thread
+            logging.debug(f"THREAD did not place UID {uid}, threading locally")
+        except imaplib.IMAP4.abort:
+            raise
+        except imaplib.IMAP4.error as e:
+            logging.debug(f"THREAD failed, threading locally: {str(e)}")
+    graph = await update_thread_graph(account, folder, mail)
+    return graph.thread_of(uid)
+
+def check_selected_email_folder(account: Account, mail: IMAPSession, folder: str, uidvalidity: int | None, email_id: str) -> str | None:
+    """Make sure a UID can be used in the selected folder; returns an error message if not."""
+    # UIDs only identify a message within their own folder and UIDVALIDITY
+    if mail.selected_mailbox != folder:
+        return f"Could not open folder '{folder}' to fetch email {email_id}."
+    if uidvalidity is not None and mail.uidvalidity is not None and uidvalidity != mail.uidvalidity:
+        if account.fulltext_index is not None:
+            account.fulltext_index.forget_folder(folder, keep_uidvalidity=mail.uidvalidity)
+        return f"Email ID {email_id} is no longer valid because folder '{folder}' was rebuilt on the server. Please search again."
+    return None
+
+def resolve_timezone(name: str | None = None) -> tzinfo:
+    """Return the named IANA timezone, or the configured/system one when no name is given."""
+    name = name or EMAIL_TIMEZONE
+    if not name:
+        return datetime.now().astimezone().tzinfo
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}. Use an IANA name such as 'Europe/Zurich'.")
+
+def bucket_by_day(timestamps: list[datetime], tz: tzinfo) -> dict[date, int]:
+    """Count INTERNALDATEs per calendar day in the given timezone."""
+    counts: dict[date, int] = {}
+    for timestamp in timestamps:
+        if timestamp is not None:
+            day = timestamp.astimezone(tz).date()
+            counts[day] = counts.get(day, 0) + 1
+    return counts
+
+def group_counts(daily_counts: dict[date, int], start_day: date, end_day: date, granularity: str = "day") -> list[tuple[str, int]]:
+    """Roll daily counts up into day, week (starting Monday) or month buckets."""
+    buckets: dict[str, int] = {}
+    day = start_day
+    while day <= end_day:
+        if granularity == "week":
+            label = (day - timedelta(days=day.weekday())).isoformat()
+        elif granularity == "month":
+            label = day.strftime("%Y-%m")
+        else:
+            label = day.isoformat()
+        buckets[label] = buckets.get(label, 0) + daily_counts.get(day, 0)
+        day += timedelta(days=1)
+    return list(buckets.items())
+
+def forget_closed_day_counts(account: Account, folder: str, events: set[str]) -> None:
+    """Drop memoized counts for a folder when messages were added to or removed from it.
+
+    A message moved or copied in keeps its INTERNALDATE, so EXISTS can change
+    the count of a past day; after a reconnect changes may have been missed.
+    """
+    if events & {"EXISTS", "EXPUNGE", "VANISHED", "RECONNECT"}:
+        for key in [key for key in account.closed_day_counts if key[0] == folder]:
+            del account.closed_day_counts[key]
+
+async def count_daily_emails_async(account: Account, mail: IMAPSession, start_day: date, end_day: date, tz: tzinfo) -> dict[date, int]:
+    """Count emails per day with one SEARCH and one batched INTERNALDATE FETCH.
+
+    Days that have already ended in the given timezone are memoized for
+    CLOSED_DAY_COUNT_TTL seconds; only the span of days without a memoized
+    count is queried. Messages moved or copied into the folder keep their old
+    INTERNALDATE and can still land on a past day, so the memo also expires,
+    and forget_closed_day_counts clears it when IDLE reports a change.
+    """
+    folder = mail.selected_mailbox
+    closed_day_counts = account.closed_day_counts
+    tz_name = str(tz)
+    today = datetime.now(tz).date()
+    now = time.monotonic()
+    counts: dict[date, int] = {}
+    missing: list[date] = []
+    day = start_day
+    while day <= end_day:
+        entry = closed_day_counts.get((folder, mail.uidvalidity, tz_name, day))
+        if entry is not None and entry[0] > now:
+            counts[day] = entry[1]
+        else:
+            missing.append(day)
+        day += timedelta(days=1)
+    if not missing:
+        logging.debug(f"All daily counts for {folder} answered from memoized closed days")
+        return counts
+    
+    # SINCE/BEFORE ignore time and zone, so widen by a day on each side
+    since = (min(missing) - timedelta(days=1)).strftime("%d-%b-%Y")
+    before = (max(missing) + timedelta(days=2)).strftime("%d-%b-%Y")
+    _, messages = await mail.uid('SEARCH', f'SINCE "{since}" BEFORE "{before}"')
+    uids = (messages[0] or b'').split()
+    timestamps = []
+    if uids:
+        _, fetch_data = await mail.uid('FETCH', compress_message_set(uids), '(UID INTERNALDATE)')
+        timestamps = [parse_internaldate(item.get("INTERNALDATE")) for item in parse_fetch_response(fetch_data)]
+    fetched = bucket_by_day(timestamps, tz)
+    logging.debug(f"Bucketed {len(timestamps)} INTERNALDATEs from {folder} into {len(missing)} days")
+    
+    for day in missing:
+        counts[day] = fetched.get(day, 0)
+        if day < today:
+            closed_day_counts[(folder, mail.uidvalidity, tz_name, day)] = (now + CLOSED_DAY_COUNT_TTL, counts[day])
+    return counts
+
+def build_email_message(
+    sender: str,
+    to_addresses: list[str],
+    subject: str,
+    content: str,
+    cc_addresses: list[str] | None = None
+) -> MIMEMultipart:
+    """Create a plain text email from the account's address."""
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = ', '.join(to_addresses)
+    if cc_addresses:
+        msg['Cc'] = ', '.join(cc_addresses)
+    msg['Subject'] = subject
+    msg['Date'] = email.utils.formatdate(localtime=True)
+    msg['Message-ID'] = email.utils.make_msgid(domain=sender.split('@')[1])
+    
+    # Add body
+    msg.attach(MIMEText(content, 'plain', 'utf-8'))
+    return msg
+
+def queue_sent_copy(account: Account, msg: MIMEMultipart) -> None:
+    """Hand a sent email to the account's background Sent folder queue."""
+    # Saving a copy to the Sent folder happens in the background so the
+    # caller only waits for SMTP; the spool survives restarts
+    try:
+        account.sent_queue.enqueue(msg.as_string().encode('utf-8'), msg['Message-ID'], msg['Subject'])
+    except Exception as e:
+        logging.error(f"Error queueing the copy for the Sent folder: {str(e)}")
+        # Don't raise the exception, as the email was successfully sent
+        # This is just a secondary operation
+
+def is_temporary_smtp_error(error: Exception) -> bool:
+    """Whether sending again later may succeed: dropped connections and 4xx replies."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, OSError, asyncio.TimeoutError))
 
 async def send_email_async(
+    account: Account,
     to_addresses: list[str],
     subject: str,
     content: str,
@@ -288,291 +2410,1401 @@ async def send_email_async(
 ) -> None:
     """Asynchronously send an email."""
     try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_CONFIG["email"]
-        msg['To'] = ', '.join(to_addresses)
-        if cc_addresses:
-            msg['Cc'] = ', '.join(cc_addresses)
-        msg['Subject'] = subject
-        msg['Date'] = email.utils.formatdate(localtime=True)
-        msg['Message-ID'] = email.utils.make_msgid(domain=EMAIL_CONFIG["email"].split('@')[1])
+        msg = build_email_message(account.config["email"], to_addresses, subject, content, cc_addresses)
         
-        # Add body
-        msg.attach(MIMEText(content, 'plain', 'utf-8'))
+        # Send over a pooled connection, so only the first send pays for the handshake
+        all_recipients = to_addresses + (cc_addresses or [])
+        logging.debug(f"Sending email to: {all_recipients}")
+        async with account.smtp_pool.acquire() as smtp:
+            result = await smtp.send_message(msg, account.config["email"], all_recipients)
         
-        # Connect to SMTP server and send email
-        def send_sync():
-            with smtplib.SMTP(EMAIL_CONFIG["smtp_server"], EMAIL_CONFIG["smtp_port"]) as server:
-                server.set_debuglevel(1)  # Enable debug output
-                logging.debug(f"Connecting to {EMAIL_CONFIG['smtp_server']}:{EMAIL_CONFIG['smtp_port']}")
-                
-                # Start TLS
-                logging.debug("Starting TLS")
-                server.starttls()
-                
-                # Login
-                logging.debug(f"Logging in as {EMAIL_CONFIG['email']}")
-                server.login(EMAIL_CONFIG["email"], EMAIL_CONFIG["password"])
-                
-                # Send email
-                all_recipients = to_addresses + (cc_addresses or [])
-                logging.debug(f"Sending email to: {all_recipients}")
-                result = server.send_message(msg, EMAIL_CONFIG["email"], all_recipients)
-                
-                if result:
-                    # send_message returns a dict of failed recipients
-                    raise Exception(f"Failed to send to some recipients: {result}")
-                
-                logging.debug("Email sent successfully")
+        if result:
+            # send_message returns a dict of failed recipients
+            raise Exception(f"Failed to send to some recipients: {result}")
         
-        # Run the synchronous send function in the executor
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, send_sync)
+        logging.debug("Email sent successfully")
+        queue_sent_copy(account, msg)
+        return
+            
+    except Exception as e:
+        logging.error(f"Error in send_email_async: {str(e)}")
+        raise Exception(f"Failed to send email: {str(e)}")
+
+class RateLimiter:
+    """Spaces out calls so no more than `rate` start per second (0 means unlimited)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def address_list(value) -> list[str]:
+    """Accept one address or a list of addresses, as send-email does."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [str(address) for address in value]
+
+def render_batch_messages(arguments: dict) -> list[dict]:
+    """Expand send-emails-batch arguments into a list of {to, cc, subject, content} messages.
+
+    Either `messages` lists complete emails, or `template` gives a subject
+    and content with ${name} placeholders that are filled in from each entry
+    of `recipients`. A message that cannot be rendered carries an `error`.
+    """
+    messages = arguments.get("messages")
+    template = arguments.get("template")
+    if bool(messages) == bool(template):
+        raise ValueError("Provide either messages or template with recipients")
+    
+    if messages:
+        rendered = [
+            {"to": address_list(message.get("to")), "cc": address_list(message.get("cc")),
+             "subject": message.get("subject", ""), "content": message.get("content", "")}
+            for message in messages
+        ]
+    else:
+        recipients = arguments.get("recipients") or []
+        if not recipients:
+            raise ValueError("A template needs at least one entry in recipients")
+        subject_template = string.Template(template.get("subject", ""))
+        content_template = string.Template(template.get("content", ""))
+        rendered = []
+        for recipient in recipients:
+            to_addresses = address_list(recipient.get("to"))
+            # The recipient's own address can be used as ${to} in the template
+            variables = {"to": ", ".join(to_addresses), **(recipient.get("variables") or {})}
+            message = {"to": to_addresses, "cc": address_list(recipient.get("cc"))}
+            try:
+                message["subject"] = subject_template.substitute(variables)
+                message["content"] = content_template.substitute(variables)
+            except (KeyError, ValueError) as e:
+                message["subject"] = template.get("subject", "")
+                message["error"] = f"Missing or invalid template variable: {str(e)}"
+            rendered.append(message)
+    
+    if len(rendered) > SMTP_BATCH_MAX_MESSAGES:
+        raise ValueError(f"A batch can contain at most {SMTP_BATCH_MAX_MESSAGES} messages")
+    for message in rendered:
+        if not message["to"] and "error" not in message:
+            message["error"] = "At least one recipient email address is required"
+    return rendered
+
+async def send_batch_message(account: Account, message: dict, rate_limiter: RateLimiter) -> dict:
+    """Send one batch message, retrying temporary failures, and return its delivery status."""
+    recipients = message["to"] + message["cc"]
+    status = {"to": message["to"], "subject": message["subject"], "accepted": [], "refused": {}, "retries": 0, "error": message.get("error")}
+    if status["error"]:
+        return status
+    
+    try:
+        msg = build_email_message(account.config["email"], message["to"], message["subject"], message["content"], message["cc"])
+    except Exception as e:
+        status["error"] = f"Could not build the email: {str(e) or type(e).__name__}"
+        return status
+    for attempt in range(SMTP_BATCH_MAX_RETRIES + 1):
+        status["retries"] = attempt
+        await rate_limiter.wait()
+        try:
+            async with account.smtp_pool.acquire() as smtp:
+                refused = await smtp.send_message(msg, account.config["email"], recipients)
+            status["error"] = None
+        except Exception as e:
+            if isinstance(e, smtplib.SMTPRecipientsRefused):
+                refused = e.recipients
+                status["error"] = "All recipients were refused"
+            else:
+                refused = {}
+                status["error"] = str(e) or type(e).__name__
+            if is_temporary_smtp_error(e) and attempt < SMTP_BATCH_MAX_RETRIES:
+                logging.warning(f"Temporary failure sending '{message['subject']}', retrying: {status['error']}")
+                await asyncio.sleep(2 ** attempt)
+                continue
+        break
+    
+    status["refused"] = {address: f"{code} {safe_decode(reply, 'utf-8')}" for address, (code, reply) in refused.items()}
+    if status["error"] is None:
+        status["accepted"] = [address for address in recipients if address not in refused]
+    if status["accepted"]:
+        queue_sent_copy(account, msg)
+    return status
+
+async def send_email_batch_async(account: Account, messages: list[dict], concurrency: int, rate: float) -> list[dict]:
+    """Send many emails over the account's SMTP pool, at most `concurrency` at a time and `rate` per second."""
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiter = RateLimiter(rate)
+    
+    async def send_one(message: dict) -> dict:
+        async with semaphore:
+            return await send_batch_message(account, message, rate_limiter)
+    
+    # One message failing unexpectedly must not hide what happened to the others,
+    # or a retry of the batch would send them again
+    results = await asyncio.gather(*(send_one(message) for message in messages), return_exceptions=True)
+    statuses = []
+    for message, result in zip(messages, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result
+            logging.error(f"Error sending '{message.get('subject', '')}': {str(result)}")
+            result = {"to": message.get("to"), "subject": message.get("subject", ""), "accepted": [], "refused": {},
+                      "retries": 0, "error": str(result) or type(result).__name__}
+        statuses.append(result)
+    return statuses
+
+async def append_to_sent_folder(account: Account, mail: IMAPSession, message: bytes) -> str:
+    """Save a sent message to the Sent folder; returns the mailbox it was saved to."""
+    # Check if this is Infomaniak (based on server name)
+    is_infomaniak = "infomaniak" in mail.config["imap_server"].lower()
+    logging.debug(f"Server identified as Infomaniak: {is_infomaniak}")
+    
+    # Resolved once per account from the folder list, then cached
+    resolved_folder = await resolve_special_folder(account, mail, "sent")
+    sent_folder = resolved_folder or "Sent"
+    logging.debug(f"Final selected sent folder: {sent_folder}")
+    
+    errors = []
+    
+    # A folder taken from the server is used as is; the variants below
+    # only matter when the Sent folder had to be guessed.
+    # A None mailbox means the variant isn't applicable
+    append_attempts = [
+        # Standard approach
+        (sent_folder, '\\Seen'),
+        # No flags
+        (sent_folder, ''),
+    ]
+    if not resolved_folder:
+        append_attempts += [
+            # With quotes if needed
+            (f'"{sent_folder}"' if not sent_folder.startswith('"') and ' ' in sent_folder else None, '\\Seen'),
+            # INBOX prefix
+            (f'INBOX.{sent_folder}' if not sent_folder.startswith('INBOX') else None, '\\Seen'),
+            # Try with Infomaniak format if applicable
+            ('/INBOX/Sent' if is_infomaniak else None, '\\Seen'),
+            ('/Sent' if is_infomaniak else None, '\\Seen'),
+            ('/INBOX/Sent Messages' if is_infomaniak else None, '\\Seen'),
+            ('/INBOX/"Sent Messages"' if is_infomaniak else None, '\\Seen'),
+        ]
+    
+    for i, (mailbox, flags) in enumerate(append_attempts):
+        if mailbox is None:
+            # Skip this attempt as it wasn't applicable
+            continue
+        try:
+            result = await mail.append(mailbox, flags, None, message)
+            if result and result[0] == 'OK':
+                logging.debug(f"Successfully saved email to Sent folder (attempt {i+1})")
+                if mailbox != resolved_folder:
+                    # Remember the variant that worked so the next send goes straight there
+                    account.folder_cache.set("special:sent", mailbox)
+                return mailbox
+            elif result:
+                errors.append(f"Attempt {i+1} returned: {result}")
+        except Exception as e:
+            errors.append(f"Attempt {i+1} failed: {str(e)}")
+            logging.debug(f"Append attempt {i+1} failed: {str(e)}")
+    
+    # The folders may have changed on the server: discover them again next time
+    account.folder_cache.invalidate()
+    account.special_folder_store.forget()
+    raise Exception(f"All attempts to save to Sent folder failed: {', '.join(errors)}")
+
+async def verify_saved_message(mail: IMAPSession, mailbox: str, message_id: str) -> bool:
+    """Check that a message with the given Message-ID is in a mailbox."""
+    status, _ = await mail.select(mailbox, readonly=True)
+    if status != 'OK':
+        return False
+    _, data = await mail.uid('SEARCH', 'HEADER', 'Message-ID', imap_search_string(message_id))
+    return bool(data and data[0])
+
+class SentFolderQueue:
+    """Durable queue of sent messages waiting to be saved to the Sent folder.
+
+    Each entry is a spooled .eml file plus a .json file with its retry state.
+    A background worker started from main() appends due entries, retrying
+    failures with exponential backoff; entries that keep failing are moved to
+    the failed/ subdirectory. Entries left over from a previous run are picked
+    up on start.
+    """
+
+    def __init__(self, account: Account, directory: str, max_attempts: int):
+        self.account = account
+        self.directory = directory
+        self.failed_directory = os.path.join(directory, "failed")
+        self.max_attempts = max_attempts
+        self.completed: collections.deque[dict] = collections.deque(maxlen=20)
+        self._wakeup = asyncio.Event()
+        os.makedirs(self.failed_directory, exist_ok=True)
+
+    def enqueue(self, message: bytes, message_id: str, subject: str) -> str:
+        """Spool a message for the background worker and return its entry ID."""
+        entry_id = f"{time.time_ns()}-{secrets.token_hex(4)}"
+        with open(os.path.join(self.directory, f"{entry_id}.eml"), "wb") as f:
+            f.write(message)
+        # The .json file is written last, so only complete entries are ever picked up
+        self._save({
+            "id": entry_id,
+            "message_id": message_id,
+            "subject": subject,
+            "queued_at": time.time(),
+            "attempts": 0,
+            "next_attempt": 0,
+            "last_error": None,
+        })
+        self._wakeup.set()
+        return entry_id
+
+    def _save(self, entry: dict, directory: str | None = None) -> None:
+        path = os.path.join(directory or self.directory, f"{entry['id']}.json")
+        with open(path + ".part", "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(path + ".part", path)
+
+    def _entries(self, directory: str) -> list[dict]:
+        entries = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(directory, name), encoding="utf-8") as f:
+                        entries.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Skipping unreadable spool entry {name}: {str(e)}")
+        return entries
+
+    def pending(self) -> list[dict]:
+        return self._entries(self.directory)
+
+    def failed(self) -> list[dict]:
+        return self._entries(self.failed_directory)
+
+    def _move(self, entry: dict, source: str, target: str) -> None:
+        for extension in (".eml", ".json"):
+            os.replace(os.path.join(source, entry["id"] + extension), os.path.join(target, entry["id"] + extension))
+
+    def retry_failed(self) -> int:
+        """Put failed entries back in the queue; returns how many were requeued."""
+        entries = self.failed()
+        for entry in entries:
+            entry["attempts"] = 0
+            entry["next_attempt"] = 0
+            self._save(entry, self.failed_directory)
+            self._move(entry, self.failed_directory, self.directory)
+        if entries:
+            self._wakeup.set()
+        return len(entries)
+
+    async def _verify(self, mail: IMAPSession, mailbox: str, entry: dict) -> bool | None:
+        """Look for an appended entry in its mailbox; None if the check itself failed."""
+        try:
+            async with asyncio.timeout(SEARCH_TIMEOUT):
+                verified = await verify_saved_message(mail, mailbox, entry["message_id"])
+        except Exception as e:
+            logging.warning(f"Saved '{entry['subject']}' to {mailbox} but could not check it is there: {str(e) or type(e).__name__}")
+            # The session may be mid-command or disconnected
+            mail.broken = True
+            return None
+        if not verified:
+            logging.warning(f"Saved '{entry['subject']}' to {mailbox} but could not find it there afterwards")
+        return verified
+
+    async def _process(self, entry: dict) -> None:
+        eml_path = os.path.join(self.directory, f"{entry['id']}.eml")
+        verified = None
+        try:
+            with open(eml_path, "rb") as f:
+                message = f.read()
+            async with self.account.imap_pool.acquire() as mail:
+                async with asyncio.timeout(SEARCH_TIMEOUT):
+                    mailbox = await append_to_sent_folder(self.account, mail, message)
+                # Only the APPEND is retried: a failed check must not save the message twice
+                if SENT_APPEND_VERIFY and entry["message_id"]:
+                    verified = await self._verify(mail, mailbox, entry)
+        except Exception as e:
+            entry["attempts"] += 1
+            entry["last_error"] = str(e) or type(e).__name__
+            if entry["attempts"] >= self.max_attempts:
+                logging.error(f"Giving up saving '{entry['subject']}' to the Sent folder after {entry['attempts']} attempts: {entry['last_error']}")
+                self._save(entry)
+                self._move(entry, self.directory, self.failed_directory)
+            else:
+                delay = min(SENT_APPEND_RETRY_INTERVAL * 2 ** (entry["attempts"] - 1), SENT_APPEND_MAX_BACKOFF)
+                entry["next_attempt"] = time.time() + delay
+                logging.warning(f"Saving '{entry['subject']}' to the Sent folder failed, retrying in {delay}s: {entry['last_error']}")
+                self._save(entry)
+            return
+        for extension in (".json", ".eml"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.directory, entry["id"] + extension))
+        self.completed.append({**entry, "folder": mailbox, "saved_at": time.time(), "verified": verified})
+        logging.debug(f"Saved '{entry['subject']}' to {mailbox}")
+
+    async def run(self) -> None:
+        """Background worker: append due entries, then sleep until the next one is due."""
+        while True:
+            self._wakeup.clear()
+            try:
+                for entry in self.pending():
+                    if entry["next_attempt"] <= time.time():
+                        await self._process(entry)
+                next_due = min((entry["next_attempt"] for entry in self.pending()), default=None)
+            except Exception as e:
+                logging.error(f"Error in Sent folder queue: {str(e)}")
+                next_due = time.time() + SENT_APPEND_RETRY_INTERVAL
+            timeout = None if next_due is None else max(next_due - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+async def ensure_mailbox_selected(mail: IMAPSession, mailbox: str = "inbox") -> None:
+    """Ensure a mailbox is selected before performing IMAP operations."""
+    try:
+        logging.debug(f"Selecting mailbox: {mailbox}")
         
-        # After sending via SMTP, save a copy to the Sent folder via IMAP with timeout
+        # Connection health is handled by the pool when the session is leased,
+        # and the session skips the SELECT if the mailbox is already selected
+        status, _ = await mail.select(mailbox)
+        
+        if status != 'OK':
+            logging.error(f"Failed to select mailbox {mailbox}: {status}")
+            # Try to select inbox as fallback
+            if mailbox.lower() != 'inbox':
+                logging.debug("Attempting to select INBOX as fallback")
+                fallback_status, _ = await mail.select('INBOX')
+                if fallback_status != 'OK':
+                    raise Exception(f"Could not select mailbox {mailbox} or INBOX")
+                else:
+                    logging.debug("Successfully selected INBOX as fallback")
+            else:
+                raise Exception(f"Could not select mailbox {mailbox}")
+        else:
+            logging.debug(f"Successfully selected mailbox: {mailbox}")
+            
+    except Exception as e:
+        logging.error(f"Error selecting mailbox {mailbox}: {str(e)}")
+        raise Exception(f"Error selecting mailbox: {str(e)}")
+
+class FolderCache:
+    """In-memory TTL cache of an account's folder metadata.
+
+    Holds the LIST result and the resolved Sent/Drafts/Trash mailboxes so
+    repeated folder listings and every send after the first need no discovery
+    round trips. Entries expire after `ttl` seconds or when invalidated.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._entries: dict[str, tuple[float, Any]] = {}
+
+    def get(self, key: str, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key: str, value) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key: str | None = None) -> None:
+        """Forget one entry, or everything."""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+def parse_list_response(list_data: list) -> list[dict]:
+    """Parse LIST responses into dicts with the mailbox name, hierarchy delimiter and attributes.
+
+    Attributes such as \\HasNoChildren or \\Sent are lower-cased.
+    """
+    mailboxes = []
+    segments = []
+    for element in list_data or []:
+        if element is None:
+            continue
+        segments.append(element)
+        if isinstance(element, tuple):
+            # A literal mailbox name; the rest of the line follows as bytes
+            continue
+        parsed = parse_imap_response(segments)
+        segments = []
+        if len(parsed) < 3 or not isinstance(parsed[0], list):
+            continue
+        attributes, delimiter, name = parsed[0], parsed[1], parsed[2]
+        mailboxes.append({
+            "name": _imap_str(name) if name is not None else "",
+            "delimiter": _imap_str(delimiter),
+            "attributes": {str(attribute).lower() for attribute in attributes if attribute},
+        })
+    return mailboxes
+
+async def list_mailboxes_async(account: Account, mail: IMAPSession, refresh: bool = False) -> list[dict]:
+    """List the account's mailboxes, from its folder cache unless `refresh` is set."""
+    if not refresh:
+        mailboxes = account.folder_cache.get("mailboxes")
+        if mailboxes is not None:
+            return mailboxes
+    _, list_data = await mail.list()
+    mailboxes = parse_list_response(list_data)
+    account.folder_cache.set("mailboxes", mailboxes)
+    return mailboxes
+
+async def list_folders_async(account: Account, mail: IMAPSession, refresh: bool = False) -> list[str]:
+    """Asynchronously list all available folders/mailboxes."""
+    try:
+        logging.debug("Listing all available folders")
+        mailboxes = await list_mailboxes_async(account, mail, refresh)
+        folders = [mailbox["name"] for mailbox in mailboxes if "\\noselect" not in mailbox["attributes"]]
+        logging.debug(f"Found {len(folders)} folders")
+        return folders
+    except Exception as e:
+        logging.error(f"Error listing folders: {str(e)}")
+        raise Exception(f"Error listing folders: {str(e)}")
+
+async def list_account_folders_async(account: Account) -> list[str]:
+    """List an account's folders, from the metadata store when it has a recent list."""
+    folders = account.metadata_store.get_folder_list() if account.metadata_store is not None else None
+    if folders is None:
+        async with account.imap_pool.acquire() as mail:
+            folders = await list_folders_async(account, mail)
+    return folders
+
+# Well-known names of special mailboxes, most common first
+SPECIAL_FOLDER_NAMES = {
+    "sent": ["Sent", "Sent Messages", "Sent Items", "Sent Mail", "Sent-Mail", "[Gmail]/Sent Mail"],
+    "drafts": ["Drafts", "Draft", "[Gmail]/Drafts"],
+    "trash": ["Trash", "Deleted Items", "Deleted Messages", "Bin", "[Gmail]/Trash"],
+}
+# Substrings that identify a special mailbox in other languages
+SPECIAL_FOLDER_KEYWORDS = {
+    "sent": ["sent", "envoy", "gesendet"],
+    "drafts": ["draft", "brouillon", "entw"],
+    "trash": ["trash", "deleted", "corbeille", "papierkorb"],
+}
+
+def match_special_folder(mailboxes: list[dict], role: str) -> str | None:
+    """Guess a special mailbox from the LIST result by its well-known names."""
+    names = [mailbox["name"] for mailbox in mailboxes if "\\noselect" not in mailbox["attributes"]]
+    candidates = [candidate.lower() for candidate in SPECIAL_FOLDER_NAMES[role]]
+    # Exact names first, then the same names below INBOX (e.g. INBOX.Sent or INBOX/Sent)
+    for candidate in candidates:
+        for name in names:
+            if name.lower() == candidate:
+                return name
+    for candidate in candidates:
+        for mailbox in mailboxes:
+            delimiter = mailbox["delimiter"]
+            if delimiter and mailbox["name"].lower().endswith(delimiter + candidate) and mailbox["name"] in names:
+                return mailbox["name"]
+    for name in names:
+        if any(keyword in name.lower() for keyword in SPECIAL_FOLDER_KEYWORDS[role]):
+            return name
+    return None
+
+class SpecialFolderStore:
+    """An account's special-use mailboxes found through SPECIAL-USE or XLIST, persisted as {role: mailbox}.
+
+    These come from the server itself, so they are kept across restarts and
+    only forgotten when saving to them fails or the folder list is refreshed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, encoding="utf-8") as f:
+                folders = json.load(f)
+        except (OSError, ValueError):
+            folders = None
+        # Anything else, such as the file once shared by all accounts, is discovered again
+        if not isinstance(folders, dict) or not all(isinstance(name, str) for name in folders.values()):
+            folders = None
+        self._folders: dict[str, str] | None = folders
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            partial_path = self.path + ".part"
+            with open(partial_path, "w", encoding="utf-8") as f:
+                json.dump(self._folders, f, indent=2)
+            os.replace(partial_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save special folders to {self.path}: {str(e)}")
+
+    def has(self) -> bool:
+        return self._folders is not None
+
+    def get(self, role: str) -> str | None:
+        return (self._folders or {}).get(role)
+
+    def set(self, folders: dict[str, str]) -> None:
+        self._folders = folders
+        self._save()
+
+    def forget(self) -> None:
+        if self._folders is not None:
+            self._folders = None
+            with contextlib.suppress(OSError):
+                os.remove(self.path)
+
+async def discover_special_folders(account: Account, mail: IMAPSession) -> dict[str, str] | None:
+    """Read the Sent/Drafts/Trash mailboxes from RFC 6154 attributes.
+
+    Uses LIST (SPECIAL-USE) when LIST-EXTENDED is available, the (cached)
+    plain LIST on other SPECIAL-USE servers and XLIST on older Gmail servers.
+    Returns None when the server supports none of them.
+    """
+    if mail.has_capability('SPECIAL-USE') and not mail.has_capability('LIST-EXTENDED'):
+        mailboxes = await list_mailboxes_async(account, mail)
+    elif mail.has_capability('SPECIAL-USE') or mail.has_capability('XLIST'):
+        _, list_data = await mail.list_special_use()
+        mailboxes = parse_list_response(list_data)
+    else:
+        return None
+    folders = {}
+    for mailbox in mailboxes:
+        for role in SPECIAL_FOLDER_NAMES:
+            if f"\\{role}" in mailbox["attributes"] and role not in folders:
+                folders[role] = mailbox["name"]
+    return folders
+
+async def resolve_special_folder(account: Account, mail: IMAPSession, role: str) -> str | None:
+    """Find the account's Sent, Drafts or Trash mailbox, caching the answer per account.
+
+    The server's own SPECIAL-USE/XLIST answer is preferred and persisted; the
+    name heuristics are only used when the server has neither or flags no
+    mailbox for the role.
+    """
+    cached = account.folder_cache.get(f"special:{role}")
+    if cached is not None:
+        # An empty string records that the account has no such mailbox
+        return cached or None
+    folder = account.special_folder_store.get(role)
+    if not account.special_folder_store.has():
+        discovered = await discover_special_folders(account, mail)
+        if discovered is not None:
+            account.special_folder_store.set(discovered)
+            folder = discovered.get(role)
+    if folder is None:
+        mailboxes = await list_mailboxes_async(account, mail)
+        # RFC 6154 attributes are sometimes included in a plain LIST response
+        folder = next((m["name"] for m in mailboxes if f"\\{role}" in m["attributes"]), None)
+        if folder is None:
+            folder = match_special_folder(mailboxes, role)
+    logging.debug(f"Resolved {role} folder for account {account.name}: {folder}")
+    account.folder_cache.set(f"special:{role}", folder or "")
+    return folder
+
+def parse_internaldate(value) -> datetime | None:
+    """Parse an IMAP INTERNALDATE such as ' 1-Jan-2024 10:00:00 +0000'."""
+    if isinstance(value, bytes):
+        value = value.decode('ascii', errors='replace')
+    try:
+        return datetime.strptime(value.strip(), "%d-%b-%Y %H:%M:%S %z")
+    except (AttributeError, ValueError):
+        return None
+
+
+class MetadataStore:
+    """Local SQLite index of message metadata, kept current by sync_folder().
+
+    Holds the headers, flags, INTERNALDATE, size and folder of every synced UID
+    so searches, daily counts and folder listings can be answered without a
+    round trip to the IMAP server.
+    """
+
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._migrate()
+
+    def _migrate(self) -> None:
+        with self._lock, self._db:
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._db.executescript("""
+                    CREATE TABLE IF NOT EXISTS folders (
+                        name TEXT PRIMARY KEY,
+                        uidvalidity INTEGER,
+                        uidnext INTEGER,
+                        last_sync REAL
+                    );
+                    CREATE TABLE IF NOT EXISTS folder_list (
+                        name TEXT PRIMARY KEY,
+                        position INTEGER,
+                        last_sync REAL
+                    );
+                    CREATE TABLE IF NOT EXISTS messages (
+                        folder TEXT NOT NULL,
+                        uid INTEGER NOT NULL,
+                        uidvalidity INTEGER NOT NULL,
+                        message_id TEXT,
+                        in_reply_to TEXT,
+                        refs TEXT,
+                        from_addr TEXT,
+                        to_addr TEXT,
+                        subject TEXT,
+                        date TEXT,
+                        internaldate REAL,
+                        internal_day TEXT,
+                        size INTEGER,
+                        flags TEXT,
+                        PRIMARY KEY (folder, uid)
+                    );
+                    CREATE INDEX IF NOT EXISTS messages_by_day ON messages (folder, internal_day);
+                """)
+            if version < 2:
+                # HIGHESTMODSEQ lets CONDSTORE servers report only what changed since the last sync
+                self._db.execute("ALTER TABLE folders ADD COLUMN highestmodseq INTEGER DEFAULT 0")
+            self._db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _execute(self, sql: str, params=()) -> list[sqlite3.Row]:
+        with self._lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    def get_folder_state(self, folder: str) -> dict | None:
+        rows = self._execute("SELECT * FROM folders WHERE name = ?", (normalize_mailbox(folder),))
+        return dict(rows[0]) if rows else None
+
+    def update_folder_state(self, folder: str, uidvalidity: int, uidnext: int, highestmodseq: int = 0) -> None:
+        self._execute(
+            "INSERT INTO folders (name, uidvalidity, uidnext, highestmodseq, last_sync) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET uidvalidity = excluded.uidvalidity, "
+            "uidnext = excluded.uidnext, highestmodseq = excluded.highestmodseq, last_sync = excluded.last_sync",
+            (normalize_mailbox(folder), uidvalidity, uidnext, highestmodseq, time.time()),
+        )
+
+    def reset_folder(self, folder: str) -> None:
+        """Forget everything about a folder, e.g. after its UIDVALIDITY changed."""
+        folder = normalize_mailbox(folder)
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM messages WHERE folder = ?", (folder,))
+            self._db.execute("DELETE FROM folders WHERE name = ?", (folder,))
+
+    def add_messages(self, folder: str, uidvalidity: int, rows: list[dict]) -> None:
+        folder = normalize_mailbox(folder)
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO messages (folder, uid, uidvalidity, message_id, in_reply_to, refs, "
+                "from_addr, to_addr, subject, date, internaldate, internal_day, size, flags) "
+                "VALUES (:folder, :uid, :uidvalidity, :message_id, :in_reply_to, :refs, :from_addr, :to_addr, "
+                ":subject, :date, :internaldate, :internal_day, :size, :flags)",
+                [dict(row, folder=folder, uidvalidity=uidvalidity) for row in rows],
+            )
+
+    def update_flags(self, folder: str, flags_by_uid: dict[int, str]) -> None:
+        folder = normalize_mailbox(folder)
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE messages SET flags = ? WHERE folder = ? AND uid = ?",
+                [(flags, folder, int(uid)) for uid, flags in flags_by_uid.items()],
+            )
+
+    def mark_stale(self, folder: str) -> None:
+        """Make the folder fall back to the server until its next sync."""
+        self._execute("UPDATE folders SET last_sync = 0 WHERE name = ?", (normalize_mailbox(folder),))
+
+    def delete_messages(self, folder: str, uids: list[int]) -> None:
+        folder = normalize_mailbox(folder)
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM messages WHERE folder = ? AND uid = ?",
+                [(folder, int(uid)) for uid in uids],
+            )
+
+    def stored_uids(self, folder: str) -> set[int]:
+        rows = self._execute("SELECT uid FROM messages WHERE folder = ?", (normalize_mailbox(folder),))
+        return {row["uid"] for row in rows}
+
+    def message_count(self, folder: str) -> int:
+        rows = self._execute("SELECT COUNT(*) FROM messages WHERE folder = ?", (normalize_mailbox(folder),))
+        return rows[0][0]
+
+    def set_folder_list(self, folders: list[str]) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM folder_list")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO folder_list (name, position, last_sync) VALUES (?, ?, ?)",
+                [(name, position, now) for position, name in enumerate(folders)],
+            )
+
+    def get_folder_list(self) -> list[str] | None:
+        """Return the synced folder list, or None if it is missing or stale."""
+        rows = self._execute("SELECT name, last_sync FROM folder_list ORDER BY position")
+        if not rows or time.time() - rows[0]["last_sync"] > METADATA_MAX_AGE:
+            return None
+        return [row["name"] for row in rows]
+
+    def is_fresh(self, folder: str) -> bool:
+        """True if the folder has been synced recently enough to answer locally."""
+        state = self.get_folder_state(folder)
+        return bool(state and state["last_sync"] and time.time() - state["last_sync"] <= METADATA_MAX_AGE)
+
+    def search_uids(self, folder: str, since: datetime, before: datetime, keyword: str = "") -> list[int]:
+        """Return the UIDs of matching messages in ascending order, like UID SEARCH."""
+        sql = "SELECT uid FROM messages WHERE folder = ? AND internal_day >= ? AND internal_day < ?"
+        params = [normalize_mailbox(folder), since.strftime("%Y-%m-%d"), before.strftime("%Y-%m-%d")]
+        if keyword:
+            # IMAP SUBJECT is a case-insensitive substring match
+            sql += " AND subject LIKE ? ESCAPE '\\'"
+            escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        sql += " ORDER BY uid"
+        return [row["uid"] for row in self._execute(sql, params)]
+
+    def summaries(self, folder: str, uids: list[int]) -> list[dict]:
+        """Return summaries for the given UIDs in the same order, skipping unknown ones."""
+        if not uids:
+            return []
+        placeholders = ", ".join("?" * len(uids))
+        rows = self._execute(
+            f"SELECT uid, uidvalidity, from_addr, date, subject FROM messages WHERE folder = ? AND uid IN ({placeholders})",
+            [normalize_mailbox(folder), *uids],
+        )
+        by_uid = {row["uid"]: row for row in rows}
+        return [
+            {
+                "id": encode_email_id(normalize_mailbox(folder), by_uid[uid]["uidvalidity"], uid),
+                "from": by_uid[uid]["from_addr"] or "Unknown",
+                "date": by_uid[uid]["date"] or "Unknown",
+                "subject": by_uid[uid]["subject"] or "No Subject",
+            }
+            for uid in uids
+            if uid in by_uid
+        ]
+
+    def thread_headers(self, folder: str, after_uid: int = 0) -> list[dict]:
+        """Return the threading headers of messages with a UID above after_uid, in UID order."""
+        rows = self._execute(
+            "SELECT uid, message_id, in_reply_to, refs FROM messages WHERE folder = ? AND uid > ? ORDER BY uid",
+            (normalize_mailbox(folder), int(after_uid)),
+        )
+        return [dict(row) for row in rows]
+
+    def internaldates(self, folder: str, since: datetime, before: datetime) -> list[datetime]:
+        """Return the INTERNALDATEs of messages received in [since, before)."""
+        rows = self._execute(
+            "SELECT internaldate FROM messages WHERE folder = ? AND internaldate >= ? AND internaldate < ?",
+            (normalize_mailbox(folder), since.timestamp(), before.timestamp()),
+        )
+        return [datetime.fromtimestamp(row["internaldate"], timezone.utc) for row in rows]
+
+class FullTextIndex:
+    """Local SQLite FTS5 index of message bodies already decoded by get_email_content_async().
+
+    A (folder, UIDVALIDITY, UID) triple always names the same message, so each
+    message is indexed once and the index only ever grows incrementally. Queries
+    are ranked with BM25 and accept FTS5 syntax: "exact phrases", prefix* terms
+    and AND/OR/NOT.
+    """
+
+    SCHEMA_VERSION = 1
+    # BM25 column weights for (from_addr, to_addr, subject, body)
+    RANK_WEIGHTS = (1.0, 1.0, 3.0, 1.0)
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._migrate()
+
+    def _migrate(self) -> None:
+        with self._lock, self._db:
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._db.executescript("""
+                    CREATE TABLE IF NOT EXISTS indexed_messages (
+                        id INTEGER PRIMARY KEY,
+                        folder TEXT NOT NULL,
+                        uidvalidity INTEGER NOT NULL,
+                        uid INTEGER NOT NULL,
+                        date TEXT,
+                        date_ts REAL,
+                        UNIQUE (folder, uidvalidity, uid)
+                    );
+                    CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+                        from_addr, to_addr, subject, body,
+                        tokenize = 'unicode61 remove_diacritics 2'
+                    );
+                """)
+            self._db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _execute(self, sql: str, params=()) -> list[sqlite3.Row]:
+        with self._lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    def contains(self, folder: str, uidvalidity: int, uid: int) -> bool:
+        rows = self._execute(
+            "SELECT 1 FROM indexed_messages WHERE folder = ? AND uidvalidity = ? AND uid = ?",
+            (normalize_mailbox(folder), uidvalidity, uid),
+        )
+        return bool(rows)
+
+    def add_message(self, folder: str, uidvalidity: int, uid: int, content: dict) -> None:
+        """Index a message returned by get_email_content_async(); already indexed messages are skipped."""
+        try:
+            date_ts = email.utils.parsedate_to_datetime(content.get("date", "")).timestamp()
+        except (TypeError, ValueError, IndexError):
+            date_ts = None
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO indexed_messages (folder, uidvalidity, uid, date, date_ts) VALUES (?, ?, ?, ?, ?)",
+                (normalize_mailbox(folder), uidvalidity, uid, content.get("date"), date_ts),
+            )
+            if cursor.rowcount:
+                self._db.execute(
+                    "INSERT INTO emails_fts (rowid, from_addr, to_addr, subject, body) VALUES (?, ?, ?, ?, ?)",
+                    (cursor.lastrowid, content.get("from", ""), content.get("to", ""),
+                     content.get("subject", ""), content.get("content", "")),
+                )
+
+    def forget_folder(self, folder: str, keep_uidvalidity: int | None = None) -> None:
+        """Drop a folder's entries, or only those from an older UIDVALIDITY."""
+        with self._lock, self._db:
+            ids = "SELECT id FROM indexed_messages WHERE folder = ?"
+            params = [normalize_mailbox(folder)]
+            if keep_uidvalidity is not None:
+                ids += " AND uidvalidity != ?"
+                params.append(keep_uidvalidity)
+            self._db.execute(f"DELETE FROM emails_fts WHERE rowid IN ({ids})", params)
+            self._db.execute(f"DELETE FROM indexed_messages WHERE id IN ({ids})", params)
+
+    def _query(self, match: str, folder: str | None, since: datetime | None, before: datetime | None,
+               limit: int) -> list[sqlite3.Row]:
+        sql = (
+            "SELECT m.folder, m.uidvalidity, m.uid, m.date, f.from_addr, f.subject, "
+            "snippet(emails_fts, 3, '[', ']', '...', 12) AS snippet "
+            "FROM emails_fts f JOIN indexed_messages m ON m.id = f.rowid "
+            "WHERE emails_fts MATCH ?"
+        )
+        params: list = [match]
+        if folder:
+            sql += " AND m.folder = ?"
+            params.append(normalize_mailbox(folder))
+        if since:
+            sql += " AND m.date_ts >= ?"
+            params.append(since.timestamp())
+        if before:
+            sql += " AND m.date_ts < ?"
+            params.append(before.timestamp())
+        sql += f" ORDER BY bm25(emails_fts, {', '.join(map(str, self.RANK_WEIGHTS))}) LIMIT ?"
+        params.append(limit)
+        return self._execute(sql, params)
+
+    def search(self, query: str, folder: str | None = None, since: datetime | None = None,
+               before: datetime | None = None, limit: int = 20) -> list[dict]:
+        """Return the best matching messages, most relevant first."""
+        if not query.strip():
+            raise ValueError("A keyword is required for full-text search.")
+        try:
+            rows = self._query(query, folder, since, before, limit)
+        except sqlite3.OperationalError:
+            # Not valid FTS5 syntax: match every term literally instead
+            terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+            rows = self._query(" ".join(terms), folder, since, before, limit)
+        return [
+            {
+                "id": encode_email_id(row["folder"], row["uidvalidity"], row["uid"]),
+                "from": row["from_addr"] or "Unknown",
+                "date": row["date"] or "Unknown",
+                "subject": row["subject"] or "No Subject",
+                "snippet": " ".join((row["snippet"] or "").split()),
+            }
+            for row in rows
+        ]
+
+class MessageCache:
+    """Content-addressed on-disk cache of message structures and raw body parts.
+
+    Entries are keyed by (folder, UIDVALIDITY, UID, section). Because that key
+    always names the same bytes, entries never go stale; they only leave the
+    cache when the total size exceeds `max_bytes`, least recently used first.
+    Blobs are stored once per SHA-256 digest, so a message that appears in
+    several folders is kept only once, and are read through mmap so a range
+    read only touches the pages it needs.
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._migrate()
+
+    def _migrate(self) -> None:
+        with self._lock, self._db:
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._db.executescript("""
+                    CREATE TABLE IF NOT EXISTS entries (
+                        folder TEXT NOT NULL,
+                        uidvalidity INTEGER NOT NULL,
+                        uid INTEGER NOT NULL,
+                        section TEXT NOT NULL,
+                        digest TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        last_access REAL NOT NULL,
+                        PRIMARY KEY (folder, uidvalidity, uid, section)
+                    );
+                    CREATE INDEX IF NOT EXISTS entries_by_access ON entries (last_access);
+                    CREATE INDEX IF NOT EXISTS entries_by_digest ON entries (digest);
+                """)
+            self._db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _execute_read(self, sql: str, params=()) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], digest[2:])
+
+    def _key(self, folder: str, uidvalidity: int | None, uid, section: str) -> tuple:
+        return (normalize_mailbox(folder or ""), uidvalidity or 0, int(uid), section)
+
+    def _lookup(self, key: tuple) -> str | None:
+        """Return the digest stored under a key and mark it as recently used."""
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT digest FROM entries WHERE folder = ? AND uidvalidity = ? AND uid = ? AND section = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute(
+                "UPDATE entries SET last_access = ? WHERE folder = ? AND uidvalidity = ? AND uid = ? AND section = ?",
+                (time.time(), *key),
+            )
+            return row["digest"]
+
+    def contains(self, folder: str, uidvalidity: int | None, uid, section: str) -> bool:
+        rows = self._execute_read(
+            "SELECT 1 FROM entries WHERE folder = ? AND uidvalidity = ? AND uid = ? AND section = ?",
+            self._key(folder, uidvalidity, uid, section),
+        )
+        return bool(rows)
+
+    def read(self, folder: str, uidvalidity: int | None, uid, section: str,
+             start: int | None = None, length: int | None = None) -> bytes | None:
+        """Return a cached blob, or only `length` bytes of it from `start`; None on a miss."""
+        if uidvalidity is None:
+            return None
+        digest = self._lookup(self._key(folder, uidvalidity, uid, section))
+        if digest is None:
+            return None
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b""
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    if start is None:
+                        return view[:]
+                    return view[start:start + length]
+        except FileNotFoundError:
+            # The blob was removed behind our back: forget the entry
+            self._forget(self._key(folder, uidvalidity, uid, section))
+            self.hits -= 1
+            self.misses += 1
+            return None
+
+    def put(self, folder: str, uidvalidity: int | None, uid, section: str, data: bytes) -> None:
+        """Store a blob under a key, then evict least recently used entries over the size cap."""
+        if uidvalidity is None or len(data) > self.max_bytes:
+            return
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial_path = f"{path}.{os.getpid()}.part"
+            with open(partial_path, "wb") as f:
+                f.write(data)
+            os.replace(partial_path, path)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (folder, uidvalidity, uid, section, digest, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*self._key(folder, uidvalidity, uid, section), digest, len(data), time.time()),
+            )
+        self._evict()
+
+    def get_structure(self, folder: str, uidvalidity: int | None, uid) -> tuple[bytes, list[dict]] | None:
+        data = self.read(folder, uidvalidity, uid, "STRUCTURE")
+        if data is None:
+            return None
+        cached = json.loads(data)
+        return cached["headers"].encode("utf-8", "surrogateescape"), cached["parts"]
+
+    def put_structure(self, folder: str, uidvalidity: int | None, uid, raw_headers: bytes, parts: list[dict]) -> None:
+        data = json.dumps({"headers": raw_headers.decode("utf-8", "surrogateescape"), "parts": parts})
+        self.put(folder, uidvalidity, uid, "STRUCTURE", data.encode())
+
+    def _forget(self, key: tuple) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries WHERE folder = ? AND uidvalidity = ? AND uid = ? AND section = ?", key)
+
+    def total_size(self) -> int:
+        rows = self._execute_read("SELECT COALESCE(SUM(size), 0) AS total FROM (SELECT DISTINCT digest, size FROM entries)")
+        return rows[0]["total"]
+
+    def _evict(self) -> None:
+        total = self.total_size()
+        while total > self.max_bytes:
+            with self._lock, self._db:
+                row = self._db.execute("SELECT * FROM entries ORDER BY last_access LIMIT 1").fetchone()
+                if row is None:
+                    return
+                self._db.execute(
+                    "DELETE FROM entries WHERE folder = ? AND uidvalidity = ? AND uid = ? AND section = ?",
+                    (row["folder"], row["uidvalidity"], row["uid"], row["section"]),
+                )
+                shared = self._db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (row["digest"],)).fetchone()
+            if not shared:
+                # Last reference to this blob
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._blob_path(row["digest"]))
+                total -= row["size"]
+            logging.debug(f"Evicted {row['section']} of UID {row['uid']} in {row['folder']} from the message cache")
+
+    def stats(self) -> dict:
+        entries = self._execute_read("SELECT COUNT(*) AS n FROM entries")[0]["n"]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "size": self.total_size(),
+            "max_size": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+def load_accounts() -> dict[str, Account]:
+    """Create the accounts from EMAIL_ACCOUNTS_FILE, or the single account configured in .env.
+
+    The file maps account names to objects with email, password (or
+    password_env, the name of an environment variable holding it),
+    imap_server, smtp_server and optionally smtp_port, sync_folders and
+    idle_folders. The first account is the default.
+    """
+    if not EMAIL_ACCOUNTS_FILE:
+        # The .env account keeps using the top of the cache directory
+        return {"default": Account("default", EMAIL_CONFIG, CACHE_DIR, METADATA_SYNC_FOLDERS, IMAP_IDLE_FOLDERS)}
+    
+    with open(EMAIL_ACCOUNTS_FILE, encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, dict) or not entries:
+        raise ValueError(f"{EMAIL_ACCOUNTS_FILE} must map account names to account settings")
+    loaded = {}
+    for name, entry in entries.items():
+        if name == "*":
+            raise ValueError("'*' cannot be used as an account name; it stands for all accounts")
+        try:
+            config = {
+                "email": entry["email"],
+                "password": entry["password"] if "password" in entry else os.getenv(entry["password_env"], ""),
+                "imap_server": entry["imap_server"],
+                "smtp_server": entry["smtp_server"],
+                "smtp_port": int(entry.get("smtp_port", 587)),
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid settings for account '{name}' in {EMAIL_ACCOUNTS_FILE}: missing or invalid {str(e)}")
+        cache_dir = os.path.join(CACHE_DIR, "accounts", urllib.parse.quote(name, safe=""))
+        loaded[name] = Account(name, config, cache_dir,
+                               entry.get("sync_folders", METADATA_SYNC_FOLDERS),
+                               entry.get("idle_folders", IMAP_IDLE_FOLDERS))
+    return loaded
+
+# Filled by get_accounts() on first use, so importing the module creates no caches or connections
+accounts: dict[str, Account] = {}
+
+def get_accounts() -> dict[str, Account]:
+    """Return the configured accounts, creating them on first use."""
+    if not accounts:
+        accounts.update(load_accounts())
+    return accounts
+
+def get_account(name: str | None = None) -> Account:
+    """Look up an account by name; no name means the default account."""
+    configured = get_accounts()
+    if not name:
+        return next(iter(configured.values()))
+    if name not in configured:
+        raise ValueError(f"Unknown account: {name}. Configured accounts: {', '.join(accounts)}")
+    return accounts[name]
+
+def metadata_row_from_fetch(item: dict) -> dict | None:
+    """Turn a parsed FETCH item into a row for the metadata store."""
+    if not item.get("UID"):
+        return None
+    headers = email.message_from_bytes(get_body_section(item, "BODY[HEADER") or b"")
+    internaldate = parse_internaldate(item.get("INTERNALDATE"))
+    return {
+        "uid": int(item["UID"]),
+        "message_id": (headers.get("Message-ID") or "").strip(),
+        "in_reply_to": (headers.get("In-Reply-To") or "").strip(),
+        "refs": " ".join((headers.get("References") or "").split()),
+        "from_addr": decode_header_safely(headers.get("From", "Unknown")),
+        "to_addr": decode_header_safely(headers.get("To", "")),
+        "subject": decode_header_safely(headers.get("Subject", "No Subject")),
+        "date": headers.get("Date", "Unknown"),
+        "internaldate": internaldate.timestamp() if internaldate else None,
+        # IMAP SINCE/BEFORE/ON compare the date in the INTERNALDATE's own offset
+        "internal_day": internaldate.strftime("%Y-%m-%d") if internaldate else None,
+        "size": int(item["RFC822.SIZE"]) if str(item.get("RFC822.SIZE", "")).isdigit() else None,
+        "flags": " ".join(item.get("FLAGS") or []),
+    }
+
+async def sync_folder(mail: IMAPSession, store: MetadataStore, folder: str) -> int:
+    """Incrementally sync one folder into the metadata store.
+
+    Uses STATUS to compare UIDVALIDITY/UIDNEXT (and HIGHESTMODSEQ on CONDSTORE
+    servers) with what is stored, so an unchanged folder costs a single round
+    trip and only UIDs at or above the stored UIDNEXT are fetched. Flag changes
+    are picked up with CHANGEDSINCE and expunges with VANISHED when the server
+    supports CONDSTORE/QRESYNC; otherwise expunges are detected by comparing
+    message counts. Returns the number of new messages stored.
+    """
+    folder = normalize_mailbox(folder)
+    condstore = mail.has_capability('CONDSTORE') or mail.has_capability('QRESYNC')
+    qresync = mail.has_capability('QRESYNC')
+    status_items = '(UIDVALIDITY UIDNEXT MESSAGES HIGHESTMODSEQ)' if condstore else '(UIDVALIDITY UIDNEXT MESSAGES)'
+    _, status_data = await mail.status(folder, status_items)
+    parsed = parse_imap_response([d for d in status_data if d is not None])
+    values = dict(zip(parsed[1][::2], parsed[1][1::2])) if len(parsed) > 1 else {}
+    uidvalidity = int(values.get("UIDVALIDITY", 0))
+    uidnext = int(values.get("UIDNEXT", 0))
+    server_count = int(values.get("MESSAGES", 0))
+    # 0 means the mailbox doesn't keep mod-sequences (NOMODSEQ)
+    highestmodseq = int(values.get("HIGHESTMODSEQ", 0))
+    
+    state = store.get_folder_state(folder)
+    if state and state["uidvalidity"] != uidvalidity:
+        logging.info(f"UIDVALIDITY of {folder} changed, discarding its local index")
+        store.reset_folder(folder)
+        state = None
+    start_uid = state["uidnext"] if state else 1
+    stored_modseq = (state["highestmodseq"] or 0) if state else 0
+    changed_since = stored_modseq if highestmodseq and stored_modseq and highestmodseq > stored_modseq else 0
+    
+    new_count = 0
+    if uidnext > start_uid or changed_since or store.message_count(folder) > server_count:
+        await ensure_mailbox_selected(mail, folder)
+        if mail.selected_mailbox != folder:
+            raise Exception(f"Could not select {folder} for sync")
+        new_uids = []
+        if uidnext > start_uid:
+            _, messages = await mail.uid('SEARCH', f'UID {start_uid}:*')
+            # 'UID n:*' always matches the highest UID, even when it is below n
+            new_uids = [int(u) for u in (messages[0] or b'').split() if int(u) >= start_uid]
+        
+        for i in range(0, len(new_uids), METADATA_SYNC_BATCH_SIZE):
+            batch = new_uids[i:i + METADATA_SYNC_BATCH_SIZE]
+            _, fetch_data = await mail.uid('FETCH', compress_message_set(batch), METADATA_FETCH_ITEMS)
+            rows = [row for row in map(metadata_row_from_fetch, parse_fetch_response(fetch_data)) if row]
+            await asyncio.get_event_loop().run_in_executor(None, store.add_messages, folder, uidvalidity, rows)
+            new_count += len(rows)
+        
+        if changed_since and start_uid > 1:
+            # Only messages whose flags changed since the last sync are returned,
+            # and with QRESYNC the server also lists the UIDs that were expunged
+            modifier = f'(CHANGEDSINCE {changed_since} VANISHED)' if qresync else f'(CHANGEDSINCE {changed_since})'
+            _, fetch_data = await mail.uid('FETCH', f'1:{start_uid - 1}', '(UID FLAGS)', modifier)
+            flags_by_uid = {
+                int(item["UID"]): " ".join(item.get("FLAGS") or [])
+                for item in parse_fetch_response(fetch_data) if item.get("UID")
+            }
+            store.update_flags(folder, flags_by_uid)
+            logging.debug(f"Updated flags of {len(flags_by_uid)} messages in {folder} since MODSEQ {changed_since}")
+            if qresync:
+                _, vanished = await mail.response('VANISHED')
+                expunged = []
+                for entry in vanished or []:
+                    if entry:
+                        entry = entry.decode() if isinstance(entry, bytes) else str(entry)
+                        expunged.extend(expand_message_set(entry.replace('(EARLIER)', '').strip()))
+                # VANISHED (EARLIER) may cover UIDs that were never indexed
+                expunged = set(expunged) & store.stored_uids(folder)
+                if expunged:
+                    logging.debug(f"Removing {len(expunged)} vanished messages from the index of {folder}")
+                    store.delete_messages(folder, list(expunged))
+        
+        # More messages stored than the server has means some were expunged
+        if store.message_count(folder) > server_count:
+            _, messages = await mail.uid('SEARCH', 'ALL')
+            live_uids = {int(u) for u in (messages[0] or b'').split()}
+            expunged = store.stored_uids(folder) - live_uids
+            logging.debug(f"Removing {len(expunged)} expunged messages from the index of {folder}")
+            store.delete_messages(folder, list(expunged))
+    
+    store.update_folder_state(folder, uidvalidity, uidnext, highestmodseq)
+    if new_count:
+        logging.debug(f"Indexed {new_count} new messages in {folder}")
+    return new_count
+
+async def metadata_sync_loop(account: Account) -> None:
+    """Keep an account's metadata store in sync with the server in the background."""
+    while True:
+        try:
+            async with account.imap_pool.acquire() as mail:
+                store_folders = await list_folders_async(account, mail)
+                account.metadata_store.set_folder_list(store_folders)
+                for folder in account.sync_folders:
+                    try:
+                        await sync_folder(mail, account.metadata_store, folder)
+                    except Exception as e:
+                        logging.error(f"Error syncing folder {folder} of account {account.name}: {str(e)}")
+        except Exception as e:
+            logging.error(f"Error in metadata sync of account {account.name}: {str(e)}")
+        await asyncio.sleep(METADATA_SYNC_INTERVAL)
+
+# Callbacks run with (account, folder, events) when a folder is known to have changed on the server
+folder_change_callbacks: list = []
+
+def notify_folder_changed(account: Account, folder: str, events: set[str]) -> None:
+    """Tell every registered cache that a folder of an account changed on the server."""
+    folder = normalize_mailbox(folder)
+    logging.debug(f"Folder {folder} of account {account.name} changed on the server: {sorted(events)}")
+    for callback in folder_change_callbacks:
+        try:
+            callback(account, folder, events)
+        except Exception as e:
+            logging.error(f"Error in folder change callback: {str(e)}")
+
+async def _sync_dirty_folder(account: Account, folder: str) -> None:
+    # Keep syncing while new notifications arrive during the sync itself
+    while folder in account.dirty_folders:
+        account.dirty_folders.discard(folder)
         try:
-            logging.debug("Attempting to save copy of email to Sent folder")
-            
-            # Prepare the message for IMAP append with delivery flags
-            email_str = msg.as_string().encode('utf-8')
-            
-            # Create a task for the IMAP operations with a timeout
-            async def save_to_sent_folder():
-                try:
-                    # Connect to IMAP server
-                    mail = imaplib.IMAP4_SSL(EMAIL_CONFIG["imap_server"])
-                    mail.login(EMAIL_CONFIG["email"], EMAIL_CONFIG["password"])
-                    
-                    # Check if this is Infomaniak (based on server name)
-                    is_infomaniak = "infomaniak" in EMAIL_CONFIG["imap_server"].lower()
-                    logging.debug(f"Server identified as Infomaniak: {is_infomaniak}")
-                    
-                    # Log all folders for debugging
-                    _, folder_list = mail.list()
-                    logging.debug("Available folders:")
-                    for folder in folder_list:
-                        folder_str = folder.decode('utf-8') if isinstance(folder, bytes) else str(folder)
-                        logging.debug(f"  - {folder_str}")
-                    
-                    # Define potential sent folder names based on provider
-                    sent_folder_candidates = []
-                    
-                    if is_infomaniak:
-                        # Infomaniak-specific folders - expanded list based on common paths
-                        sent_folder_candidates = [
-                            'Sent',
-                            'Sent Messages',
-                            'Sent Items',
-                            'INBOX.Sent',
-                            'INBOX.Sent Messages',
-                            'INBOX.Sent Items',
-                            '"Sent Messages"',
-                            '"Sent"',
-                            '"Sent Items"',
-                            'INBOX/"Sent Messages"',
-                            'INBOX/"Sent"',
-                            'INBOX/"Sent Items"',
-                            # Infomaniak format with slashes
-                            '/Sent Messages',
-                            '/Sent',
-                            '/Sent Items',
-                        ]
-                    else:
-                        # General folder names for other providers
-                        sent_folder_candidates = [
-                            'Sent', 
-                            '"Sent Messages"', 
-                            'Sent Items', 
-                            'SENT',
-                            '"Sent Mail"',
-                            'Sent Mail',
-                            '"Sent Items"',
-                            'OUTBOX',
-                            'Outbox',
-                            'Sent-Mail'
-                        ]
-                    
-                    # Try direct matching with folder names first
-                    sent_folder = None
-                    for folder_name in sent_folder_candidates:
-                        try:
-                            logging.debug(f"Trying to select folder: {folder_name}")
-                            status, _ = mail.select(folder_name, readonly=True)
-                            if status == 'OK':
-                                sent_folder = folder_name
-                                mail.close()  # Close selected folder
-                                logging.debug(f"Successfully matched sent folder: {sent_folder}")
-                                break
-                        except Exception as e:
-                            logging.debug(f"Failed to select folder {folder_name}: {str(e)}")
-                    
-                    # If we still didn't find the sent folder, try parsing the folder list
-                    if not sent_folder:
-                        logging.debug("Trying to parse folder list to find sent folder")
-                        for folder in folder_list:
-                            folder_str = folder.decode('utf-8') if isinstance(folder, bytes) else str(folder)
-                            
-                            # Look for sent-related keywords in the folder string
-                            if any(keyword in folder_str.lower() for keyword in ['sent', 'envoy']):
-                                # Extract the folder name - usually in quotes
-                                parts = folder_str.split('"')
-                                if len(parts) > 2:
-                                    sent_folder = parts[1].strip()
-                                    logging.debug(f"Found sent folder from parsing: {sent_folder}")
-                                    break
-                    
-                    # Last resort fallback
-                    if not sent_folder:
-                        if is_infomaniak:
-                            # Default for Infomaniak based on common patterns
-                            sent_folder = 'Sent' 
-                            logging.debug(f"Using Infomaniak default sent folder: {sent_folder}")
-                        else:
-                            # Default for other providers
-                            sent_folder = "Sent"
-                            logging.debug(f"Using default sent folder: {sent_folder}")
-                    
-                    logging.debug(f"Final selected sent folder: {sent_folder}")
-                    
-                    # Try multiple approaches to save the message
-                    success = False
-                    errors = []
-                    
-                    # Try all these variants with proper error handling
-                    append_attempts = [
-                        # Standard approach
-                        lambda: mail.append(sent_folder, '\\Seen', None, email_str),
-                        # No flags
-                        lambda: mail.append(sent_folder, '', None, email_str),
-                        # With quotes if needed
-                        lambda: mail.append(f'"{sent_folder}"', '\\Seen', None, email_str) 
-                            if not sent_folder.startswith('"') and ' ' in sent_folder else None,
-                        # INBOX prefix
-                        lambda: mail.append(f'INBOX.{sent_folder}', '\\Seen', None, email_str) 
-                            if not sent_folder.startswith('INBOX') else None,
-                        # Try with Infomaniak format if applicable
-                        lambda: mail.append(f'/INBOX/Sent', '\\Seen', None, email_str) 
-                            if is_infomaniak else None,
-                        lambda: mail.append(f'/Sent', '\\Seen', None, email_str) 
-                            if is_infomaniak else None,
-                        lambda: mail.append(f'/INBOX/Sent Messages', '\\Seen', None, email_str) 
-                            if is_infomaniak else None,
-                        lambda: mail.append(f'/INBOX/"Sent Messages"', '\\Seen', None, email_str) 
-                            if is_infomaniak else None,
-                    ]
-                    
-                    for i, attempt_fn in enumerate(append_attempts):
-                        try:
-                            result = attempt_fn()
-                            if result is None:
-                                # Skip this attempt as it wasn't applicable
-                                continue
-                                
-                            if result and result[0] == 'OK':
-                                logging.debug(f"Successfully saved email to Sent folder (attempt {i+1})")
-                                success = True
-                                break
-                            elif result:
-                                errors.append(f"Attempt {i+1} returned: {result}")
-                        except Exception as e:
-                            errors.append(f"Attempt {i+1} failed: {str(e)}")
-                            logging.debug(f"Append attempt {i+1} failed: {str(e)}")
-                    
-                    if not success:
-                        logging.error(f"All attempts to save to Sent folder failed: {', '.join(errors)}")
-                        logging.error("The email was sent successfully, but could not be saved to the Sent folder")
-                    
-                    # Close the connection
-                    mail.logout()
-                    
-                except Exception as e:
-                    logging.error(f"Error in save_to_sent_folder task: {str(e)}")
-            
-            # Run the save operation with a 10-second timeout
-            try:
-                await asyncio.wait_for(save_to_sent_folder(), timeout=10.0)
-            except asyncio.TimeoutError:
-                logging.error("Timeout while saving to Sent folder - the email was sent but saving to Sent folder failed")
-            
+            async with account.imap_pool.acquire(folder) as mail:
+                await sync_folder(mail, account.metadata_store, folder)
         except Exception as e:
-            logging.error(f"Error saving to Sent folder: {str(e)}")
-            # Don't raise the exception, as the email was successfully sent
-            # This is just a secondary operation
-        
-        # Return without waiting for the save operation to complete
+            logging.error(f"Error syncing folder {folder} of account {account.name} after change notification: {str(e)}")
+            return
+
+def refresh_metadata_on_change(account: Account, folder: str, events: set[str]) -> None:
+    """Mark the folder's local index stale and sync it again right away."""
+    if account.metadata_store is None or folder not in {normalize_mailbox(f) for f in account.sync_folders}:
         return
-            
-    except Exception as e:
-        logging.error(f"Error in send_email_async: {str(e)}")
-        raise Exception(f"Failed to send email: {str(e)}")
+    # Stale until the sync below finishes, so searches fall back to the server meanwhile
+    account.metadata_store.mark_stale(folder)
+    account.dirty_folders.add(folder)
+    task = account.folder_sync_tasks.get(folder)
+    if task is None or task.done():
+        account.folder_sync_tasks[folder] = asyncio.create_task(_sync_dirty_folder(account, folder))
 
-async def ensure_mailbox_selected(mail: imaplib.IMAP4_SSL, mailbox: str = "inbox") -> None:
-    """Ensure a mailbox is selected before performing IMAP operations."""
-    loop = asyncio.get_event_loop()
-    try:
-        logging.debug(f"Selecting mailbox: {mailbox}")
-        
-        # First check if we need to reestablish connection
+folder_change_callbacks.append(refresh_metadata_on_change)
+folder_change_callbacks.append(forget_closed_day_counts)
+folder_change_callbacks.append(forget_thread_graph)
+
+
+class IMAPIdleListener:
+    """Holds a dedicated connection in IDLE on one folder and reports changes.
+
+    The connection is separate from the pool because IDLE ties it up
+    indefinitely. IDLE is re-issued before the 29-minute limit from RFC 2177,
+    and dropped connections are re-established with exponential backoff.
+    """
+
+    def __init__(self, account: Account, folder: str):
+        self.account = account
+        self.config = account.config
+        self.folder = normalize_mailbox(folder)
+        self.mail: AsyncIMAPClient | None = None
+
+    async def _connect(self) -> None:
+        mail = AsyncIMAPClient(self.config["imap_server"], traffic=self.account.imap_pool.traffic)
+        await mail.connect(IMAP_CONNECT_TIMEOUT)
         try:
-            status = mail.noop()[0]
+            async with asyncio.timeout(IMAP_CONNECT_TIMEOUT):
+                await mail.login(self.config["email"], self.config["password"])
+                await mail.capability()
+                if IMAP_COMPRESS:
+                    await mail.compress()
+                status, _ = await mail.select(imap_mailbox_arg(self.folder), readonly=True)
             if status != 'OK':
-                logging.warning("IMAP connection appears broken, reconnecting...")
-                mail = imaplib.IMAP4_SSL(EMAIL_CONFIG["imap_server"])
-                mail.login(EMAIL_CONFIG["email"], EMAIL_CONFIG["password"])
-        except Exception as conn_err:
-            logging.warning(f"IMAP connection error: {str(conn_err)}, reconnecting...")
-            mail = imaplib.IMAP4_SSL(EMAIL_CONFIG["imap_server"])
-            mail.login(EMAIL_CONFIG["email"], EMAIL_CONFIG["password"])
-            
-        # Now select the mailbox
-        status, _ = await loop.run_in_executor(None, lambda: mail.select(mailbox))
-        
-        if status != 'OK':
-            logging.error(f"Failed to select mailbox {mailbox}: {status}")
-            # Try to select inbox as fallback
-            if mailbox.lower() != 'inbox':
-                logging.debug("Attempting to select INBOX as fallback")
-                fallback_status, _ = await loop.run_in_executor(None, lambda: mail.select('INBOX'))
-                if fallback_status != 'OK':
-                    raise Exception(f"Could not select mailbox {mailbox} or INBOX")
-                else:
-                    logging.debug("Successfully selected INBOX as fallback")
-            else:
-                raise Exception(f"Could not select mailbox {mailbox}")
-        else:
-            logging.debug(f"Successfully selected mailbox: {mailbox}")
-            
-    except Exception as e:
-        logging.error(f"Error selecting mailbox {mailbox}: {str(e)}")
-        raise Exception(f"Error selecting mailbox: {str(e)}")
+                raise imaplib.IMAP4.error(f"Could not select {self.folder} for IDLE")
+        except BaseException:
+            mail.shutdown()
+            raise
+        self.mail = mail
 
-async def list_folders_async(mail: imaplib.IMAP4_SSL) -> list[str]:
-    """Asynchronously list all available folders/mailboxes."""
-    loop = asyncio.get_event_loop()
-    try:
-        logging.debug("Listing all available folders")
-        # Get list of all folders
-        _, folder_list = await loop.run_in_executor(None, lambda: mail.list())
-        
-        # Parse folder names
-        folders = []
-        for folder in folder_list:
-            # Decode if bytes
-            if isinstance(folder, bytes):
-                folder = folder.decode('utf-8')
-            
-            # Extract folder name (format: b'(\\HasNoChildren) "/" "folder_name"')
-            parts = folder.split(' "', 1)
-            if len(parts) > 1:
-                folder_name = parts[1].strip('"')
-                folders.append(folder_name)
-        
-        logging.debug(f"Found {len(folders)} folders")
-        return folders
-    except Exception as e:
-        logging.error(f"Error listing folders: {str(e)}")
-        raise Exception(f"Error listing folders: {str(e)}")
+    async def _idle(self) -> None:
+        """Hold one IDLE command until it is due to be re-issued, reporting changes as they arrive."""
+        responses: asyncio.Queue = asyncio.Queue()
+        command = await self.mail.idle_start(responses)
+        deadline = time.monotonic() + IMAP_IDLE_REISSUE_INTERVAL
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                kinds = [await asyncio.wait_for(responses.get(), remaining)]
+            except asyncio.TimeoutError:
+                break
+            # Report a burst of responses, e.g. EXPUNGE after EXPUNGE, as one change
+            while not responses.empty():
+                kinds.append(responses.get_nowait())
+            events = set()
+            for kind in kinds:
+                if isinstance(kind, Exception):
+                    raise kind
+                if kind == "BYE":
+                    raise imaplib.IMAP4.abort("Server closed the IDLE connection")
+                if kind in ("EXISTS", "EXPUNGE", "FETCH", "VANISHED"):
+                    events.add(kind)
+            if events:
+                notify_folder_changed(self.account, self.folder, events)
+        async with asyncio.timeout(IMAP_CONNECT_TIMEOUT):
+            await self.mail.idle_done(command)
+
+    def _shutdown(self) -> None:
+        if self.mail is not None:
+            self.mail.shutdown()
+        self.mail = None
+
+    async def run(self) -> None:
+        backoff = 1
+        try:
+            while True:
+                try:
+                    await self._connect()
+                    if 'IDLE' not in self.mail.capabilities:
+                        logging.warning(f"Server does not support IDLE, not watching {self.folder}")
+                        return
+                    logging.info(f"Listening for changes in {self.folder} with IDLE")
+                    backoff = 1
+                    # Catch up on anything that changed while we were disconnected
+                    notify_folder_changed(self.account, self.folder, {"RECONNECT"})
+                    while True:
+                        await self._idle()
+                except (imaplib.IMAP4.error, OSError, asyncio.TimeoutError) as e:
+                    logging.warning(f"IDLE connection for {self.folder} failed: {str(e)}, retrying in {backoff}s")
+                    self._shutdown()
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, IMAP_IDLE_MAX_BACKOFF)
+        finally:
+            self._shutdown()
 
 @server.list_tools()
 async def handle_list_tools() -> list[types.Tool]:
@@ -580,13 +3812,26 @@ async def handle_list_tools() -> list[types.Tool]:
     List available tools.
     Each tool specifies its arguments using JSON Schema validation.
     """
+    # Every tool works on one account, the default one unless named
+    configured = get_accounts()
+    default_name = get_account().name
+    account_property = {
+        "type": "string",
+        "description": f"Account to use, one of: {', '.join(configured)} (defaults to {default_name})",
+    }
     return [
         types.Tool(
             name="list-folders",
             description="List all available email folders/mailboxes in the email account",
             inputSchema={
                 "type": "object",
-                "properties": {},
+                "properties": {
+                    "account": account_property,
+                    "refresh": {
+                        "type": "boolean",
+                        "description": "Ask the server again instead of using the cached folder list, e.g. after folders were created or renamed (optional)",
+                    },
+                },
             },
         ),
         types.Tool(
@@ -595,6 +3840,10 @@ async def handle_list_tools() -> list[types.Tool]:
             inputSchema={
                 "type": "object",
                 "properties": {
+                    "account": {
+                        "type": "string",
+                        "description": f"Account to search, one of: {', '.join(configured)}, or '*' to search the folder(s) in every account concurrently, merged by date like a multi-folder search (defaults to {default_name})",
+                    },
                     "start_date": {
                         "type": "string",
                         "description": "Start date in YYYY-MM-DD format (optional)",
@@ -605,12 +3854,45 @@ async def handle_list_tools() -> list[types.Tool]:
                     },
                     "keyword": {
                         "type": "string",
-                        "description": "Keyword to search in email subject and body (optional)",
+                        "description": "Keyword to search for (optional); non-ASCII text is supported",
+                    },
+                    "search_in": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": ["subject", "from", "to", "body", "text"]},
+                        "description": "Where to look for the keyword; several fields match if any of them contains it. 'text' covers headers and body (defaults to ['subject'])",
+                    },
+                    "exclude_keyword": {
+                        "type": "string",
+                        "description": "Leave out emails containing this keyword in the search_in fields (optional)",
+                    },
+                    "mode": {
+                        "type": "string",
+                        "enum": ["server", "fulltext"],
+                        "description": "'server' searches on the mail server (default). 'fulltext' ranks previously read emails in the local full-text index without contacting the server; keyword then supports \"exact phrases\", prefix* terms and AND/OR/NOT",
+                    },
+                    "gmail_raw": {
+                        "type": "string",
+                        "description": "Gmail only: search query in Gmail's own syntax, e.g. 'has:attachment larger:5M' (optional)",
+                    },
+                    "page_size": {
+                        "type": "integer",
+                        "description": f"Number of emails per page, newest first (defaults to {SEARCH_PAGE_SIZE}, at most {MAX_EMAILS})",
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "next_cursor from a previous search-emails result, to get the next page of older emails. The other search arguments are ignored when a cursor is given",
                     },
                     "folder": {
                         "type": "string",
                         "description": "Folder/mailbox to search in (defaults to 'inbox')",
                     },
+                    "folders": {
+                        "oneOf": [
+                            {"type": "array", "items": {"type": "string"}},
+                            {"type": "string", "enum": ["*"]},
+                        ],
+                        "description": "Search several folders at once instead of folder: a list of folders, or '*' for all of them. Returns the newest page_size matches across the folders, sorted by date, without a cursor",
+                    },
                 },
             },
         ),
@@ -620,13 +3902,87 @@ async def handle_list_tools() -> list[types.Tool]:
             inputSchema={
                 "type": "object",
                 "properties": {
+                    "account": account_property,
+                    "email_id": {
+                        "type": "string",
+                        "description": "The ID of the email to retrieve, as returned by search-emails (folder:uidvalidity:uid)",
+                    },
+                    "folder": {
+                        "type": "string",
+                        "description": "Folder/mailbox containing the email, only used when email_id is a bare UID (defaults to 'inbox')",
+                    },
+                    "max_bytes": {
+                        "type": "integer",
+                        "description": "Return only about this many bytes of the body, for very large emails (optional, defaults to the whole body)",
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Byte offset in the body to start from; use the next_offset of the previous response to read the next chunk (defaults to 0)",
+                    },
+                },
+                "required": ["email_id"],
+            },
+        ),
+        types.Tool(
+            name="get-thread",
+            description="Show the conversation an email belongs to as a reply tree, oldest first",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "account": account_property,
+                    "email_id": {
+                        "type": "string",
+                        "description": "The ID of any email in the conversation, as returned by search-emails (folder:uidvalidity:uid)",
+                    },
+                    "folder": {
+                        "type": "string",
+                        "description": "Folder/mailbox containing the email, only used when email_id is a bare UID (defaults to 'inbox')",
+                    },
+                },
+                "required": ["email_id"],
+            },
+        ),
+        types.Tool(
+            name="list-attachments",
+            description="List the attachments of an email (filename, type, size and part number) without downloading them",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "account": account_property,
+                    "email_id": {
+                        "type": "string",
+                        "description": "The ID of the email, as returned by search-emails (folder:uidvalidity:uid)",
+                    },
+                    "folder": {
+                        "type": "string",
+                        "description": "Folder/mailbox containing the email, only used when email_id is a bare UID (defaults to 'inbox')",
+                    },
+                },
+                "required": ["email_id"],
+            },
+        ),
+        types.Tool(
+            name="get-attachment",
+            description="Download one attachment of an email to a local file and return its path",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "account": account_property,
                     "email_id": {
                         "type": "string",
-                        "description": "The ID of the email to retrieve",
+                        "description": "The ID of the email, as returned by search-emails (folder:uidvalidity:uid)",
+                    },
+                    "part": {
+                        "type": "string",
+                        "description": "Part number of the attachment, as shown by list-attachments",
+                    },
+                    "filename": {
+                        "type": "string",
+                        "description": "Filename of the attachment, as an alternative to part",
                     },
                     "folder": {
                         "type": "string",
-                        "description": "Folder/mailbox containing the email (defaults to 'inbox')",
+                        "description": "Folder/mailbox containing the email, only used when email_id is a bare UID (defaults to 'inbox')",
                     },
                 },
                 "required": ["email_id"],
@@ -634,10 +3990,11 @@ async def handle_list_tools() -> list[types.Tool]:
         ),
         types.Tool(
             name="count-daily-emails",
-            description="Count emails received for each day in a date range",
+            description="Count emails received for each day, week or month in a date range",
             inputSchema={
                 "type": "object",
                 "properties": {
+                    "account": account_property,
                     "start_date": {
                         "type": "string",
                         "description": "Start date in YYYY-MM-DD format",
@@ -650,6 +4007,15 @@ async def handle_list_tools() -> list[types.Tool]:
                         "type": "string",
                         "description": "Folder/mailbox to count emails in (defaults to 'inbox')",
                     },
+                    "granularity": {
+                        "type": "string",
+                        "enum": ["day", "week", "month"],
+                        "description": "Bucket size for the counts (defaults to 'day')",
+                    },
+                    "timezone": {
+                        "type": "string",
+                        "description": "IANA timezone used to assign emails to days, e.g. 'Europe/Zurich' (defaults to the server setting)",
+                    },
                 },
                 "required": ["start_date", "end_date"],
             },
@@ -660,6 +4026,7 @@ async def handle_list_tools() -> list[types.Tool]:
             inputSchema={
                 "type": "object",
                 "properties": {
+                    "account": account_property,
                     "to": {
                         "type": "array",
                         "items": {"type": "string"},
@@ -682,6 +4049,88 @@ async def handle_list_tools() -> list[types.Tool]:
                 "required": ["to", "subject", "content"],
             },
         ),
+        types.Tool(
+            name="send-emails-batch",
+            description="CONFIRMATION STEP: Send many emails in one call after the user confirms them, either a list of complete messages or a template whose ${name} placeholders are filled in per recipient. Reports for every message which recipients were accepted or refused and how often it was retried.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "account": account_property,
+                    "messages": {
+                        "type": "array",
+                        "description": "Complete emails to send (use this or template)",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "to": {"type": "array", "items": {"type": "string"}},
+                                "cc": {"type": "array", "items": {"type": "string"}},
+                                "subject": {"type": "string"},
+                                "content": {"type": "string"},
+                            },
+                            "required": ["to", "subject", "content"],
+                        },
+                    },
+                    "template": {
+                        "type": "object",
+                        "description": "Subject and content with ${name} placeholders; ${to} is the recipient's address",
+                        "properties": {
+                            "subject": {"type": "string"},
+                            "content": {"type": "string"},
+                        },
+                        "required": ["subject", "content"],
+                    },
+                    "recipients": {
+                        "type": "array",
+                        "description": "One entry per email rendered from the template",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "to": {"type": "array", "items": {"type": "string"}},
+                                "cc": {"type": "array", "items": {"type": "string"}},
+                                "variables": {
+                                    "type": "object",
+                                    "additionalProperties": {"type": "string"},
+                                    "description": "Values for the template placeholders",
+                                },
+                            },
+                            "required": ["to"],
+                        },
+                    },
+                    "concurrency": {
+                        "type": "integer",
+                        "description": f"Emails sent in parallel, at most the SMTP pool size (default and maximum: {SMTP_POOL_SIZE})",
+                    },
+                    "rate_limit": {
+                        "type": "number",
+                        "description": "Maximum emails started per second, 0 for no limit (defaults to the server setting)",
+                    },
+                },
+            },
+        ),
+        types.Tool(
+            name="get-send-status",
+            description="Show whether copies of sent emails have been saved to the Sent folder yet, and which saves keep failing",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "account": account_property,
+                    "retry_failed": {
+                        "type": "boolean",
+                        "description": "Queue saves that gave up for another round of attempts (default: false)",
+                    },
+                },
+            },
+        ),
+        types.Tool(
+            name="get-server-stats",
+            description="Show statistics of the email server: message cache size and hit rate, and IMAP traffic before and after compression",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "account": account_property,
+                },
+            },
+        ),
     ]
 
 @server.call_tool()
@@ -695,6 +4144,17 @@ async def handle_call_tool(
     if not arguments:
         arguments = {}
     
+    # account '*' fans a search out over every account
+    all_accounts = name == "search-emails" and arguments.get("account") == "*"
+    try:
+        account = get_account(None if all_accounts else arguments.get("account"))
+    except ValueError as e:
+        return [types.TextContent(
+            type="text",
+            text=str(e)
+        )]
+    
+    lease = contextlib.AsyncExitStack()
     try:
         if name == "send-email":
             to_addresses = arguments.get("to", [])
@@ -715,45 +4175,10 @@ async def handle_call_tool(
                 logging.info(f"CC: {cc_addresses}")
                 
                 async with asyncio.timeout(SEARCH_TIMEOUT):
-                    await send_email_async(to_addresses, subject, content, cc_addresses)
-                    # Try checking the sent folder to confirm message was saved there
-                    try:
-                        mail = imaplib.IMAP4_SSL(EMAIL_CONFIG["imap_server"])
-                        mail.login(EMAIL_CONFIG["email"], EMAIL_CONFIG["password"])
-                        
-                        # Try different variations of Sent folder names that might exist
-                        sent_folder_options = [
-                            'Sent', 
-                            'Sent Messages', 
-                            'INBOX.Sent',
-                            '"Sent Messages"',
-                            'Sent Items'
-                        ]
-                        
-                        for folder in sent_folder_options:
-                            try:
-                                status, _ = mail.select(folder, readonly=True)
-                                if status == 'OK':
-                                    logging.info(f"Successfully found and selected sent folder: {folder}")
-                                    # Check if there are any messages in this folder
-                                    _, msg_count = mail.search(None, 'ALL')
-                                    if msg_count[0]:
-                                        count = len(msg_count[0].split())
-                                        logging.info(f"Found {count} messages in sent folder '{folder}'")
-                                    else:
-                                        logging.info(f"No messages found in sent folder '{folder}'")
-                                    mail.close()
-                                    break
-                            except Exception as e:
-                                logging.debug(f"Could not select folder {folder}: {str(e)}")
-                        
-                        mail.logout()
-                    except Exception as check_err:
-                        logging.error(f"Error checking sent folder: {str(check_err)}")
-                    
+                    await send_email_async(account, to_addresses, subject, content, cc_addresses)
                     return [types.TextContent(
                         type="text",
-                        text="Email sent successfully! The email was sent to the recipient(s). A copy should appear in your Sent folder, though this may depend on your email provider's configuration. If it doesn't appear in the Sent folder, the email was still delivered to the recipient(s). Check email_client.log for detailed logs."
+                        text="Email sent successfully! The email was sent to the recipient(s). A copy is being saved to your Sent folder in the background; use get-send-status to check on it. If it doesn't appear in the Sent folder, the email was still delivered to the recipient(s). Check email_client.log for detailed logs."
                     )]
             except asyncio.TimeoutError:
                 logging.error("Operation timed out while sending email")
@@ -769,14 +4194,64 @@ async def handle_call_tool(
                     text=f"Failed to send email: {error_msg}\n\nPlease check:\n1. Email and password are correct in .env\n2. SMTP settings are correct\n3. Less secure app access is enabled (for Gmail)\n4. Using App Password if 2FA is enabled"
                 )]
         
-        # Connect to IMAP server using predefined credentials
-        mail = imaplib.IMAP4_SSL(EMAIL_CONFIG["imap_server"])
-        mail.login(EMAIL_CONFIG["email"], EMAIL_CONFIG["password"])
+        if name == "send-emails-batch":
+            try:
+                messages = render_batch_messages(arguments)
+                concurrency = int(arguments.get("concurrency", SMTP_POOL_SIZE))
+                rate = float(arguments.get("rate_limit", SMTP_BATCH_RATE_LIMIT))
+                if concurrency < 1 or rate < 0:
+                    raise ValueError("concurrency must be at least 1 and rate_limit cannot be negative")
+            except (TypeError, ValueError, AttributeError) as e:
+                return [types.TextContent(
+                    type="text",
+                    text=f"Invalid batch: {str(e)}"
+                )]
+            
+            logging.info(f"Sending a batch of {len(messages)} emails")
+            results = await send_email_batch_async(account, messages, min(concurrency, SMTP_POOL_SIZE), rate)
+            
+            delivered = sum(1 for result in results if result["accepted"] and not result["refused"])
+            partial = sum(1 for result in results if result["accepted"] and result["refused"])
+            result_text = f"Sent {delivered} of {len(results)} emails"
+            if partial:
+                result_text += f", {partial} more to only some recipients"
+            result_text += f", {len(results) - delivered - partial} failed.\n\n"
+            for i, result in enumerate(results, 1):
+                result_text += f"{i}. To: {', '.join(result['to'])} | Subject: {result['subject']}\n"
+                if result["accepted"]:
+                    result_text += f"   Accepted: {', '.join(result['accepted'])}\n"
+                for address, reply in result["refused"].items():
+                    result_text += f"   Refused: {address} ({reply})\n"
+                if result["error"]:
+                    result_text += f"   Error: {result['error']}\n"
+                if result["retries"]:
+                    result_text += f"   Retries: {result['retries']}\n"
+            if delivered or partial:
+                result_text += "\nCopies are being saved to your Sent folder in the background; use get-send-status to check on them."
+            
+            return [types.TextContent(
+                type="text",
+                text=result_text
+            )]
+        
+        async def lease_mail() -> IMAPSession:
+            """Lease an authenticated connection from the account's IMAP pool."""
+            return await lease.enter_async_context(account.imap_pool.acquire(arguments.get("folder")))
         
         if name == "list-folders":
             try:
-                async with asyncio.timeout(SEARCH_TIMEOUT):
-                    folders = await list_folders_async(mail)
+                refresh = bool(arguments.get("refresh", False))
+                if refresh:
+                    # Forget cached folders, including the resolved Sent/Drafts/Trash mailboxes
+                    account.folder_cache.invalidate()
+                    account.special_folder_store.forget()
+                
+                # Use the folder list recorded by the metadata sync when there is one
+                folders = account.metadata_store.get_folder_list() if account.metadata_store is not None and not refresh else None
+                if folders is None:
+                    mail = await lease_mail()
+                    async with asyncio.timeout(SEARCH_TIMEOUT):
+                        folders = await list_folders_async(account, mail, refresh)
                     
                 if not folders:
                     return [types.TextContent(
@@ -801,163 +4276,332 @@ async def handle_call_tool(
                     text=result_text
                 )]
                 
-            except asyncio.TimeoutError:
+            except asyncio.TimeoutError:
+                return [types.TextContent(
+                    type="text",
+                    text="Operation timed out while listing folders."
+                )]
+                
+        elif name == "search-emails":
+            folder = arguments.get("folder", "inbox").strip()
+            start_date = arguments.get("start_date", "")
+            end_date = arguments.get("end_date", "")
+            keyword = arguments.get("keyword", "")
+            search_in = arguments.get("search_in") or ["subject"]
+            if isinstance(search_in, str):
+                search_in = [search_in]
+            exclude_keyword = arguments.get("exclude_keyword", "")
+            gmail_raw = arguments.get("gmail_raw", "")
+            mode = arguments.get("mode", "server")
+            cursor = arguments.get("cursor", "")
+            page_size = arguments.get("page_size", SEARCH_PAGE_SIZE)
+            
+            if not isinstance(page_size, int) or not 1 <= page_size <= MAX_EMAILS:
+                return [types.TextContent(
+                    type="text",
+                    text=f"Invalid page_size: {page_size}. Use a number between 1 and {MAX_EMAILS}."
+                )]
+            
+            if mode not in ("server", "fulltext"):
+                return [types.TextContent(
+                    type="text",
+                    text=f"Invalid mode: {mode}. Use 'server' or 'fulltext'."
+                )]
+            
+            unknown_fields = [field for field in search_in if field not in SEARCH_FIELDS]
+            if unknown_fields:
+                return [types.TextContent(
+                    type="text",
+                    text=f"Invalid search_in value(s): {', '.join(unknown_fields)}. Use any of: {', '.join(SEARCH_FIELDS)}."
+                )]
+            
+            # Parse the date range
+            if start_date:
+                try:
+                    since_dt = datetime.strptime(start_date, "%Y-%m-%d")
+                except ValueError:
+                    return [types.TextContent(
+                        type="text",
+                        text=f"Invalid start date format: {start_date}. Use YYYY-MM-DD format."
+                    )]
+            else:
+                # Default to 7 days ago if no start date
+                since_dt = datetime.now() - timedelta(days=7)
+            
+            if end_date:
+                try:
+                    dt = datetime.strptime(end_date, "%Y-%m-%d")
+                    # Add one day to make the search inclusive
+                    before_dt = dt + timedelta(days=1)
+                except ValueError:
+                    return [types.TextContent(
+                        type="text",
+                        text=f"Invalid end date format: {end_date}. Use YYYY-MM-DD format."
+                    )]
+            else:
+                # Default to tomorrow if no end date
+                before_dt = datetime.now() + timedelta(days=1)
+            
+            if mode == "fulltext":
+                # Ranked search over locally indexed bodies, without any network I/O
+                if all_accounts:
+                    return [types.TextContent(
+                        type="text",
+                        text="The local full-text index is searched one account at a time. Name an account instead of '*'."
+                    )]
+                if account.fulltext_index is None:
+                    return [types.TextContent(
+                        type="text",
+                        text="The local full-text index is disabled. Set FULLTEXT_INDEX=true to enable it; emails are indexed as they are read with get-email-content."
+                    )]
+                try:
+                    email_list = account.fulltext_index.search(
+                        keyword,
+                        folder=arguments.get("folder"),
+                        since=since_dt if start_date else None,
+                        before=before_dt if end_date else None,
+                        limit=page_size,
+                    )
+                except ValueError as e:
+                    return [types.TextContent(
+                        type="text",
+                        text=str(e)
+                    )]
+                if not email_list:
+                    return [types.TextContent(
+                        type="text",
+                        text=f"No indexed emails match '{keyword}'."
+                    )]
+                result_text = f"Best matches for '{keyword}' in the local full-text index:\n\n"
+                result_text += "ID | From | Date | Subject\n"
+                result_text += "-" * 80 + "\n"
+                for email_data in email_list:
+                    result_text += f"{email_data['id']} | {email_data['from']} | {email_data['date']} | {email_data['subject']}\n"
+                    result_text += f"    {email_data['snippet']}\n"
+                result_text += "\nOnly emails previously opened with get-email-content are indexed."
+                return [types.TextContent(
+                    type="text",
+                    text=result_text
+                )]
+            
+            # Very short timeout to ensure we return before client timeouts 
+            search_timeout = 10  # 10 seconds maximum
+            
+            folders = arguments.get("folders")
+            if (folders or all_accounts) and not cursor:
+                searched_accounts = list(accounts.values()) if all_accounts else [account]
+                try:
+                    listing_problems = {}
+                    if folders == "*":
+                        # Each account lists its folders on its own connection
+                        folder_lists = await asyncio.gather(
+                            *(asyncio.wait_for(list_account_folders_async(searched_account), search_timeout)
+                              for searched_account in searched_accounts),
+                            return_exceptions=True,
+                        )
+                        targets = []
+                        for searched_account, account_folders in zip(searched_accounts, folder_lists):
+                            if isinstance(account_folders, Exception):
+                                if not all_accounts:
+                                    raise account_folders
+                                listing_problems[searched_account, "*"] = f"could not list folders: {str(account_folders) or type(account_folders).__name__}"
+                                continue
+                            targets.extend((searched_account, account_folder) for account_folder in account_folders)
+                    else:
+                        if not folders:
+                            folders = [folder]
+                        elif isinstance(folders, str):
+                            folders = [folders]
+                        targets = [
+                            (searched_account, account_folder)
+                            for searched_account in searched_accounts
+                            for account_folder in dict.fromkeys(folders)
+                        ]
+                    # Answer with whatever the folders found before the deadline
+                    total, email_list, problems = await search_folders_async(
+                        targets, search_timeout, page_size,
+                        since=since_dt, before=before_dt, keyword=keyword, search_in=search_in,
+                        exclude_keyword=exclude_keyword, gmail_raw=gmail_raw,
+                    )
+                except Exception as e:
+                    return [types.TextContent(
+                        type="text",
+                        text=f"Error during search operation: {str(e)}"
+                    )]
+                
+                searched = len(targets) - len(problems)
+                scope = f"{searched} of {len(targets)} folders"
+                if all_accounts:
+                    scope += f" across {len(searched_accounts)} accounts"
+                if email_list:
+                    result_text = f"Found {total} emails in {scope}, showing the newest {len(email_list)}:\n\n"
+                    result_text += "Account | ID | From | Date | Subject\n" if all_accounts else "ID | From | Date | Subject\n"
+                    result_text += "-" * 80 + "\n"
+                    for email_data in email_list:
+                        if all_accounts:
+                            result_text += f"{email_data['account']} | "
+                        result_text += f"{email_data['id']} | {email_data['from']} | {email_data['date']} | {email_data['subject']}\n"
+                else:
+                    result_text = f"No emails found in {scope} matching your search criteria.\n"
+                problems.update(listing_problems)
+                if problems:
+                    result_text += "\nThese folders were not searched completely, so results may be missing:\n"
+                    for (problem_account, problem_folder), reason in problems.items():
+                        label = f"{problem_account.name}: {problem_folder}" if all_accounts else problem_folder
+                        result_text += f"- {label}: {reason}\n"
+                if total > len(email_list):
+                    result_text += "\nNarrow the date range or search fewer folders to see older matches."
+                if all_accounts and email_list:
+                    result_text += "\nPass the account together with an email ID to get-email-content."
+                
                 return [types.TextContent(
                     type="text",
-                    text="Operation timed out while listing folders."
+                    text=result_text.encode('utf-8', errors='replace').decode('utf-8')
                 )]
-                
-        elif name == "search-emails":
-            folder = arguments.get("folder", "inbox").strip()
-            start_date = arguments.get("start_date", "")
-            end_date = arguments.get("end_date", "")
-            keyword = arguments.get("keyword", "")
-            
-            # Connect to IMAP server
-            mail = imaplib.IMAP4_SSL(EMAIL_CONFIG["imap_server"])
-            mail.login(EMAIL_CONFIG["email"], EMAIL_CONFIG["password"])
             
             try:
-                # Select the folder to search in
-                await ensure_mailbox_selected(mail, folder)
-                
-                # Format dates for IMAP search
-                if start_date:
-                    try:
-                        dt = datetime.strptime(start_date, "%Y-%m-%d")
-                        start_date = dt.strftime("%d-%b-%Y")
-                    except ValueError:
-                        return [types.TextContent(
-                            type="text",
-                            text=f"Invalid start date format: {start_date}. Use YYYY-MM-DD format."
-                        )]
-                else:
-                    # Default to 7 days ago if no start date
-                    dt = datetime.now() - timedelta(days=7)
-                    start_date = dt.strftime("%d-%b-%Y")
-                
-                if end_date:
-                    try:
-                        dt = datetime.strptime(end_date, "%Y-%m-%d")
-                        # Add one day to make the search inclusive
-                        next_day = (dt + timedelta(days=1)).strftime("%d-%b-%Y")
-                    except ValueError:
-                        return [types.TextContent(
-                            type="text",
-                            text=f"Invalid end date format: {end_date}. Use YYYY-MM-DD format."
-                        )]
-                else:
-                    # Default to tomorrow if no end date
-                    dt = datetime.now() + timedelta(days=1)
-                    next_day = dt.strftime("%d-%b-%Y")
-                
-                # Build the search criteria
-                search_criteria = f'SINCE "{start_date}" BEFORE "{next_day}"'
-                
-                if keyword:
-                    search_criteria = f'({search_criteria}) SUBJECT "{keyword}"'
-                
-                # Very short timeout to ensure we return before client timeouts 
-                search_timeout = 10  # 10 seconds maximum
-                
-                try:
-                    # Limit the number of emails right in the IMAP search to minimize processing
-                    email_list = []
+                async with asyncio.timeout(search_timeout):
+                    if cursor:
+                        # A later page of an earlier search: only its slice is fetched
+                        try:
+                            results, offset = account.search_cursors.load(cursor)
+                        except ValueError as e:
+                            error = str(e)
+                            if not arguments.get("account") and len(accounts) > 1:
+                                error += " A cursor from a search of another account needs that account too."
+                            return [types.TextContent(
+                                type="text",
+                                text=error
+                            )]
+                        folder = results["folder"]
+                        uids = results["uids"]
+                        use_local_index = (
+                            results["local"]
+                            and account.metadata_store is not None
+                            and account.metadata_store.is_fresh(folder)
+                        )
+                    else:
+                        # Answer from the local metadata index when the folder is synced;
+                        # it only knows subjects, so other search modes go to the server
+                        use_local_index = (
+                            account.metadata_store is not None
+                            and account.metadata_store.is_fresh(folder)
+                            and search_in == ["subject"]
+                            and not exclude_keyword
+                            and not gmail_raw
+                        )
+                        offset = 0
+                    
+                    if not use_local_index:
+                        mail = await lease_mail()
+                        if gmail_raw and not mail.has_capability('X-GM-EXT-1'):
+                            return [types.TextContent(
+                                type="text",
+                                text="gmail_raw is only supported on Gmail servers (X-GM-EXT-1)."
+                            )]
+                        # Select the folder to search in
+                        await ensure_mailbox_selected(mail, folder)
+                        if cursor and (mail.selected_mailbox != normalize_mailbox(folder) or mail.uidvalidity != results["uidvalidity"]):
+                            return [types.TextContent(
+                                type="text",
+                                text=f"Folder '{folder}' changed on the server since this search. Please run the search again."
+                            )]
                     
-                    async with asyncio.timeout(search_timeout):
-                        # Search for emails
-                        loop = asyncio.get_event_loop()
-                        _, messages = await loop.run_in_executor(None, lambda: mail.search(None, search_criteria))
+                    # Newest emails first: each page moves further back in time
+                    if not cursor:
+                        search_criteria = None
+                        if use_local_index:
+                            uids = account.metadata_store.search_uids(folder, since_dt, before_dt, keyword)
+                            uidvalidity = (account.metadata_store.get_folder_state(folder) or {}).get("uidvalidity")
+                            total = len(uids)
+                            page_uids = account.search_cursors.page(uids, 0, page_size)[::-1]
+                        else:
+                            # Search for emails by UID so the IDs stay valid across sessions;
+                            # with SORT/ESEARCH only this page may cross the wire
+                            search_criteria = build_search_criteria(
+                                since_dt, before_dt, keyword, search_in, exclude_keyword, gmail_raw
+                            )
+                            total, page_uids, uids = await search_window_async(mail, search_criteria, 0, page_size)
+                            uidvalidity = mail.uidvalidity
                         
-                        if not messages[0]:
+                        if not total:
                             return [types.TextContent(
                                 type="text",
                                 text=f"No emails found in '{folder}' matching your search criteria."
                             )]
                         
-                        # Get the last 20 emails at most to ensure quick response
-                        ids = messages[0].split()[-20:]
-                        
-                        # Fetch basic headers for each email (faster than getting full content)
-                        for email_id in ids:
-                            try:
-                                # Use FETCH with specific headers to speed up response
-                                _, header_data = await loop.run_in_executor(
-                                    None, 
-                                    lambda: mail.fetch(email_id, '(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)])')
-                                )
-                                
-                                # Parse header data
-                                raw_headers = header_data[0][1]
-                                if isinstance(raw_headers, bytes):
-                                    raw_headers = raw_headers.decode('utf-8', errors='replace')
-                                
-                                # Extract headers
-                                header_dict = {}
-                                for line in raw_headers.split('\r\n'):
-                                    if ':' in line:
-                                        key, value = line.split(':', 1)
-                                        header_dict[key.strip().lower()] = value.strip()
-                                
-                                # Add to results
-                                email_list.append({
-                                    "id": email_id.decode('utf-8', errors='replace'),
-                                    "from": header_dict.get('from', 'Unknown'),
-                                    "date": header_dict.get('date', 'Unknown'),
-                                    "subject": header_dict.get('subject', 'No Subject')
-                                })
-                            except Exception:
-                                # Skip problematic emails
-                                continue
-                    
-                    # Format the results
-                    if not email_list:
-                        return [types.TextContent(
-                            type="text",
-                            text=f"No emails could be retrieved from '{folder}' matching your search criteria."
-                        )]
-                    
-                    result_text = f"Found emails in '{folder}':\n\n"
-                    result_text += "ID | From | Date | Subject\n"
-                    result_text += "-" * 80 + "\n"
-                    
-                    for email_data in email_list:
-                        try:
-                            result_text += f"{email_data['id']} | {email_data['from']} | {email_data['date']} | {email_data['subject']}\n"
-                        except Exception:
-                            # Skip problematic formatting
-                            continue
-                    
-                    result_text += f"\nUse get-email-content with an email ID and folder='{folder}' to view the full content of a specific email."
+                        # Keep the full result set so later pages skip the SEARCH,
+                        # or the criteria when the server only sent this page
+                        token = account.search_cursors.store(
+                            folder, uidvalidity, uids, local=use_local_index,
+                            criteria=search_criteria if uids is None else None,
+                        )
+                    else:
+                        token = cursor.rpartition(".")[0]
+                        if uids is None:
+                            total, page_uids, _ = await search_window_async(mail, results["criteria"], offset, page_size)
+                        else:
+                            total = len(uids)
+                            page_uids = account.search_cursors.page(uids, offset, page_size)[::-1]
                     
-                    # Ensure the text is properly encoded
-                    result_text = result_text.encode('utf-8', errors='replace').decode('utf-8')
+                    next_cursor = account.search_cursors.next_cursor(token, total, offset, page_size)
                     
+                    if use_local_index:
+                        email_list = account.metadata_store.summaries(folder, page_uids)
+                    else:
+                        # Fetch basic headers for this page in a single round trip
+                        email_list = await fetch_email_summaries(mail, page_uids)
+                
+                # Format the results
+                if not email_list:
                     return [types.TextContent(
                         type="text",
-                        text=result_text
-                    )]
-                except asyncio.TimeoutError:
-                    return [types.TextContent(
-                        type="text",
-                        text=f"The search operation is taking longer than expected. Please try again with more specific search criteria to narrow down the results."
-                    )]
-                except Exception as e:
-                    return [types.TextContent(
-                        type="text",
-                        text=f"Error during search operation: {str(e)}"
+                        text=f"No emails could be retrieved from '{folder}' matching your search criteria."
                     )]
-            finally:
-                # Clean up the connection
-                try:
-                    mail.close()
-                    mail.logout()
-                except:
-                    pass
+                
+                result_text = f"Found {total} emails in '{folder}', showing the newest {offset + 1}-{offset + len(page_uids)}:\n\n"
+                result_text += "ID | From | Date | Subject\n"
+                result_text += "-" * 80 + "\n"
+                
+                for email_data in email_list:
+                    try:
+                        result_text += f"{email_data['id']} | {email_data['from']} | {email_data['date']} | {email_data['subject']}\n"
+                    except Exception:
+                        # Skip problematic formatting
+                        continue
+                
+                if next_cursor:
+                    result_text += f"\nnext_cursor: {next_cursor}\nPass it as cursor to search-emails for the next {page_size} older emails (valid for {SEARCH_CURSOR_TTL // 60} minutes)"
+                    # Cursors are kept by the account that ran the search
+                    result_text += f", together with account '{account.name}'.\n" if account is not get_account() else ".\n"
+                else:
+                    result_text += "\nThis is the last page of results.\n"
+                
+                result_text += "\nUse get-email-content with an email ID to view the full content of a specific email. IDs stay valid until the folder is rebuilt on the server."
+                
+                # Ensure the text is properly encoded
+                result_text = result_text.encode('utf-8', errors='replace').decode('utf-8')
+                
+                return [types.TextContent(
+                    type="text",
+                    text=result_text
+                )]
+            except asyncio.TimeoutError:
+                return [types.TextContent(
+                    type="text",
+                    text=f"The search operation is taking longer than expected. Please try again with more specific search criteria to narrow down the results."
+                )]
+            except Exception as e:
+                return [types.TextContent(
+                    type="text",
+                    text=f"Error during search operation: {str(e)}"
+                )]
         
         elif name == "get-email-content":
             email_id = arguments.get("email_id")
             folder = arguments.get("folder", "inbox")
+            max_bytes = arguments.get("max_bytes")
+            offset = arguments.get("offset", 0)
             
             if not email_id:
                 return [types.TextContent(
@@ -965,13 +4609,51 @@ async def handle_call_tool(
                     text="Email ID is required."
                 )]
             
+            if max_bytes is not None and (not isinstance(max_bytes, int) or max_bytes < MIN_BODY_CHUNK_BYTES):
+                return [types.TextContent(
+                    type="text",
+                    text=f"Invalid max_bytes: {max_bytes}. Use a number of at least {MIN_BODY_CHUNK_BYTES}."
+                )]
+            if not isinstance(offset, int) or offset < 0:
+                return [types.TextContent(
+                    type="text",
+                    text=f"Invalid offset: {offset}. Use a non-negative number."
+                )]
+            
             try:
-                # Select specified mailbox before fetching email content
-                await ensure_mailbox_selected(mail, folder)
+                folder, uidvalidity, uid = decode_email_id(email_id, folder)
+            except ValueError as e:
+                return [types.TextContent(
+                    type="text",
+                    text=str(e)
+                )]
+            
+            try:
+                # Cached emails are answered without contacting the server
+                email_content = structure = None
+                if uidvalidity is not None:
+                    email_content, structure = await get_cached_email_content(account, folder, uidvalidity, uid, offset, max_bytes)
                 
-                async with asyncio.timeout(SEARCH_TIMEOUT):
-                    email_content = await get_email_content_async(mail, email_id)
+                if email_content is None:
+                    # Select the mailbox the email lives in before fetching its content
+                    mail = await lease_mail()
+                    await ensure_mailbox_selected(mail, folder)
+                    
+                    error = check_selected_email_folder(account, mail, folder, uidvalidity, email_id)
+                    if error:
+                        return [types.TextContent(
+                            type="text",
+                            text=error
+                        )]
+                    
+                    async with asyncio.timeout(SEARCH_TIMEOUT):
+                        email_content = await get_email_content_async(account, mail, uid, offset, max_bytes, structure)
+                    uidvalidity = mail.uidvalidity
                     
+                # Only complete bodies go into the full-text index
+                if account.fulltext_index is not None and uidvalidity is not None and not offset and email_content["next_offset"] is None:
+                    account.fulltext_index.add_message(folder, uidvalidity, uid, email_content)
+                
                 # Sanitize the email content before returning
                 for key in ['from', 'to', 'subject', 'content']:
                     if key in email_content:
@@ -985,6 +4667,14 @@ async def handle_call_tool(
                     f"\nContent:\n{email_content['content']}"
                 )
                 
+                if email_content["next_offset"] is not None:
+                    result_text += (
+                        f"\n\n[Showing bytes {offset}-{email_content['next_offset']} of {email_content['total_bytes']}. "
+                        f"Call get-email-content with offset={email_content['next_offset']} to read the next chunk.]"
+                    )
+                elif offset:
+                    result_text += f"\n\n[End of the body ({email_content['total_bytes']} bytes).]"
+                
                 # Additional sanitization
                 result_text = result_text.encode('utf-8', errors='replace').decode('utf-8')
                 
@@ -999,31 +4689,254 @@ async def handle_call_tool(
                     text="Operation timed out while fetching email content."
                 )]
                 
-        elif name == "count-daily-emails":
-            start_date = datetime.strptime(arguments["start_date"], "%Y-%m-%d")
-            end_date = datetime.strptime(arguments["end_date"], "%Y-%m-%d")
+        elif name == "get-thread":
+            email_id = arguments.get("email_id")
             folder = arguments.get("folder", "inbox")
             
-            # Select specified mailbox before counting emails
-            await ensure_mailbox_selected(mail, folder)
+            if not email_id:
+                return [types.TextContent(
+                    type="text",
+                    text="Email ID is required."
+                )]
             
-            result_text = f"Daily email counts in '{folder}':\n\n"
-            result_text += "Date | Count\n"
-            result_text += "-" * 30 + "\n"
+            try:
+                folder, uidvalidity, uid = decode_email_id(email_id, folder)
+            except ValueError as e:
+                return [types.TextContent(
+                    type="text",
+                    text=str(e)
+                )]
             
-            current_date = start_date
-            while current_date <= end_date:
-                date_str = current_date.strftime("%d-%b-%Y")
-                search_criteria = f'(ON "{date_str}")'
+            try:
+                store = account.metadata_store
+                stored_uidvalidity = (store.get_folder_state(folder) or {}).get("uidvalidity") if store is not None else None
+                # Thread locally when the folder is synced and the ID is still valid in it
+                if (store is not None and store.is_fresh(folder)
+                        and uidvalidity in (None, stored_uidvalidity) and store.summaries(folder, [int(uid)])):
+                    mail = None
+                else:
+                    mail = await lease_mail()
+                    await ensure_mailbox_selected(mail, folder)
+                    error = check_selected_email_folder(account, mail, folder, uidvalidity, email_id)
+                    if error:
+                        return [types.TextContent(
+                            type="text",
+                            text=error
+                        )]
                 
-                try:
+                async with asyncio.timeout(SEARCH_TIMEOUT):
+                    thread = await get_thread_async(account, folder, int(uid), mail)
+                    uids = [thread_uid for thread_uid, _ in thread]
+                    if mail is None:
+                        email_list = store.summaries(folder, uids)
+                    else:
+                        email_list = await fetch_email_summaries(mail, uids)
+            except asyncio.TimeoutError:
+                return [types.TextContent(
+                    type="text",
+                    text="Operation timed out while threading the email."
+                )]
+            
+            if not email_list:
+                return [types.TextContent(
+                    type="text",
+                    text=f"Email {email_id} was not found in folder '{folder}'."
+                )]
+            
+            depths = dict(thread)
+            result_text = f"Conversation of email {email_id} ({len(email_list)} emails):\n\n"
+            result_text += "ID | From | Date | Subject\n"
+            result_text += "-" * 80 + "\n"
+            for email_data in email_list:
+                # Replies are indented under the email they answer
+                indent = "  " * depths.get(int(email_data["id"].rsplit(":", 1)[-1]), 0)
+                result_text += f"{indent}{email_data['id']} | {email_data['from']} | {email_data['date']} | {email_data['subject']}\n"
+            
+            return [types.TextContent(
+                type="text",
+                text=result_text
+            )]
+            
+        elif name in ("list-attachments", "get-attachment"):
+            email_id = arguments.get("email_id")
+            folder = arguments.get("folder", "inbox")
+            part_number = arguments.get("part")
+            filename = arguments.get("filename")
+            
+            if not email_id:
+                return [types.TextContent(
+                    type="text",
+                    text="Email ID is required."
+                )]
+            if name == "get-attachment" and not (part_number or filename):
+                return [types.TextContent(
+                    type="text",
+                    text="Either part or filename is required. Use list-attachments to see the attachments of an email."
+                )]
+            
+            try:
+                folder, uidvalidity, uid = decode_email_id(email_id, folder)
+            except ValueError as e:
+                return [types.TextContent(
+                    type="text",
+                    text=str(e)
+                )]
+            
+            try:
+                mail = await lease_mail()
+                await ensure_mailbox_selected(mail, folder)
+                
+                error = check_selected_email_folder(account, mail, folder, uidvalidity, email_id)
+                if error:
+                    return [types.TextContent(
+                        type="text",
+                        text=error
+                    )]
+                
+                # Only the BODYSTRUCTURE is needed to know what is attached
+                async with asyncio.timeout(SEARCH_TIMEOUT):
+                    _, parts = await fetch_body_structure(account, mail, uid)
+                attachments = list_attachment_parts(parts)
+                
+                if name == "list-attachments":
+                    if not attachments:
+                        return [types.TextContent(
+                            type="text",
+                            text=f"Email {email_id} has no attachments."
+                        )]
+                    result_text = f"Attachments of email {email_id}:\n\n"
+                    result_text += "Part | Filename | Type | Size\n"
+                    result_text += "-" * 80 + "\n"
+                    for part in attachments:
+                        result_text += f"{part['part']} | {part['filename'] or '(unnamed)'} | {part['type']} | about {format_size(estimated_decoded_size(part))}\n"
+                    result_text += "\nUse get-attachment with a part number to download an attachment."
+                    return [types.TextContent(
+                        type="text",
+                        text=result_text
+                    )]
+                
+                matches = [
+                    part for part in attachments
+                    if (part_number and part["part"] == str(part_number))
+                    or (not part_number and part["filename"] == filename)
+                ]
+                if not matches:
+                    return [types.TextContent(
+                        type="text",
+                        text=f"Email {email_id} has no attachment {part_number or repr(filename)}. Use list-attachments to see its attachments."
+                    )]
+                part = matches[0]
+                
+                path = attachment_cache_path(account, folder, mail.uidvalidity, uid, part)
+                if os.path.exists(path):
+                    size = os.path.getsize(path)
+                else:
+                    size = await save_attachment_async(mail, uid, part, path)
+                
+                return [types.TextContent(
+                    type="text",
+                    text=f"Saved attachment '{os.path.basename(path)}' ({part['type']}, {format_size(size)}) to:\n{path}"
+                )]
+            except asyncio.TimeoutError:
+                return [types.TextContent(
+                    type="text",
+                    text="Operation timed out while fetching the attachment."
+                )]
+        
+        elif name == "count-daily-emails":
+            start_day = datetime.strptime(arguments["start_date"], "%Y-%m-%d").date()
+            end_day = datetime.strptime(arguments["end_date"], "%Y-%m-%d").date()
+            folder = arguments.get("folder", "inbox")
+            granularity = arguments.get("granularity", "day")
+            tz = resolve_timezone(arguments.get("timezone"))
+            
+            if granularity not in ("day", "week", "month"):
+                return [types.TextContent(
+                    type="text",
+                    text=f"Invalid granularity: {granularity}. Use 'day', 'week' or 'month'."
+                )]
+            
+            try:
+                # Count locally when the folder is synced
+                if account.metadata_store is not None and account.metadata_store.is_fresh(folder):
+                    since = datetime.combine(start_day, datetime.min.time(), tz)
+                    before = datetime.combine(end_day + timedelta(days=1), datetime.min.time(), tz)
+                    daily_counts = bucket_by_day(account.metadata_store.internaldates(folder, since, before), tz)
+                else:
+                    # Select specified mailbox before counting emails
+                    mail = await lease_mail()
+                    await ensure_mailbox_selected(mail, folder)
                     async with asyncio.timeout(SEARCH_TIMEOUT):
-                        count = await count_emails_async(mail, search_criteria)
-                        result_text += f"{current_date.strftime('%Y-%m-%d')} | {count}\n"
-                except asyncio.TimeoutError:
-                    result_text += f"{current_date.strftime('%Y-%m-%d')} | Timeout\n"
+                        daily_counts = await count_daily_emails_async(account, mail, start_day, end_day, tz)
+            except asyncio.TimeoutError:
+                return [types.TextContent(
+                    type="text",
+                    text="Operation timed out while counting emails."
+                )]
+            
+            label = {"day": "Date", "week": "Week starting", "month": "Month"}[granularity]
+            heading = {"day": "Daily", "week": "Weekly", "month": "Monthly"}[granularity]
+            result_text = f"{heading} email counts in '{folder}' ({tz}):\n\n"
+            result_text += f"{label} | Count\n"
+            result_text += "-" * 30 + "\n"
+            for bucket, count in group_counts(daily_counts, start_day, end_day, granularity):
+                result_text += f"{bucket} | {count}\n"
+            
+            return [types.TextContent(
+                type="text",
+                text=result_text
+            )]
                 
-                current_date += timedelta(days=1)
+        elif name == "get-send-status":
+            sent_queue = account.sent_queue
+            if arguments.get("retry_failed", False):
+                requeued = sent_queue.retry_failed()
+                result_text = f"Requeued {requeued} failed saves.\n\n"
+            else:
+                result_text = ""
+            
+            pending = sent_queue.pending()
+            failed = sent_queue.failed()
+            result_text += f"Waiting to be saved to the Sent folder: {len(pending)}\n"
+            for entry in pending:
+                queued_at = datetime.fromtimestamp(entry["queued_at"]).strftime("%Y-%m-%d %H:%M:%S")
+                result_text += f"- {entry['subject']} (sent {queued_at}, {entry['attempts']} failed attempts)\n"
+                if entry["last_error"]:
+                    result_text += f"  Last error: {entry['last_error']}\n"
+            
+            if failed:
+                result_text += f"\nGave up after {sent_queue.max_attempts} attempts: {len(failed)} (call with retry_failed=true to try again)\n"
+                for entry in failed:
+                    result_text += f"- {entry['subject']}: {entry['last_error']}\n"
+            
+            if sent_queue.completed:
+                result_text += "\nRecently saved:\n"
+                for entry in reversed(sent_queue.completed):
+                    saved_at = datetime.fromtimestamp(entry["saved_at"]).strftime("%Y-%m-%d %H:%M:%S")
+                    verified = {True: ", verified", False: ", not found when verifying", None: ""}[entry["verified"]]
+                    result_text += f"- {entry['subject']} -> {entry['folder']} ({saved_at}{verified})\n"
+            
+            return [types.TextContent(
+                type="text",
+                text=result_text
+            )]
+        
+        elif name == "get-server-stats":
+            result_text = "Email server statistics:\n\n"
+            if account.message_cache is not None:
+                stats = account.message_cache.stats()
+                result_text += "Message cache:\n"
+                result_text += f"  Entries: {stats['entries']}\n"
+                result_text += f"  Size: {format_size(stats['size'])} of {format_size(stats['max_size'])}\n"
+                result_text += f"  Hits: {stats['hits']}, misses: {stats['misses']} ({stats['hit_rate']:.0%} hit rate)\n"
+            else:
+                result_text += "Message cache: disabled (set MESSAGE_CACHE=true to enable)\n"
+            
+            traffic = account.imap_pool.traffic.stats()
+            result_text += "IMAP traffic:\n"
+            result_text += f"  Sent: {format_size(traffic['sent'])} ({format_size(traffic['sent_wire'])} on the wire)\n"
+            result_text += f"  Received: {format_size(traffic['received'])} ({format_size(traffic['received_wire'])} on the wire)\n"
+            result_text += f"  On the wire: {traffic['wire_ratio']:.0%} of the uncompressed size\n"
             
             return [types.TextContent(
                 type="text",
@@ -1039,11 +4952,8 @@ async def handle_call_tool(
             text=f"Error: {str(e)}\n\nIf you see a state error, please try again. If the problem persists, check if:\n1. Your email credentials are correct\n2. Your email provider allows IMAP/SMTP access\n3. The server settings are correct"
         )]
     finally:
-        try:
-            mail.close()
-            mail.logout()
-        except:
-            pass
+        # Return the leased connection to the pool
+        await lease.aclose()
 
 async def main():
     # Initialize and set up the environment
@@ -1057,6 +4967,18 @@ async def main():
         logging.error(f"Error setting console encoding: {str(e)}")
         print(f"Error during initialization: {str(e)}", file=sys.stderr)
 
+    # Create the accounts here rather than at import, so a bad configuration is logged
+    try:
+        configured = get_accounts()
+    except Exception as e:
+        logging.error(f"Error loading email accounts: {str(e)}")
+        print(f"Error loading email accounts: {str(e)}", file=sys.stderr)
+        raise
+
+    # Each account runs its own pools, Sent folder queue, metadata sync and IDLE listeners
+    for account in configured.values():
+        account.start()
+
     # Run the server using stdin/stdout streams with proper encoding
     try:
         async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
@@ -1078,6 +5000,9 @@ async def main():
     except Exception as e:
         logging.error(f"Unexpected error in server: {e}")
         print(f"Unexpected error in server: {e}", file=sys.stderr)
+    finally:
+        for account in configured.values():
+            await account.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
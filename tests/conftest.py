@@ -0,0 +1,192 @@
+import asyncio
+import re
+import zlib
+
+import pytest
+
+from email_client import server as email_server
+from email_client.server import AsyncIMAPClient
+
+
+class Connection:
+    """Both directions of one client connection, counting bytes and deflating them once COMPRESS is active."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, traffic: dict):
+        self.raw_reader = self.reader = reader
+        self.writer = writer
+        self.traffic = traffic
+        self.deflate = None
+        self.inflate_task: asyncio.Task | None = None
+
+    def _received(self, size: int) -> None:
+        self.traffic["received"] += size
+        if self.deflate is None:
+            self.traffic["received_wire"] += size
+
+    async def readline(self) -> bytes:
+        line = await self.reader.readline()
+        self._received(len(line))
+        return line
+
+    async def readexactly(self, size: int) -> bytes:
+        data = await self.reader.readexactly(size)
+        self._received(size)
+        return data
+
+    def write(self, data: bytes) -> None:
+        self.traffic["sent"] += len(data)
+        if self.deflate is not None:
+            data = self.deflate.compress(data) + self.deflate.flush(zlib.Z_SYNC_FLUSH)
+        self.traffic["sent_wire"] += len(data)
+        self.writer.write(data)
+
+    async def drain(self) -> None:
+        await self.writer.drain()
+
+    def close(self) -> None:
+        # _inflate then reads EOF from the raw stream and passes it on
+        self.writer.close()
+
+    def start_compression(self, ok: bytes, pending: bytes) -> None:
+        """Send the tagged OK to COMPRESS and switch both directions to raw DEFLATE (RFC 4978).
+
+        `pending` goes out compressed in the same write as the OK, so the
+        client finds it already buffered when it switches over.
+        """
+        self.deflate = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        compressed = self.deflate.compress(pending) + self.deflate.flush(zlib.Z_SYNC_FLUSH)
+        self.traffic["sent"] += len(ok) + len(pending)
+        self.traffic["sent_wire"] += len(ok) + len(compressed)
+        self.writer.write(ok + compressed)
+        self.reader = asyncio.StreamReader()
+        self.inflate_task = asyncio.create_task(self._inflate())
+
+    async def _inflate(self) -> None:
+        inflate = zlib.decompressobj(-15)
+        try:
+            while chunk := await self.raw_reader.read(65536):
+                self.traffic["received_wire"] += len(chunk)
+                self.reader.feed_data(inflate.decompress(chunk))
+        finally:
+            self.reader.feed_eof()
+
+
+class FakeIMAPServer:
+    """A scripted IMAP server on localhost, speaking plain TCP.
+
+    `handler(command, args)` returns the response lines for a command, the
+    last one being the tagged status without its tag; bytes in the list are
+    sent as is, so a line ending in {n} can be followed by its literal.
+    Every command is kept in `commands` with its literals inlined.
+    COMPRESS DEFLATE is answered by the server itself when it is among the
+    capabilities; the `after_compress` lines are then sent compressed in the
+    same write as the tagged OK. `traffic` counts the bytes of all
+    connections like IMAPTraffic, from the server's side.
+    """
+
+    def __init__(self, handler=None, capabilities: str = "IMAP4rev1 IDLE", continuations: bool = True,
+                 after_compress: list[str] = ()):
+        self.handler = handler or (lambda command, args: ["OK done"])
+        self.capabilities = capabilities
+        self.commands: list[str] = []
+        self.literals: list[bytes] = []
+        self.writers: list[Connection] = []
+        self.connections: set[asyncio.Task] = set()
+        # False refuses synchronizing literals with a tagged NO instead of a continuation
+        self.continuations = continuations
+        self.after_compress = after_compress
+        self.traffic = {"sent": 0, "received": 0, "sent_wire": 0, "received_wire": 0}
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        for writer in self.writers:
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def push(self, line: str):
+        """Send an untagged response to every client, e.g. while it is in IDLE."""
+        for writer in self.writers:
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+    async def _handle(self, reader, writer):
+        self.connections.add(asyncio.current_task())
+        reader = writer = Connection(reader, writer, self.traffic)
+        self.writers.append(writer)
+        writer.write(f"* OK [CAPABILITY {self.capabilities}] ready\r\n".encode())
+        await writer.drain()
+        try:
+            while line := await reader.readline():
+                while match := re.search(rb"\{(\d+)(\+?)\}\r\n$", line):
+                    if not match.group(2):
+                        if not self.continuations:
+                            tag = line.split(b" ", 1)[0]
+                            writer.write(tag + b" NO literal refused\r\n")
+                            line = None
+                            break
+                        writer.write(b"+ go ahead\r\n")
+                        await writer.drain()
+                    literal = await reader.readexactly(int(match.group(1)))
+                    self.literals.append(literal)
+                    line = line[:match.start()] + b"<" + literal + b">" + await reader.readline()
+                if line is None:
+                    await writer.drain()
+                    continue
+                tag, command, args = (line.decode().rstrip("\r\n").split(" ", 2) + ["", ""])[:3]
+                self.commands.append(f"{command} {args}".strip())
+                if command.upper() == "COMPRESS" and "COMPRESS=DEFLATE" in self.capabilities.split():
+                    writer.start_compression(
+                        tag.encode() + b" OK DEFLATE active\r\n",
+                        b"".join(line.encode() + b"\r\n" for line in self.after_compress),
+                    )
+                    await writer.drain()
+                    continue
+                if command.upper() == "IDLE":
+                    writer.write(b"+ idling\r\n")
+                    await writer.drain()
+                    done = await reader.readline()
+                    self.commands.append(done.decode().strip())
+                    writer.write(tag.encode() + b" OK IDLE terminated\r\n")
+                    await writer.drain()
+                    continue
+                lines = self.handler(command.upper(), args)
+                if asyncio.iscoroutine(lines):
+                    lines = await lines
+                for response in lines[:-1]:
+                    writer.write(response if isinstance(response, bytes) else response.encode() + b"\r\n")
+                writer.write(f"{tag} {lines[-1]}\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if writer in self.writers:
+                self.writers.remove(writer)
+
+
+async def open_client(server: FakeIMAPServer) -> AsyncIMAPClient:
+    client = AsyncIMAPClient("127.0.0.1", server.port)
+    # The fake server does not speak TLS
+    client.ssl_context = None
+    await client.connect(5)
+    return client
+
+
+@pytest.fixture
+def connect_to(monkeypatch):
+    """Call with a started FakeIMAPServer to send every new IMAP connection of the server module to it."""
+
+    def redirect(fake: FakeIMAPServer):
+        class Client(AsyncIMAPClient):
+            def __init__(self, host, port=None, ssl_context=None, traffic=None):
+                super().__init__("127.0.0.1", fake.port, traffic=traffic)
+                self.ssl_context = None
+
+        monkeypatch.setattr(email_server, "AsyncIMAPClient", Client)
+
+    return redirect
@@ -0,0 +1,84 @@
+import asyncio
+import base64
+import os
+import quopri
+import re
+
+import pytest
+
+from email_client import server as email_server
+from email_client.server import decode_transfer_chunk, decode_transfer_encoding, save_attachment_async
+
+PAYLOADS = {
+    "base64": bytes(range(256)) * 20,
+    "quoted-printable": "Grüße aus Köln = schön\n\tü \n".encode() * 150,
+    "binary": bytes(range(256)) * 20,
+}
+
+
+class PartialFetchSession:
+    """Answers UID FETCH BODY.PEEK[part]<start.length> from one encoded part."""
+
+    def __init__(self, encoded: bytes):
+        self.encoded = encoded
+        self.ranges = []
+
+    async def uid(self, command, uid, items):
+        start, length = map(int, re.search(r"<(\d+)\.(\d+)>", items).groups())
+        self.ranges.append((start, length))
+        data = self.encoded[start:start + length]
+        return "OK", [(b"1 (UID %s BODY[2]<%d> {%d}" % (uid.encode(), start, len(data)), data), b")"]
+
+
+def encode(encoding: str) -> bytes:
+    payload = PAYLOADS[encoding]
+    if encoding == "base64":
+        return base64.encodebytes(payload).replace(b"\n", b"\r\n")
+    if encoding == "quoted-printable":
+        return quopri.encodestring(payload).replace(b"\n", b"\r\n")
+    return payload
+
+
+@pytest.mark.parametrize("encoding", ["base64", "quoted-printable", "binary"])
+@pytest.mark.parametrize("chunk_size", [1, 5, 77, 1000])
+def test_decode_transfer_chunk_streams(encoding, chunk_size):
+    encoded = encode(encoding)
+    decoded = []
+    carry = b""
+    for start in range(0, len(encoded), chunk_size):
+        data = encoded[start:start + chunk_size]
+        final = start + chunk_size >= len(encoded)
+        chunk, carry = decode_transfer_chunk(carry + data, encoding, final)
+        decoded.append(chunk)
+    assert carry == b""
+    assert b"".join(decoded) == decode_transfer_encoding(encoded, encoding)
+
+
+@pytest.mark.parametrize("encoding", ["base64", "quoted-printable"])
+def test_save_attachment_streams_ranges(tmp_path, monkeypatch, encoding):
+    monkeypatch.setattr(email_server, "ATTACHMENT_CHUNK_SIZE", 300)
+    mail = PartialFetchSession(encode(encoding))
+    expected = decode_transfer_encoding(mail.encoded, encoding)
+    path = str(tmp_path / "INBOX" / "report.bin")
+    part = {"part": "2", "encoding": encoding}
+
+    assert asyncio.run(save_attachment_async(mail, "42", part, path)) == len(expected)
+    with open(path, "rb") as f:
+        assert f.read() == expected
+    assert not os.path.exists(path + ".part")
+    assert mail.ranges == [(start, 300) for start in range(0, len(mail.encoded) + 1, 300)]
+
+
+def test_save_attachment_removes_partial_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(email_server, "ATTACHMENT_CHUNK_SIZE", 300)
+
+    class FailingSession(PartialFetchSession):
+        async def uid(self, command, uid, items):
+            if self.ranges:
+                raise OSError("connection lost")
+            return await super().uid(command, uid, items)
+
+    path = str(tmp_path / "report.bin")
+    with pytest.raises(OSError):
+        asyncio.run(save_attachment_async(FailingSession(encode("base64")), "42", {"part": "2", "encoding": "base64"}, path))
+    assert os.listdir(tmp_path) == []
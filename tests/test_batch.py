@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+
+from email_client import server as email_server
+from email_client.server import RateLimiter, render_batch_messages
+
+
+def test_messages_are_normalized():
+    rendered = render_batch_messages({"messages": [
+        {"to": "a@example.com", "subject": "Hi", "content": "One"},
+        {"to": ["b@example.com", "c@example.com"], "cc": "d@example.com", "content": "Two"},
+    ]})
+    assert rendered == [
+        {"to": ["a@example.com"], "cc": [], "subject": "Hi", "content": "One"},
+        {"to": ["b@example.com", "c@example.com"], "cc": ["d@example.com"], "subject": "", "content": "Two"},
+    ]
+
+
+def test_template_is_filled_per_recipient():
+    rendered = render_batch_messages({
+        "template": {"subject": "Invoice ${number}", "content": "Dear ${name}, this was sent to ${to}."},
+        "recipients": [
+            {"to": "ann@example.com", "variables": {"name": "Ann", "number": "17"}},
+            {"to": ["bob@example.com"], "cc": ["boss@example.com"], "variables": {"name": "Bob", "number": "18"}},
+        ],
+    })
+    assert rendered[0] == {
+        "to": ["ann@example.com"], "cc": [],
+        "subject": "Invoice 17", "content": "Dear Ann, this was sent to ann@example.com.",
+    }
+    assert rendered[1]["subject"] == "Invoice 18"
+    assert rendered[1]["cc"] == ["boss@example.com"]
+
+
+def test_failures_are_reported_per_message():
+    rendered = render_batch_messages({
+        "template": {"subject": "Hello ${name}", "content": "Hi"},
+        "recipients": [
+            {"to": "ann@example.com", "variables": {"name": "Ann"}},
+            {"to": "bob@example.com"},
+            {"variables": {"name": "Nobody"}},
+        ],
+    })
+    assert "error" not in rendered[0]
+    assert "name" in rendered[1]["error"]
+    assert rendered[1]["subject"] == "Hello ${name}"
+    assert rendered[2]["error"] == "At least one recipient email address is required"
+
+
+@pytest.mark.parametrize("arguments", [
+    {},
+    {"messages": [{"to": "a@example.com"}], "template": {"subject": "x"}},
+    {"template": {"subject": "x"}, "recipients": []},
+])
+def test_invalid_batches_are_rejected(arguments):
+    with pytest.raises(ValueError):
+        render_batch_messages(arguments)
+
+
+def test_batch_size_is_capped(monkeypatch):
+    monkeypatch.setattr(email_server, "SMTP_BATCH_MAX_MESSAGES", 2)
+    with pytest.raises(ValueError):
+        render_batch_messages({"messages": [{"to": "a@example.com"}] * 3})
+
+
+def test_rate_limiter_spaces_out_starts():
+    async def main():
+        limiter = RateLimiter(20)
+        starts = []
+
+        async def call():
+            await limiter.wait()
+            starts.append(time.monotonic())
+
+        await asyncio.gather(*(call() for _ in range(4)))
+        return sorted(starts)
+
+    starts = asyncio.run(main())
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    assert all(gap >= 0.04 for gap in gaps)
@@ -0,0 +1,142 @@
+import asyncio
+import base64
+import quopri
+
+import pytest
+
+from email_client.server import (
+    decode_part_payload,
+    list_attachment_parts,
+    parse_bodystructure,
+    parse_fetch_response,
+    read_text_part,
+    select_text_part,
+)
+
+BODYSTRUCTURE = (
+    b'1 (UID 5 BODYSTRUCTURE ('
+    b'(("TEXT" "PLAIN" ("CHARSET" "iso-8859-1") NIL NIL "QUOTED-PRINTABLE" 120 4 NIL NIL NIL NIL)'
+    b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "BASE64" 800 11 NIL NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "b2") NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "=?utf-8?q?Rechnung_M=C3=A4rz.pdf?=") NIL NIL "BASE64" 78000 NIL '
+    b'("ATTACHMENT" ("FILENAME" "=?utf-8?q?Rechnung_M=C3=A4rz.pdf?=")) NIL NIL)'
+    b'("TEXT" "CSV" ("CHARSET" "utf-8") NIL NIL "7BIT" 300 9 NIL '
+    b'("ATTACHMENT" ("FILENAME*" "utf-8\'\'daten%20%C3%BC.csv")) NIL NIL)'
+    b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 2000 NIL ("TEXT" "PLAIN" NIL NIL NIL "7BIT" 10 1) 40 NIL NIL NIL NIL)'
+    b' "MIXED" ("BOUNDARY" "b1") NIL NIL NIL))'
+)
+
+
+def parsed_parts() -> list[dict]:
+    [item] = parse_fetch_response([BODYSTRUCTURE])
+    return parse_bodystructure(item["BODYSTRUCTURE"])
+
+
+def test_parse_bodystructure_flattens_parts():
+    parts = parsed_parts()
+    assert [(part["part"], part["type"]) for part in parts] == [
+        ("1.1", "text/plain"),
+        ("1.2", "text/html"),
+        ("2", "application/pdf"),
+        ("3", "text/csv"),
+        ("4", "message/rfc822"),
+    ]
+    plain = parts[0]
+    assert (plain["charset"], plain["encoding"], plain["size"]) == ("iso-8859-1", "quoted-printable", 120)
+    assert plain["disposition"] is None
+
+
+def test_parse_bodystructure_filenames():
+    parts = parsed_parts()
+    assert (parts[2]["disposition"], parts[2]["filename"]) == ("attachment", "Rechnung März.pdf")
+    assert parts[3]["filename"] == "daten ü.csv"
+
+
+def test_parse_bodystructure_single_part():
+    structure = ["TEXT", "PLAIN", ["CHARSET", "us-ascii"], None, None, "7BIT", "42", "3"]
+    [part] = parse_bodystructure(structure)
+    assert (part["part"], part["type"], part["size"]) == ("1", "text/plain", 42)
+
+
+def test_select_text_part_prefers_plain():
+    parts = parsed_parts()
+    assert select_text_part(parts)["part"] == "1.1"
+    assert select_text_part(parts[1:])["part"] == "1.2"
+    # Text attachments are never shown as the body
+    assert select_text_part(parts[2:4]) is None
+    assert [part["part"] for part in list_attachment_parts(parts)] == ["2", "3", "4"]
+
+
+def test_decode_part_payload_charsets():
+    assert decode_part_payload(b"Gr=FC=DFe=\r\n aus K=F6ln", "quoted-printable", "iso-8859-1") == "Grüße aus Köln"
+    assert decode_part_payload(base64.b64encode("ü".encode()), "base64", "utf-8") == "ü"
+    # Unknown charsets fall back to UTF-8
+    assert decode_part_payload("ü".encode(), "8bit", "x-unknown") == "ü"
+
+
+def encode(text: str, encoding: str) -> bytes:
+    raw = text.encode()
+    if encoding == "base64":
+        data = base64.encodebytes(raw)
+    elif encoding == "quoted-printable":
+        data = quopri.encodestring(raw)
+    else:
+        data = raw
+    return data.replace(b"\n", b"\r\n")
+
+
+def read_in_chunks(data: bytes, encoding: str, max_bytes: int) -> list[str]:
+    part = {"size": len(data), "encoding": encoding, "charset": "utf-8"}
+
+    async def read(start, length):
+        return data if start is None else data[start:start + length]
+
+    async def run():
+        chunks = []
+        offset = 0
+        while offset is not None:
+            text, offset = await read_text_part(read, part, offset, max_bytes)
+            chunks.append(text)
+        return chunks
+
+    return asyncio.run(run())
+
+
+TEXTS = {
+    "base64": "Привет мир, ёж 😀 " * 80,
+    "quoted-printable": "Grüße aus Köln = schön, ü " * 120,
+    "8bit": "Привет 😀 ü " * 50,
+}
+
+
+@pytest.mark.parametrize("encoding", sorted(TEXTS))
+@pytest.mark.parametrize("max_bytes", [1, 7, 64, 100, 256, 1000])
+def test_chunks_join_to_full_decode(encoding, max_bytes):
+    data = encode(TEXTS[encoding], encoding)
+    full = decode_part_payload(data, encoding, "utf-8")
+    assert full == TEXTS[encoding]
+    assert "".join(read_in_chunks(data, encoding, max_bytes)) == full
+
+
+def test_chunks_start_on_line_starts():
+    data = encode(TEXTS["quoted-printable"], "quoted-printable")
+    part = {"size": len(data), "encoding": "quoted-printable", "charset": "utf-8"}
+
+    async def read(start, length):
+        return data[start:start + length]
+
+    offsets = []
+    offset = 0
+    while offset is not None:
+        offsets.append(offset)
+        _, offset = asyncio.run(read_text_part(read, part, offset, 100))
+    assert len(offsets) > 10
+    assert all(data[offset - 1:offset] == b"\n" for offset in offsets[1:])
+
+
+@pytest.mark.parametrize("line_length", [73, 74, 75])
+@pytest.mark.parametrize("max_bytes", [1, 64, 100, 256])
+def test_base64_lines_not_a_multiple_of_four(line_length, max_bytes):
+    # Line starts are not quantum boundaries when lines are wrapped at other lengths
+    encoded = base64.b64encode(TEXTS["base64"].encode())
+    data = b"".join(encoded[i:i + line_length] + b"\r\n" for i in range(0, len(encoded), line_length))
+    assert "".join(read_in_chunks(data, "base64", max_bytes)) == TEXTS["base64"]
@@ -0,0 +1,79 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from email_client.server import (
+    bucket_by_day,
+    count_daily_emails_async,
+    forget_closed_day_counts,
+    group_counts,
+)
+
+
+class CountingSession:
+    """Answers the SEARCH and INTERNALDATE FETCH of count_daily_emails_async."""
+
+    def __init__(self, internaldates: list[str]):
+        self.selected_mailbox = "INBOX"
+        self.uidvalidity = 1
+        self.internaldates = internaldates
+        self.searches = 0
+
+    async def uid(self, command, *args):
+        if command == "SEARCH":
+            self.searches += 1
+            return "OK", [" ".join(str(uid) for uid in range(1, len(self.internaldates) + 1)).encode()]
+        return "OK", [
+            f'{uid} (UID {uid} INTERNALDATE "{internaldate}")'.encode()
+            for uid, internaldate in enumerate(self.internaldates, 1)
+        ]
+
+
+def test_bucket_by_day_uses_timezone():
+    zurich = timezone(timedelta(hours=2))
+    timestamps = [
+        datetime(2026, 10, 1, 23, 30, tzinfo=timezone.utc),
+        datetime(2026, 10, 2, 8, 0, tzinfo=timezone.utc),
+        None,
+    ]
+    assert bucket_by_day(timestamps, zurich) == {date(2026, 10, 2): 2}
+    assert bucket_by_day(timestamps, timezone.utc) == {date(2026, 10, 1): 1, date(2026, 10, 2): 1}
+
+
+def test_group_counts_by_week():
+    counts = {date(2026, 10, 4): 3, date(2026, 10, 5): 1, date(2026, 10, 6): 2}
+    # 2026-10-05 is a Monday
+    assert group_counts(counts, date(2026, 10, 4), date(2026, 10, 6), "week") == [
+        ("2026-09-28", 3),
+        ("2026-10-05", 3),
+    ]
+    assert group_counts(counts, date(2026, 10, 3), date(2026, 10, 4)) == [("2026-10-03", 0), ("2026-10-04", 3)]
+
+
+def test_closed_days_are_memoized_until_messages_arrive():
+    account = SimpleNamespace(closed_day_counts={})
+    mail = CountingSession(["01-Oct-2026 10:00:00 +0000", "01-Oct-2026 12:00:00 +0000"])
+    day = date(2026, 10, 1)
+
+    assert asyncio.run(count_daily_emails_async(account, mail, day, day, timezone.utc)) == {day: 2}
+    assert asyncio.run(count_daily_emails_async(account, mail, day, day, timezone.utc)) == {day: 2}
+    assert mail.searches == 1
+
+    # A flag change does not affect counts
+    forget_closed_day_counts(account, "INBOX", {"FETCH"})
+    assert account.closed_day_counts
+
+    # A message copied in keeps its old INTERNALDATE
+    mail.internaldates.append("01-Oct-2026 18:00:00 +0000")
+    forget_closed_day_counts(account, "INBOX", {"EXISTS"})
+    assert asyncio.run(count_daily_emails_async(account, mail, day, day, timezone.utc)) == {day: 3}
+    assert mail.searches == 2
+
+
+def test_forget_closed_day_counts_keeps_other_folders():
+    account = SimpleNamespace(closed_day_counts={
+        ("INBOX", 1, "UTC", date(2026, 10, 1)): (0.0, 2),
+        ("Archive", 1, "UTC", date(2026, 10, 1)): (0.0, 5),
+    })
+    forget_closed_day_counts(account, "INBOX", {"EXPUNGE"})
+    assert list(account.closed_day_counts) == [("Archive", 1, "UTC", date(2026, 10, 1))]
@@ -0,0 +1,43 @@
+from email_client.server import compress_message_set, get_body_section, parse_fetch_response
+
+
+def test_compress_message_set():
+    assert compress_message_set([10, 1, 2, 3, 5, 11, 12, 3]) == "1:3,5,10:12"
+    assert compress_message_set(["4"]) == "4"
+    assert compress_message_set([b"7", b"8"]) == "7:8"
+    assert compress_message_set([]) == ""
+
+
+def test_parse_fetch_response_batch():
+    headers = b"Subject: Hello\r\nFrom: a@example.com\r\n\r\n"
+    data = [
+        (b"1 (UID 11 RFC822.SIZE 120 BODY[HEADER.FIELDS (SUBJECT FROM)] {%d}" % len(headers), headers),
+        b")",
+        b'2 (UID 12 FLAGS (\\Seen) INTERNALDATE "01-Oct-2026 10:00:00 +0000" BODY[HEADER.FIELDS (SUBJECT FROM)] NIL)',
+        None,
+    ]
+    items = parse_fetch_response(data)
+    assert [item["UID"] for item in items] == ["11", "12"]
+    assert items[0]["SEQ"] == "1"
+    assert get_body_section(items[0], "BODY[HEADER") == headers
+    assert items[1]["FLAGS"] == ["\\Seen"]
+    assert items[1]["INTERNALDATE"] == b"01-Oct-2026 10:00:00 +0000"
+    # NIL sections read as empty, missing ones as None
+    assert get_body_section(items[1], "BODY[HEADER") == b""
+    assert get_body_section(items[1], "BODY[TEXT") is None
+
+
+def test_parse_fetch_response_several_literals():
+    data = [
+        (b"3 (UID 13 BODY[HEADER] {4}", b"H: 1"),
+        (b" BODY[TEXT] {5}", b"hello"),
+        b")",
+    ]
+    [item] = parse_fetch_response(data)
+    assert item["BODY[HEADER]"] == b"H: 1"
+    assert item["BODY[TEXT]"] == b"hello"
+
+
+def test_parse_fetch_response_skips_unsolicited_lines():
+    assert parse_fetch_response([b"4 EXPUNGE", None]) == []
+    assert parse_fetch_response(None) == []
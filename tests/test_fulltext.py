@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pytest
+
+from email_client.server import FullTextIndex
+
+
+def content(subject: str, body: str, date: str = "Thu, 01 Oct 2026 10:00:00 +0000") -> dict:
+    return {"from": "ann@example.com", "to": "me@example.com", "date": date, "subject": subject, "content": body}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = FullTextIndex(str(tmp_path / "fulltext.sqlite3"))
+    index.add_message("INBOX", 7, 1, content("Quarterly report", "The numbers for Q3 are attached."))
+    index.add_message("INBOX", 7, 2, content("Lunch", "Shall we try the new café? The report can wait.",
+                                             "Mon, 05 Oct 2026 12:00:00 +0000"))
+    index.add_message("Archive", 3, 9, content("Old news", "Nothing to report, C++ (draft) notes only."))
+    return index
+
+
+def ids(results: list[dict]) -> list[str]:
+    return [result["id"] for result in results]
+
+
+def test_subject_matches_rank_first(index):
+    results = index.search("report")
+    assert ids(results)[0] == "INBOX:7:1"
+    assert sorted(ids(results)) == ["Archive:3:9", "INBOX:7:1", "INBOX:7:2"]
+    snippets = {result["id"]: result["snippet"] for result in results}
+    assert snippets["INBOX:7:2"] == "Shall we try the new café? The [report] can wait."
+
+
+@pytest.mark.parametrize("query, expected", [
+    ('"numbers for"', ["INBOX:7:1"]),
+    ("quart*", ["INBOX:7:1"]),
+    ("report NOT lunch", ["INBOX:7:1", "Archive:3:9"]),
+    # Diacritics are folded
+    ("cafe", ["INBOX:7:2"]),
+])
+def test_fts5_syntax(index, query, expected):
+    assert ids(index.search(query)) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ('"numbers', ["INBOX:7:1"]),
+    ("C++ (draft", ["Archive:3:9"]),
+    ("notes)", ["Archive:3:9"]),
+    # A dangling operator becomes a term of its own
+    ("report AND", []),
+])
+def test_invalid_syntax_matches_terms_literally(index, query, expected):
+    assert ids(index.search(query)) == expected
+
+
+def test_empty_query_is_rejected(index):
+    with pytest.raises(ValueError):
+        index.search("  ")
+
+
+def test_already_indexed_messages_are_skipped(index):
+    assert index.contains("inbox", 7, 1)
+    index.add_message("INBOX", 7, 1, content("Changed", "A different body"))
+    assert index.search("different") == []
+    assert ids(index.search("quarterly")) == ["INBOX:7:1"]
+    assert len(index._execute("SELECT rowid FROM emails_fts")) == 3
+
+
+def test_filters(index):
+    assert ids(index.search("report", folder="Archive")) == ["Archive:3:9"]
+    assert ids(index.search("report", since=datetime(2026, 10, 3).astimezone())) == ["INBOX:7:2"]
+    assert ids(index.search("report", limit=1)) == ["INBOX:7:1"]
+
+
+def test_forget_folder_keeps_current_uidvalidity(index):
+    index.add_message("INBOX", 8, 1, content("Quarterly report", "Rebuilt folder"))
+    index.forget_folder("INBOX", keep_uidvalidity=8)
+    assert ids(index.search("quarterly")) == ["INBOX:8:1"]
+    index.forget_folder("INBOX")
+    assert ids(index.search("report")) == ["Archive:3:9"]
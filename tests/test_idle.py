@@ -0,0 +1,30 @@
+import asyncio
+from types import SimpleNamespace
+
+from conftest import FakeIMAPServer
+from email_client.server import IMAPIdleListener, IMAPTraffic
+
+
+def test_idle_listener_quotes_folder(connect_to):
+    def handler(command, args):
+        if command == "EXAMINE" and args != '"Sent Items"':
+            return ["BAD could not parse mailbox"]
+        return ["OK done"]
+
+    async def main():
+        fake = await FakeIMAPServer(handler).start()
+        connect_to(fake)
+        account = SimpleNamespace(
+            config={"imap_server": "imap.example.com", "email": "me@example.com", "password": "secret"},
+            imap_pool=SimpleNamespace(traffic=IMAPTraffic()),
+        )
+        listener = IMAPIdleListener(account, "Sent Items")
+        try:
+            await listener._connect()
+            assert fake.commands[-1] == 'EXAMINE "Sent Items"'
+        finally:
+            if listener.mail is not None:
+                listener.mail.shutdown()
+            await fake.close()
+
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+import asyncio
+import random
+
+import pytest
+
+from conftest import FakeIMAPServer, open_client
+from email_client.server import AsyncIMAPClient
+
+
+def run(handler, test, **server_options):
+    """Run `test(server, client)` against a fake server answering with `handler`."""
+
+    async def main():
+        server = await FakeIMAPServer(handler, **server_options).start()
+        client = await open_client(server)
+        try:
+            return await test(server, client)
+        finally:
+            client.shutdown()
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_greeting_capabilities():
+    async def test(server, client):
+        assert "IDLE" in client.capabilities
+
+    run(None, test)
+
+
+def test_fetch_with_literal():
+    body = b"Hello\r\nworld"
+
+    def handler(command, args):
+        if command == "UID":
+            return [
+                b"* 1 FETCH (UID 5 BODY[] {%d}\r\n" % len(body) + body + b")\r\n",
+                "* 2 FETCH (UID 6 FLAGS (\\Seen))",
+                "OK FETCH completed",
+            ]
+        return ["OK done"]
+
+    async def test(server, client):
+        typ, data = await client.uid("FETCH", "5:6", "(BODY.PEEK[])")
+        assert typ == "OK"
+        assert data == [(b"1 (UID 5 BODY[] {12}", body), b")", b"2 (UID 6 FLAGS (\\Seen))"]
+        assert server.commands == ["UID FETCH 5:6 (BODY.PEEK[])"]
+
+    run(handler, test)
+
+
+def test_select_keeps_response_codes():
+    def handler(command, args):
+        return ["* 3 EXISTS", "* OK [UIDVALIDITY 42] UIDs valid", "OK [READ-ONLY] EXAMINE completed"]
+
+    async def test(server, client):
+        typ, data = await client.select('"Sent Items"', readonly=True)
+        assert (typ, data) == ("OK", [b"3"])
+        assert client.response("UIDVALIDITY") == ("UIDVALIDITY", [b"42"])
+        assert server.commands == ['EXAMINE "Sent Items"']
+
+    run(handler, test)
+
+
+def test_bad_raises_error():
+    async def test(server, client):
+        with pytest.raises(AsyncIMAPClient.error):
+            await client.simple_command("FROB")
+
+    run(lambda command, args: ["BAD unknown command"], test)
+
+
+def test_literal_waits_for_continuation():
+    async def test(server, client):
+        typ, _ = await client.append("INBOX", None, None, b"Subject: hi\n\nbody\n")
+        assert typ == "OK"
+        assert server.literals == [b"Subject: hi\r\n\r\nbody\r\n"]
+        assert server.commands == ["APPEND INBOX <Subject: hi\r\n\r\nbody\r\n>"]
+
+    run(None, test)
+
+
+def test_non_synchronizing_literal():
+    async def test(server, client):
+        typ, _ = await client.login("user", "pässword")
+        assert typ == "OK"
+        assert server.literals == ["pässword".encode()]
+
+    run(None, test, capabilities="IMAP4rev1 LITERAL+")
+
+
+def test_literal_refused():
+    async def test(server, client):
+        typ, _ = await client.append("INBOX", None, None, b"body")
+        assert typ == "NO"
+        # The connection stays usable
+        assert (await client.noop())[0] == "OK"
+
+    run(None, test, continuations=False)
+
+
+def test_abandoned_command_finishes_first():
+    async def handler(command, args):
+        if command == "SEARCH":
+            await asyncio.sleep(0.2)
+            return ["* SEARCH 1 2 3", "OK SEARCH completed"]
+        return ["* 7 EXISTS", "OK NOOP completed"]
+
+    async def test(server, client):
+        search = asyncio.create_task(client.search(None, "ALL"))
+        await asyncio.sleep(0.05)
+        search.cancel()
+        typ, data = await client.simple_command("NOOP", response="EXISTS")
+        # The NOOP is sent after the SEARCH completes and gets only its own responses
+        assert (typ, data) == ("OK", [b"7"])
+        assert server.commands == ["SEARCH ALL", "NOOP"]
+        assert client.response("SEARCH") == ("SEARCH", [None])
+
+    run(handler, test)
+
+
+def test_connection_loss_aborts_commands():
+    async def test(server, client):
+        for writer in server.writers:
+            writer.close()
+        with pytest.raises(AsyncIMAPClient.abort):
+            await client.noop()
+        assert client.closed
+
+    run(None, test)
+
+
+def test_idle_reports_untagged_responses():
+    async def test(server, client):
+        responses = asyncio.Queue()
+        command = await client.idle_start(responses)
+        await server.push("* 4 EXISTS")
+        assert await asyncio.wait_for(responses.get(), 5) == "EXISTS"
+        typ, _ = await client.idle_done(command)
+        assert typ == "OK"
+        assert server.commands == ["IDLE", "DONE"]
+
+    run(None, test)
+
+
+def test_compress_deflate():
+    # Random letters compress to well over one 64 KiB read
+    body = bytes(random.Random(0).choices(b"abcdefghijklmnopqrstuvwxyz \r\n", k=300_000))
+
+    def handler(command, args):
+        if command == "UID":
+            return [b"* 1 FETCH (UID 5 BODY[] {%d}\r\n" % len(body) + body + b")\r\n", "OK FETCH completed"]
+        return ["OK done"]
+
+    async def test(server, client):
+        assert await client.compress()
+        assert client.compressed
+        typ, data = await client.uid("FETCH", "5", "(BODY.PEEK[])")
+        assert typ == "OK"
+        assert data[0] == (b"1 (UID 5 BODY[] {300000}", body)
+        assert await client.append("INBOX", None, None, b"Subject: hi\n\nbody\n") == ("OK", [b"done"])
+        assert (await client.noop())[0] == "OK"
+        assert server.commands == [
+            "COMPRESS DEFLATE", "UID FETCH 5 (BODY.PEEK[])", "APPEND INBOX <Subject: hi\r\n\r\nbody\r\n>", "NOOP",
+        ]
+        # Sent right behind the OK to COMPRESS, so already buffered when the client switched over
+        assert client.response("EXISTS") == ("EXISTS", [b"9"])
+
+        stats = client.traffic.stats()
+        assert (stats["sent"], stats["sent_wire"]) == (server.traffic["received"], server.traffic["received_wire"])
+        assert (stats["received"], stats["received_wire"]) == (server.traffic["sent"], server.traffic["sent_wire"])
+        assert stats["received"] > len(body)
+        assert stats["received_wire"] < 0.8 * stats["received"]
+        assert stats["wire_ratio"] < 1.0
+
+    run(handler, test, capabilities="IMAP4rev1 COMPRESS=DEFLATE", after_compress=["* 9 EXISTS"])
+
+
+def test_compress_not_offered():
+    async def test(server, client):
+        assert not await client.compress()
+        assert not client.compressed
+        assert server.commands == []
+        stats = client.traffic.stats()
+        assert (stats["sent_wire"], stats["received_wire"], stats["wire_ratio"]) == (0, stats["received"], 1.0)
+
+    run(None, test)
@@ -0,0 +1,136 @@
+import asyncio
+import itertools
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from email_client import server as email_server
+from email_client.server import MessageCache, get_cached_email_content, get_email_content_async
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # Distinct, increasing access times however fast the test runs
+    clock = itertools.count(1000)
+    monkeypatch.setattr(email_server.time, "time", lambda: next(clock))
+    return MessageCache(str(tmp_path / "messages"), max_bytes=250)
+
+
+def test_read_ranges(cache):
+    cache.put("INBOX", 7, 1, "BODY[1]", b"0123456789")
+    assert cache.read("INBOX", 7, 1, "BODY[1]") == b"0123456789"
+    assert cache.read("inbox", 7, 1, "BODY[1]", 3, 4) == b"3456"
+    assert cache.read("INBOX", 7, 1, "BODY[1]", 8, 10) == b"89"
+    # Another UIDVALIDITY is another message
+    assert cache.read("INBOX", 8, 1, "BODY[1]") is None
+    assert cache.read("INBOX", None, 1, "BODY[1]") is None
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_evicts_least_recently_used(cache):
+    for uid in (1, 2, 3):
+        cache.put("INBOX", 7, uid, "BODY[1]", bytes([uid]) * 100)
+    # 300 bytes exceed the cap, so the oldest entry went
+    assert not cache.contains("INBOX", 7, 1, "BODY[1]")
+    assert cache.total_size() == 200
+
+    # Reading UID 2 makes UID 3 the least recently used
+    assert cache.read("INBOX", 7, 2, "BODY[1]") == b"\x02" * 100
+    cache.put("INBOX", 7, 4, "BODY[1]", b"\x04" * 100)
+    assert cache.contains("INBOX", 7, 2, "BODY[1]")
+    assert not cache.contains("INBOX", 7, 3, "BODY[1]")
+    assert cache.contains("INBOX", 7, 4, "BODY[1]")
+
+
+def test_identical_blobs_are_stored_once(cache):
+    cache.put("INBOX", 7, 1, "BODY[1]", b"x" * 150)
+    cache.put("Archive", 3, 9, "BODY[1]", b"x" * 150)
+    assert cache.total_size() == 150
+    objects = [name for _, _, names in os.walk(os.path.join(cache.directory, "objects")) for name in names]
+    assert len(objects) == 1
+    assert cache.read("Archive", 3, 9, "BODY[1]") == b"x" * 150
+
+
+def test_oversized_blob_is_not_cached(cache):
+    cache.put("INBOX", 7, 1, "BODY[1]", b"x" * 251)
+    assert not cache.contains("INBOX", 7, 1, "BODY[1]")
+
+
+def test_missing_blob_is_a_miss(cache):
+    cache.put("INBOX", 7, 1, "BODY[1]", b"hello")
+    for root, _, names in os.walk(os.path.join(cache.directory, "objects")):
+        for name in names:
+            os.remove(os.path.join(root, name))
+    assert cache.read("INBOX", 7, 1, "BODY[1]") is None
+    assert not cache.contains("INBOX", 7, 1, "BODY[1]")
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_structure_round_trip(cache):
+    parts = [{"part": "1", "type": "text/plain"}]
+    cache.put_structure("INBOX", 7, 1, b"Subject: \xe9t\xe9\r\n\r\n", parts)
+    assert cache.get_structure("INBOX", 7, 1) == (b"Subject: \xe9t\xe9\r\n\r\n", parts)
+
+
+class ContentSession:
+    """Answers the BODYSTRUCTURE and text part FETCHes of get_email_content_async for UID 5."""
+
+    selected_mailbox = "INBOX"
+    uidvalidity = 7
+
+    def __init__(self):
+        self.fetches = []
+
+    async def uid(self, command, uid, items):
+        self.fetches.append(items)
+        if "BODYSTRUCTURE" in items:
+            headers = b"Subject: Hello\r\n\r\n"
+            return "OK", [
+                (b'1 (UID 5 BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 5 1) '
+                 b'BODY[HEADER.FIELDS (FROM TO SUBJECT DATE)] {%d}' % len(headers), headers),
+                b")",
+            ]
+        return "OK", [(b"1 (UID 5 BODY[1] {5}", b"hello"), b")"]
+
+
+def read_content(account, session) -> dict:
+    """get-email-content's path: the cache alone, then the server for whatever is missing."""
+
+    async def main():
+        content, structure = await get_cached_email_content(account, "INBOX", 7, "5")
+        if content is None:
+            content = await get_email_content_async(account, session, "5", structure=structure)
+        return content
+
+    return asyncio.run(main())
+
+
+def test_each_lookup_is_counted_once(tmp_path):
+    cache = MessageCache(str(tmp_path / "messages"), max_bytes=10000)
+    account = SimpleNamespace(message_cache=cache)
+    session = ContentSession()
+
+    # Cold: one miss for the structure, one for the text part
+    assert read_content(account, session)["content"] == "hello"
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert len(session.fetches) == 2
+
+    # Warm: both come from the cache
+    assert read_content(account, session)["subject"] == "Hello"
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert len(session.fetches) == 2
+
+
+def test_cached_structure_is_reused(tmp_path):
+    cache = MessageCache(str(tmp_path / "messages"), max_bytes=10000)
+    account = SimpleNamespace(message_cache=cache)
+    session = ContentSession()
+    read_content(account, session)
+    cache._forget(cache._key("INBOX", 7, 5, "BODY[1]"))
+    cache.hits = cache.misses = 0
+
+    assert read_content(account, session)["content"] == "hello"
+    assert (cache.hits, cache.misses) == (1, 1)
+    # Only the text part was fetched again
+    assert "BODYSTRUCTURE" not in session.fetches[-1]
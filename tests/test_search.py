@@ -0,0 +1,258 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from conftest import FakeIMAPServer
+from email_client import server as email_server
+from email_client.server import (
+    IMAPSession,
+    SearchCursors,
+    build_search_criteria,
+    handle_call_tool,
+    parse_esearch_response,
+    search_folders_async,
+    search_window_async,
+)
+
+CONFIG = {"imap_server": "imap.example.com", "email": "me@example.com", "password": "secret"}
+UIDS = list(range(1, 31))
+
+
+def test_esearch_count_and_all():
+    data = [b'(TAG "A5") UID COUNT 3 ALL 1:2,7']
+    assert parse_esearch_response(data) == {"COUNT": "3", "ALL": "1:2,7"}
+
+
+def test_esearch_no_matches():
+    assert parse_esearch_response([b'(TAG "A5") UID']) == {}
+    assert parse_esearch_response([None]) == {}
+
+
+def test_esearch_partial():
+    assert parse_esearch_response([b'(TAG "A1") UID PARTIAL (-1:-3 30:28)']) == {"PARTIAL": "30:28"}
+    assert parse_esearch_response([b'(TAG "A1") UID PARTIAL (-51:-100 NIL)']) == {"PARTIAL": ""}
+
+
+SINCE, BEFORE = datetime(2026, 10, 1), datetime(2026, 10, 8)
+DATES = ["SINCE", '"01-Oct-2026"', "BEFORE", '"08-Oct-2026"']
+
+
+@pytest.mark.parametrize("options, criteria", [
+    ({}, []),
+    ({"keyword": "invoice"}, ["SUBJECT", '"invoice"']),
+    ({"keyword": "invoice", "search_in": ["from"]}, ["FROM", '"invoice"']),
+    ({"keyword": "invoice", "search_in": ["subject", "body"]},
+     ["OR", "SUBJECT", '"invoice"', "BODY", '"invoice"']),
+    # OR takes two keys, so three fields nest
+    ({"keyword": "a", "search_in": ["from", "to", "text"]},
+     ["OR", "FROM", '"a"', "OR", "TO", '"a"', "TEXT", '"a"']),
+    ({"exclude_keyword": "spam"}, ["NOT", "SUBJECT", '"spam"']),
+    ({"keyword": "report", "exclude_keyword": "draft", "search_in": ["subject", "to"]},
+     ["OR", "SUBJECT", '"report"', "TO", '"report"', "NOT", "OR", "SUBJECT", '"draft"', "TO", '"draft"']),
+    ({"keyword": 'say "hi" \\ bye'}, ["SUBJECT", '"say \\"hi\\" \\\\ bye"']),
+    ({"keyword": "Grüße"}, ["SUBJECT", "Grüße".encode()]),
+    ({"exclude_keyword": "café", "search_in": ["body"]}, ["NOT", "BODY", "café".encode()]),
+    ({"gmail_raw": "has:attachment larger:5M"}, ["X-GM-RAW", '"has:attachment larger:5M"']),
+    ({"gmail_raw": "from:jörg"}, ["X-GM-RAW", "from:jörg".encode()]),
+])
+def test_build_search_criteria(options, criteria):
+    assert build_search_criteria(SINCE, BEFORE, **options) == DATES + criteria
+
+
+@pytest.mark.parametrize("keyword, command, literals", [
+    ("invoice", 'UID SEARCH SINCE "01-Oct-2026" BEFORE "08-Oct-2026" SUBJECT "invoice"', []),
+    ("Grüße", 'UID SEARCH CHARSET UTF-8 SINCE "01-Oct-2026" BEFORE "08-Oct-2026" SUBJECT <Grüße>',
+     ["Grüße".encode()]),
+])
+def test_non_ascii_keywords_are_sent_as_utf8_literals(connect_to, keyword, command, literals):
+    async def main():
+        fake = await FakeIMAPServer(lambda command, args: ["* SEARCH 4", "OK SEARCH completed"]).start()
+        connect_to(fake)
+        session = IMAPSession(CONFIG)
+        await session.connect()
+        try:
+            typ, data = await session.uid_search(build_search_criteria(SINCE, BEFORE, keyword))
+            assert (typ, data) == ("OK", [b"4"])
+            return fake.commands[-1], fake.literals
+        finally:
+            session.mail.shutdown()
+            await fake.close()
+
+    sent, sent_literals = asyncio.run(main())
+    assert sent == command
+    assert sent_literals == literals
+
+
+def test_cursor_pages_walk_back_from_the_newest():
+    uids = list(range(1, 26))
+    assert SearchCursors.page(uids, 0, 10) == list(range(16, 26))
+    assert SearchCursors.page(uids, 10, 10) == list(range(6, 16))
+    assert SearchCursors.page(uids, 20, 10) == [1, 2, 3, 4, 5]
+    assert SearchCursors.page(uids, 30, 10) == []
+    assert SearchCursors.next_cursor("tok", 25, 10, 10) == "tok.20"
+    assert SearchCursors.next_cursor("tok", 25, 20, 10) is None
+
+
+def test_cursor_round_trip():
+    cursors = SearchCursors(ttl=60)
+    token = cursors.store("INBOX", 7, [1, 2, 3], local=True)
+    results, offset = cursors.load(SearchCursors.next_cursor(token, 3, 0, 2))
+    assert offset == 2
+    assert (results["folder"], results["uidvalidity"], results["uids"], results["local"]) == ("INBOX", 7, [1, 2, 3], True)
+    assert results["criteria"] is None
+
+
+@pytest.mark.parametrize("cursor", ["", "nonsense", "nonsense.10", "{token}", "{token}.x", "{token}.-5"])
+def test_invalid_cursors_are_rejected(cursor):
+    cursors = SearchCursors(ttl=60)
+    token = cursors.store("INBOX", 7, None, criteria=["ALL"])
+    with pytest.raises(ValueError):
+        cursors.load(cursor.format(token=token))
+
+
+def test_cursors_expire_unless_used(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(email_server.time, "monotonic", lambda: now[0])
+    cursors = SearchCursors(ttl=60)
+    used = cursors.store("INBOX", 7, [1])
+    unused = cursors.store("INBOX", 7, [2])
+
+    now[0] += 50
+    cursors.load(f"{used}.0")
+    # Loading the first cursor extended it; the second one ran out
+    now[0] += 50
+    assert cursors.load(f"{used}.0")[0]["uids"] == [1]
+    with pytest.raises(ValueError):
+        cursors.load(f"{unused}.0")
+
+
+def answer(command, args):
+    """A server holding UIDS, all matching, with Date order equal to UID order."""
+    if command != "UID":
+        return ["OK done"]
+    if args.startswith("SEARCH RETURN (COUNT PARTIAL -3:-1)"):
+        return ['* ESEARCH (TAG "x") UID COUNT 30 PARTIAL (-3:-1 28:30)', "OK SEARCH completed"]
+    if args.startswith("SEARCH RETURN (COUNT ALL)"):
+        return ['* ESEARCH (TAG "x") UID COUNT 30 ALL 1:30', "OK SEARCH completed"]
+    if args.startswith("SORT RETURN (COUNT PARTIAL 1:3)"):
+        return ['* ESEARCH (TAG "x") UID COUNT 30 PARTIAL (1:3 30,29,28)', "OK SORT completed"]
+    if args.startswith("SORT"):
+        return ["* SORT " + " ".join(map(str, reversed(UIDS))), "OK SORT completed"]
+    if args.startswith("SEARCH"):
+        return ["* SEARCH " + " ".join(map(str, UIDS)), "OK SEARCH completed"]
+    return ["BAD unexpected"]
+
+
+def search_page(connect_to, capabilities: str, handler=answer) -> tuple:
+    async def main():
+        fake = await FakeIMAPServer(handler, capabilities=capabilities).start()
+        connect_to(fake)
+        session = IMAPSession(CONFIG)
+        await session.connect()
+        try:
+            result = await search_window_async(session, ["ALL"], 0, 3)
+            return result, [command for command in fake.commands if command.startswith("UID")]
+        finally:
+            session.mail.shutdown()
+            await fake.close()
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("capabilities, command, all_uids", [
+    ("IMAP4rev1 ESEARCH PARTIAL", "UID SEARCH RETURN (COUNT PARTIAL -3:-1) ALL", None),
+    ("IMAP4rev1 ESEARCH", "UID SEARCH RETURN (COUNT ALL) ALL", UIDS),
+    ("IMAP4rev1 SORT ESORT CONTEXT=SORT", "UID SORT RETURN (COUNT PARTIAL 1:3) (REVERSE DATE) UTF-8 ALL", None),
+    ("IMAP4rev1 SORT", "UID SORT (REVERSE DATE) UTF-8 ALL", UIDS),
+    ("IMAP4rev1", "UID SEARCH ALL", UIDS),
+])
+def test_search_window_uses_extensions(connect_to, capabilities, command, all_uids):
+    (count, page, uids), commands = search_page(connect_to, capabilities)
+    assert (count, page) == (30, [30, 29, 28])
+    assert uids == all_uids
+    assert commands == [command]
+
+
+def test_search_window_falls_back_when_refused(connect_to):
+    def refuse_esearch(command, args):
+        if "RETURN" in args:
+            return ["BAD RETURN not supported"]
+        return answer(command, args)
+
+    (count, page, uids), commands = search_page(connect_to, "IMAP4rev1 ESEARCH PARTIAL", refuse_esearch)
+    assert (count, page, uids) == (30, [30, 29, 28], UIDS)
+    assert commands[-1] == "UID SEARCH ALL"
+
+
+class FakeAccount:
+    """Just enough of an Account to key results and problems by."""
+
+    fulltext_index = None
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+WORK = FakeAccount("work")
+HOME = FakeAccount("home")
+
+
+@pytest.fixture
+def folder_results(monkeypatch):
+    """Replace each folder search with a canned answer: (count, summaries), an exception, or a delay in seconds."""
+    results = {}
+
+    async def search_folder_async(account, folder, limit, **criteria):
+        result = results[account.name, folder]
+        if isinstance(result, Exception):
+            raise result
+        if isinstance(result, float):
+            await asyncio.sleep(result)
+        return result
+
+    monkeypatch.setattr(email_server, "search_folder_async", search_folder_async)
+    return results
+
+
+def summary(uid: int, day: int) -> dict:
+    return {"id": str(uid), "from": "a@example.com", "date": f"{day:02d} Oct 2026 10:00:00 +0000", "subject": "Hi"}
+
+
+def test_search_folders_merges_newest_first(folder_results):
+    folder_results["work", "INBOX"] = (2, [summary(1, 3), summary(2, 1)])
+    folder_results["home", "INBOX"] = (1, [summary(7, 2)])
+    folder_results["home", "Archive"] = OSError("connection reset")
+
+    total, summaries, problems = asyncio.run(search_folders_async(
+        [(WORK, "INBOX"), (HOME, "INBOX"), (HOME, "Archive")], 5, 2,
+    ))
+    assert total == 3
+    assert [(s["account"], s["id"]) for s in summaries] == [("work", "1"), ("home", "7")]
+    assert problems == {(HOME, "Archive"): "connection reset"}
+
+
+def test_search_folders_returns_what_answered_by_the_deadline(folder_results):
+    folder_results["work", "INBOX"] = (1, [summary(1, 3)])
+    folder_results["work", "Archive"] = 10.0
+
+    total, summaries, problems = asyncio.run(search_folders_async([(WORK, "INBOX"), (WORK, "Archive")], 0.1, 10))
+    assert (total, [s["id"] for s in summaries]) == (1, ["1"])
+    assert problems == {(WORK, "Archive"): "did not answer in time"}
+
+
+def test_search_folders_without_targets():
+    assert asyncio.run(search_folders_async([], 5, 10)) == (0, [], {})
+
+
+def test_all_accounts_report_listing_failures(monkeypatch, folder_results):
+    async def list_account_folders_async(account):
+        raise OSError(f"{account.name} is down")
+
+    monkeypatch.setattr(email_server, "accounts", {"work": WORK, "home": HOME})
+    monkeypatch.setattr(email_server, "list_account_folders_async", list_account_folders_async)
+
+    [result] = asyncio.run(handle_call_tool("search-emails", {"account": "*", "folders": "*"}))
+    assert "No emails found in 0 of 0 folders across 2 accounts" in result.text
+    assert "- work: *: could not list folders: work is down" in result.text
+    assert "- home: *: could not list folders: home is down" in result.text
@@ -0,0 +1,138 @@
+import asyncio
+import contextlib
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from email_client import server as email_server
+from email_client.server import SentFolderQueue
+
+
+class Pool:
+    """Leases one fake session and counts the APPENDs made through it."""
+
+    def __init__(self, failures: int = 0):
+        self.session = SimpleNamespace(broken=False)
+        self.failures = failures
+        self.appended: list[bytes] = []
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.session
+
+    async def append(self, account, mail, message):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("connection reset")
+        self.appended.append(message)
+        return "Sent"
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = Pool()
+    monkeypatch.setattr(email_server, "append_to_sent_folder", pool.append)
+    return pool
+
+
+def make_queue(tmp_path, pool, max_attempts=3) -> SentFolderQueue:
+    return SentFolderQueue(SimpleNamespace(imap_pool=pool), str(tmp_path / "outbox"), max_attempts)
+
+
+def spooled(directory) -> list[str]:
+    return sorted(name for name in os.listdir(directory) if name != "failed")
+
+
+def test_enqueue_append_delete(tmp_path, pool):
+    queue = make_queue(tmp_path, pool)
+    entry_id = queue.enqueue(b"Subject: hi\r\n\r\nbody\r\n", "<1@example.com>", "hi")
+    assert spooled(queue.directory) == [f"{entry_id}.eml", f"{entry_id}.json"]
+
+    asyncio.run(queue._process(queue.pending()[0]))
+    assert pool.appended == [b"Subject: hi\r\n\r\nbody\r\n"]
+    assert spooled(queue.directory) == []
+    assert queue.completed[-1]["folder"] == "Sent"
+    assert queue.completed[-1]["verified"] is None
+
+
+def test_failure_backs_off(tmp_path, pool, monkeypatch):
+    monkeypatch.setattr(email_server.time, "time", lambda: 1000.0)
+    pool.failures = 2
+    queue = make_queue(tmp_path, pool)
+    queue.enqueue(b"body", "<1@example.com>", "hi")
+
+    asyncio.run(queue._process(queue.pending()[0]))
+    entry = queue.pending()[0]
+    assert (entry["attempts"], entry["next_attempt"]) == (1, 1000.0 + email_server.SENT_APPEND_RETRY_INTERVAL)
+    assert entry["last_error"] == "connection reset"
+
+    # The delay doubles with each failure
+    asyncio.run(queue._process(entry))
+    entry = queue.pending()[0]
+    assert (entry["attempts"], entry["next_attempt"]) == (2, 1000.0 + 2 * email_server.SENT_APPEND_RETRY_INTERVAL)
+    assert pool.appended == []
+
+
+def test_gives_up_and_retries_failed(tmp_path, pool):
+    pool.failures = 2
+    queue = make_queue(tmp_path, pool, max_attempts=2)
+    entry_id = queue.enqueue(b"body", "<1@example.com>", "hi")
+    for _ in range(2):
+        asyncio.run(queue._process(queue.pending()[0]))
+    assert queue.pending() == []
+    assert [entry["id"] for entry in queue.failed()] == [entry_id]
+    assert spooled(queue.failed_directory) == [f"{entry_id}.eml", f"{entry_id}.json"]
+
+    assert queue.retry_failed() == 1
+    assert queue.failed() == []
+    entry = queue.pending()[0]
+    assert (entry["id"], entry["attempts"], entry["next_attempt"]) == (entry_id, 0, 0)
+    asyncio.run(queue._process(entry))
+    assert pool.appended == [b"body"]
+    assert spooled(queue.directory) == []
+
+
+def test_spooled_entries_are_picked_up_on_restart(tmp_path, pool):
+    make_queue(tmp_path, pool).enqueue(b"left over", "<1@example.com>", "hi")
+
+    async def main():
+        # A new queue on the same directory, as after a restart
+        queue = make_queue(tmp_path, pool)
+        worker = asyncio.create_task(queue.run())
+        try:
+            async with asyncio.timeout(5):
+                while queue.pending():
+                    await asyncio.sleep(0.01)
+        finally:
+            worker.cancel()
+        return queue
+
+    queue = asyncio.run(main())
+    assert pool.appended == [b"left over"]
+    assert spooled(queue.directory) == []
+
+
+@pytest.mark.parametrize("outcome, verified", [
+    (True, True),
+    (False, False),
+    (TimeoutError(), None),
+    (email_server.AsyncIMAPClient.abort("connection lost"), None),
+])
+def test_verification_never_appends_again(tmp_path, pool, monkeypatch, outcome, verified):
+    async def verify_saved_message(mail, mailbox, message_id):
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(email_server, "SENT_APPEND_VERIFY", True)
+    monkeypatch.setattr(email_server, "verify_saved_message", verify_saved_message)
+    queue = make_queue(tmp_path, pool)
+    queue.enqueue(b"body", "<1@example.com>", "hi")
+
+    asyncio.run(queue._process(queue.pending()[0]))
+    assert pool.appended == [b"body"]
+    assert spooled(queue.directory) == []
+    assert queue.completed[-1]["verified"] is verified
+    # A failed check leaves the session to be reconnected
+    assert pool.session.broken is (verified is None)
@@ -0,0 +1,89 @@
+import asyncio
+
+from conftest import FakeIMAPServer
+from email_client.server import IMAPSession, MetadataStore, expand_message_set, sync_folder
+
+CONFIG = {"imap_server": "imap.example.com", "email": "me@example.com", "password": "secret"}
+
+
+def test_expand_message_set():
+    assert expand_message_set("1:3,7") == [1, 2, 3, 7]
+    assert expand_message_set(b"9") == [9]
+    assert expand_message_set(" 4 , 6:5 ") == [4, 6, 5]
+    assert expand_message_set("") == []
+
+
+class Mailbox:
+    """Server side of one folder for the fake IMAP server."""
+
+    def __init__(self):
+        self.flags = {1: "", 2: "", 3: ""}
+        self.uidnext = 4
+        self.modseq = 100
+        self.vanished: list[int] = []
+        self.changed: list[int] = []
+
+    def handle(self, command, args):
+        if command == "STATUS":
+            return [
+                f"* STATUS INBOX (UIDVALIDITY 7 UIDNEXT {self.uidnext} MESSAGES {len(self.flags)} "
+                f"HIGHESTMODSEQ {self.modseq})",
+                "OK STATUS completed",
+            ]
+        if command == "SELECT":
+            return [f"* {len(self.flags)} EXISTS", "* OK [UIDVALIDITY 7] UIDs valid", "OK [READ-WRITE] done"]
+        if args.startswith("SEARCH"):
+            return ["* SEARCH " + " ".join(map(str, self.flags)), "OK SEARCH completed"]
+        if args.startswith("FETCH") and "CHANGEDSINCE" in args:
+            lines = [f"* VANISHED {uid}" for uid in self.vanished]
+            lines += [f"* {uid} FETCH (UID {uid} FLAGS ({self.flags[uid]}))" for uid in self.changed]
+            return lines + ["OK FETCH completed"]
+        if args.startswith("FETCH"):
+            lines = []
+            for seq, uid in enumerate(self.flags, 1):
+                header = f"Subject: Message {uid}\r\nMessage-ID: <{uid}@example.com>\r\n\r\n".encode()
+                lines.append(
+                    b'* %d FETCH (UID %d FLAGS () INTERNALDATE "01-Oct-2026 10:00:00 +0000" RFC822.SIZE 100 '
+                    b'BODY[HEADER.FIELDS (FROM TO SUBJECT DATE MESSAGE-ID IN-REPLY-TO REFERENCES)] {%d}\r\n'
+                    % (seq, uid, len(header)) + header + b")\r\n"
+                )
+            return lines + ["OK FETCH completed"]
+        return ["OK done"]
+
+
+def test_sync_folder_applies_qresync_deltas(tmp_path, connect_to):
+    mailbox = Mailbox()
+    store = MetadataStore(str(tmp_path / "metadata.db"))
+
+    async def main():
+        fake = await FakeIMAPServer(mailbox.handle, capabilities="IMAP4rev1 ENABLE CONDSTORE QRESYNC").start()
+        connect_to(fake)
+        session = IMAPSession(CONFIG)
+        await session.connect()
+        try:
+            assert await sync_folder(session, store, "INBOX") == 3
+            assert store.stored_uids("INBOX") == {1, 2, 3}
+            assert store.get_folder_state("INBOX")["highestmodseq"] == 100
+
+            # Unchanged: a single STATUS
+            fake.commands.clear()
+            assert await sync_folder(session, store, "INBOX") == 0
+            assert [command.split()[0] for command in fake.commands] == ["STATUS"]
+
+            # Message 2 is flagged and message 3 expunged
+            mailbox.flags[2] = "\\Seen"
+            del mailbox.flags[3]
+            mailbox.changed, mailbox.vanished = [2], [3]
+            mailbox.modseq = 105
+            fake.commands.clear()
+            assert await sync_folder(session, store, "INBOX") == 0
+            assert "UID FETCH 1:3 (UID FLAGS) (CHANGEDSINCE 100 VANISHED)" in fake.commands
+            assert store.stored_uids("INBOX") == {1, 2}
+            flags = {row["uid"]: row["flags"] for row in store._execute("SELECT uid, flags FROM messages")}
+            assert flags == {1: "", 2: "\\Seen"}
+            assert store.get_folder_state("INBOX")["highestmodseq"] == 105
+        finally:
+            session.mail.shutdown()
+            await fake.close()
+
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+from email_client.server import ThreadGraph, parse_thread_response
+
+
+def test_thread_response_nested():
+    assert parse_thread_response([b'(2)(3 6 (4 23)(44 7 96))']) == [
+        [(2, 0)],
+        [(3, 0), (6, 1), (4, 2), (23, 3), (44, 2), (7, 3), (96, 4)],
+    ]
+
+
+def test_thread_response_missing_parent():
+    # Siblings under a parent the server could not find share its depth
+    assert parse_thread_response([b'((3)(5))']) == [[(3, 0), (5, 0)]]
+
+
+def test_thread_response_empty():
+    assert parse_thread_response([b'']) == []
+    assert parse_thread_response([]) == []
+
+
+def test_thread_graph_replies():
+    graph = ThreadGraph(1)
+    graph.add(1, "<a@x>", "", "")
+    graph.add(2, "<b@x>", "<a@x>", "<a@x>")
+    graph.add(3, "<c@x>", "<b@x>", "<a@x> <b@x>")
+    graph.add(4, "<d@x>", "", "")
+    assert graph.thread_of(3) == [(1, 0), (2, 1), (3, 2)]
+    assert graph.thread_of(4) == [(4, 0)]
+    assert graph.max_uid == 4
+
+
+def test_thread_graph_reference_loop():
+    # Two messages claiming to reply to each other must not loop forever
+    graph = ThreadGraph(1)
+    graph.add(8, "<loop1@x>", "<loop2@x>", "<loop2@x>")
+    graph.add(9, "<loop2@x>", "<loop1@x>", "<loop1@x>")
+    assert graph.thread_of(8) == [(9, 0), (8, 1)]
+    assert graph.thread_of(9) == [(9, 0), (8, 1)]
+
+
+def test_thread_graph_self_reference():
+    graph = ThreadGraph(1)
+    graph.add(5, "<self@x>", "<self@x>", "<self@x>")
+    assert graph.thread_of(5) == [(5, 0)]
+
+
+def test_thread_graph_duplicate_message_id():
+    graph = ThreadGraph(1)
+    graph.add(7, "<dup@x>", "", "")
+    graph.add(8, "<dup@x>", "", "")
+    assert graph.thread_of(7) == [(7, 0)]
+
+
+def test_thread_graph_missing_parent():
+    # Replies to a message that is not in the folder are siblings at the top
+    graph = ThreadGraph(1)
+    graph.add(10, "<r1@x>", "<gone@x>", "<gone@x>")
+    graph.add(11, "<r2@x>", "<gone@x>", "<gone@x>")
+    assert graph.thread_of(10) == [(10, 0), (11, 0)]
+
+
+def test_thread_graph_orders_siblings_by_earliest_descendant():
+    # <p> is not in the folder; its replies 3 and 9 sort by 3, before sibling 5
+    graph = ThreadGraph(1)
+    graph.add(1, "<root@x>", "", "")
+    graph.add(3, "<m3@x>", "<p@x>", "<root@x> <p@x>")
+    graph.add(5, "<m5@x>", "<root@x>", "<root@x>")
+    graph.add(9, "<m9@x>", "<p@x>", "<root@x> <p@x>")
+    assert graph.thread_of(9) == [(1, 0), (3, 1), (9, 1), (5, 1)]